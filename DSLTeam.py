@@ -1,38 +1,79 @@
 from autogen_core.memory import ListMemory, MemoryContent, MemoryMimeType
-from memory import field_description
+from memory import relevant_field_description
 # from file_path import filter_field_description
-from autogen_agentchat.agents import AssistantAgent, MessageFilterAgent, MessageFilterConfig, PerSourceFilter
+from autogen_agentchat.agents import AssistantAgent, BaseChatAgent, MessageFilterAgent, MessageFilterConfig, PerSourceFilter
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import BaseChatMessage, TextMessage
+from autogen_core import CancellationToken
+from typing import Optional, Sequence
 import json
 from tool import Opendistro_search
 from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
 from autogen_agentchat.teams import RoundRobinGroupChat,SelectorGroupChat
 from autogen_agentchat.ui import Console
-from function import make_combined_json
+from function import make_combined_json, extract_json_string
+from dsl_validator import DSLValidator
 from config import get_model_client, mapping_dir
+from field_catalog import FieldCatalog
 import os
 
-filter_csv = os.path.join(mapping_dir, "filter_field_description.csv")
-print(f"filter_csv: {filter_csv}")
+class StaticKeywordChecker(BaseChatAgent):
+    """
+    Deterministic KeywordChecker: fixes .keyword suffixes and the @timestamp
+    format of the last DSL from `source` with dsl_validator, no LLM call.
+    """
 
-async def get_DSLteam(task, customer_name,mapping,field_list):
+    def __init__(self, name: str = "KeywordChecker", source: str = "MetricsAgent", validator: Optional[DSLValidator] = None):
+        super().__init__(name, description="Check .keyword fields and time format of the generated query")
+        self._source = source
+        self._validator = validator
+        self._last_dsl: Optional[str] = None
+
+    @property
+    def produced_message_types(self) -> Sequence[type[BaseChatMessage]]:
+        return (TextMessage,)
+
+    async def on_messages(self, messages: Sequence[BaseChatMessage], cancellation_token: CancellationToken) -> Response:
+        for msg in messages:
+            if isinstance(msg, TextMessage) and msg.source == self._source:
+                self._last_dsl = msg.content
+        if self._last_dsl is None:
+            return Response(chat_message=TextMessage(content=f"No DSL from {self._source} to check.", source=self.name))
+
+        try:
+            dsl = extract_json_string(self._last_dsl)
+            validator = self._validator or DSLValidator.from_files()
+            report = validator.validate(dsl)
+            content = f"```json\n{json.dumps(report.dsl, ensure_ascii=False, indent=2)}\n```\n{report.summary()}"
+        except Exception as e:
+            content = f"{self._last_dsl}\nKeywordChecker skipped: {e}"
+        return Response(chat_message=TextMessage(content=content, source=self.name))
+
+    async def on_reset(self, cancellation_token: CancellationToken) -> None:
+        self._last_dsl = None
+
+
+async def get_DSLteam(task, customer_name,mapping,field_list, static_checker: bool = True, fields: Optional[FieldCatalog] = None):
+    """
+    static_checker: use dsl_validator instead of the KeywordChecker LLM agent (one model call and the mapping prompt less).
+    fields: brand field view (filter_field_description), None for every field.
+    """
     model_client = get_model_client(temperature=0.0)
 
     #DSLGenerator
     DSLGenerator_mem = ListMemory()
-    field_expl = field_description(filter_csv, ["Field","Explanation","Calculation Method and Data Extraction Method"])
+    # requirement + confirmed field list: the confirmed fields are named verbatim, so they are always kept
+    field_query = f"{task}\n{field_list}"
+    field_expl = relevant_field_description(field_query, fields, ["Field","Explanation","Calculation Method and Data Extraction Method"])
     DSLGenmem = make_combined_json(field_explanation = field_expl, Confirmed_FieldList = field_list)
     await DSLGenerator_mem.add(MemoryContent(content=DSLGenmem, mime_type=MemoryMimeType.JSON))
 
     #MetricsAgent
     MetricsAgent_mem = ListMemory()
-    metrics_hint = field_description(filter_csv, ["Field", "Calculation Method and Data Extraction Method"])
+    metrics_hint = relevant_field_description(field_query, fields, ["Field", "Calculation Method and Data Extraction Method"])
     Metricsmem = make_combined_json(field_explanation = metrics_hint, user_requirement = task)
     await MetricsAgent_mem.add(MemoryContent(content=Metricsmem, mime_type=MemoryMimeType.JSON))
 
-    #KeywordChecker
-    KeywordChecker_mem = ListMemory()
-    # metrics_hint = field_description(field_csv_path, ["Field", "Explanation", "Calculation Method and Data Extraction Method"])
-    await KeywordChecker_mem.add(MemoryContent(content=mapping, mime_type=MemoryMimeType.TEXT))
     #memory end
 
     
@@ -105,35 +146,41 @@ async def get_DSLteam(task, customer_name,mapping,field_list):
     )
 
 
-    KeywordChecker = AssistantAgent(
-        "KeywordChecker",
-        description = "Check the metrics of the generated query",
-        model_client = model_client,
-        tools = [],
-        memory= [KeywordChecker_mem], 
-        system_message = """
-        You are **KeywordChecker** — You ONLY check and fix **.keyword field** and **time format** in DSL queries.
+    # KeywordChecker: dsl_validator, or the LLM agent with the full mapping as memory
+    if static_checker:
+        KeywordChecker_cleaned = StaticKeywordChecker("KeywordChecker", source="MetricsAgent")
+    else:
+        KeywordChecker_mem = ListMemory()
+        await KeywordChecker_mem.add(MemoryContent(content=mapping, mime_type=MemoryMimeType.TEXT))
+        KeywordChecker = AssistantAgent(
+            "KeywordChecker",
+            description = "Check the metrics of the generated query",
+            model_client = model_client,
+            tools = [],
+            memory= [KeywordChecker_mem], 
+            system_message = """
+            You are **KeywordChecker** — You ONLY check and fix **.keyword field** and **time format** in DSL queries.
         
-        You will be provided {memory}:
-            • index_mapping 
-        Your Goal:
-            1.Use index_mapping to check DSL fields and ensure all keyword fields have the ".keyword" suffix.
-            2.fix the format of @timestamp as: yyyy-MM-dd'T'HH:mm:ss, do not modify the time range.
+            You will be provided {memory}:
+                • index_mapping 
+            Your Goal:
+                1.Use index_mapping to check DSL fields and ensure all keyword fields have the ".keyword" suffix.
+                2.fix the format of @timestamp as: yyyy-MM-dd'T'HH:mm:ss, do not modify the time range.
  
-        Output:
-        ```json
-            < valid JSON DSL for Elastic search >
-        ```
-    """
-    )
-    KeywordChecker_cleaned = MessageFilterAgent(
-        name="KeywordChecker",
-        wrapped_agent=KeywordChecker,
-        filter=MessageFilterConfig(per_source = [
-                    PerSourceFilter(source="MetricsAgent", position="last", count=1),
-                    # PerSourceFilter(source="user", position="first", count=1),
-        ]),
-    )
+            Output:
+            ```json
+                < valid JSON DSL for Elastic search >
+            ```
+        """
+        )
+        KeywordChecker_cleaned = MessageFilterAgent(
+            name="KeywordChecker",
+            wrapped_agent=KeywordChecker,
+            filter=MessageFilterConfig(per_source = [
+                        PerSourceFilter(source="MetricsAgent", position="last", count=1),
+                        # PerSourceFilter(source="user", position="first", count=1),
+            ]),
+        )
     
 
     max_msg_termination = MaxMessageTermination(max_messages=4)
@@ -1,13 +1,15 @@
 import json
 import pandas as pd
 import os
-from typing import Dict, List, Any, Set
+from typing import Dict, List, Any, Set, Union
 from langchain_openai import AzureChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.schema import HumanMessage
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
-import chardet
+from llm_cache import get_langchain_cache
+from field_catalog import FieldCatalog, as_catalog
+from field_retrieval import TOP_K_FIELDS, PINNED_FIELDS, select_rows
 
 
 
@@ -27,44 +29,21 @@ class EnhancedElasticsearchQueryGenerator:
             azure_deployment=deployment_name,
             openai_api_key=azure_openai_key,
             openai_api_version=api_version,
-            temperature=0
+            temperature=0,
+            cache=get_langchain_cache()    # temperature 0: repeated prompts come from llm_cache
         )
         
         # Load your field metadata CSV
         self.field_metadata = None
         self.database_schema = None
         self.schema_fields = set()  # Store actual schema field names
+        self.catalog = None
         
-    def load_field_metadata(self, csv_path: str):
-        """Load the CSV containing field names, explanations, and calculation methods with encoding handling"""
-        try:
-            # First try UTF-8
-            self.field_metadata = pd.read_csv(csv_path, encoding='utf-8')
-        except UnicodeDecodeError:
-            try:
-                # Try Windows-1252 encoding (most common for Excel CSV files)
-                self.field_metadata = pd.read_csv(csv_path, encoding='windows-1252')
-            except UnicodeDecodeError:
-                try:
-                    # Try Latin-1 as fallback
-                    self.field_metadata = pd.read_csv(csv_path, encoding='latin-1')
-                except UnicodeDecodeError:
-                    # Auto-detect encoding as last resort
-                    with open(csv_path, 'rb') as f:
-                        result = chardet.detect(f.read())
-                        detected_encoding = result['encoding']
-                    
-                    self.field_metadata = pd.read_csv(csv_path, encoding=detected_encoding)
-        
-        # Clean the data to handle NaN values
-        # Remove rows where 'Field' column is NaN or empty
-        self.field_metadata = self.field_metadata.dropna(subset=['Field'])
-        
-        # Remove rows where Field is empty string or whitespace only
-        self.field_metadata = self.field_metadata[self.field_metadata['Field'].astype(str).str.strip() != '']
-        
-        # Fill NaN values in other columns with empty strings
-        self.field_metadata = self.field_metadata.fillna('')
+    def load_field_metadata(self, csv_path: Union[str, FieldCatalog]):
+        """Load field names, explanations, and calculation methods from a CSV path or a brand field view (see field_catalog)"""
+        self.catalog = as_catalog(csv_path)
+        # Rows without a Field are dropped, NaN values in other columns become empty strings
+        self.field_metadata = self.catalog.fields
         
     def load_database_schema(self, schema_path: str):
         """Load database schema information and extract valid field names"""
@@ -107,60 +86,57 @@ class EnhancedElasticsearchQueryGenerator:
         return fields
     
     def _filter_fields_by_schema(self) -> pd.DataFrame:
-        """Filter CSV fields to only include those that exist in the schema"""
+        """Filter CSV fields to only include those that exist in the schema (case-insensitive, cached per schema)"""
         if self.field_metadata is None:
             return None
             
         if not self.schema_fields:
             return self.field_metadata
         
-        # Check which CSV fields exist in the schema
-        csv_fields = self.field_metadata['Field'].astype(str).str.strip()
-        
-        # Create case-insensitive mapping for schema fields
-        schema_fields_lower = {field.lower(): field for field in self.schema_fields}
-        
-        valid_rows = []
-        
-        for idx, csv_field in csv_fields.items():
-            csv_field_lower = csv_field.lower()
-        
-            # ONLY Direct match and case-insensitive match - NO PARTIAL MATCHING
-            if csv_field in self.schema_fields:
-                valid_rows.append(idx)
-            # Case-insensitive match
-            elif csv_field_lower in schema_fields_lower:
-                valid_rows.append(idx)
-        
-        # Return only rows with valid schema fields
-        filtered_metadata = self.field_metadata.loc[valid_rows].copy()
-        
-        return filtered_metadata
+        # ONLY Direct match and case-insensitive match - NO PARTIAL MATCHING
+        return self._schema_catalog().fields
+    
+    def _schema_catalog(self) -> FieldCatalog:
+        return self.catalog.restrict(self.schema_fields)
+    
+    def _field_context(self, field_metadata: pd.DataFrame, query: str,
+                       k: int = TOP_K_FIELDS, pinned: List[str] = ()) -> str:
+        """Prompt lines for the top-k fields relevant to the query (pinned fields always included)"""
+        relevant = select_rows(field_metadata, query, k=k, pinned=list(pinned) + list(PINNED_FIELDS))
+        field_context_lines = []
+        for _, row in relevant.iterrows():
+            field_name = str(row['Field']) if pd.notna(row['Field']) else "Unknown"
+            explanation = str(row['Explanation']) if pd.notna(row['Explanation']) else "No explanation"
+            method = str(row['Calculation Method and Data Extraction Method']) if pd.notna(row['Calculation Method and Data Extraction Method']) else "No method"
+            field_context_lines.append(f"- {field_name}: {explanation} (Method: {method})")
+        return "\n".join(field_context_lines)
     
     def extract_query_fields(self, natural_language_query: str) -> QueryFields:
         """Step 1: Extract filtering, grouping, and metric fields from natural language"""
+        prompt, parser = self._extract_fields_prompt(natural_language_query)
+        response = self.llm.invoke([HumanMessage(content=prompt)])
+        return self._parse_extracted_fields(response, parser)
+    
+    async def aextract_query_fields(self, natural_language_query: str) -> QueryFields:
+        """Step 1 (async, cancellable)"""
+        prompt, parser = self._extract_fields_prompt(natural_language_query)
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        return self._parse_extracted_fields(response, parser)
+    
+    def _extract_fields_prompt(self, natural_language_query: str):
         
-        # Use only fields that exist in the schema
+        # Use only fields that exist in the schema, pruned to the ones relevant to the query
         valid_field_metadata = self._filter_fields_by_schema()
         
         # Create field context from valid fields only
         field_context = ""
         if valid_field_metadata is not None and len(valid_field_metadata) > 0:
-            field_context_lines = []
-            for _, row in valid_field_metadata.iterrows():
-                field_name = str(row['Field']) if pd.notna(row['Field']) else "Unknown"
-                explanation = str(row['Explanation']) if pd.notna(row['Explanation']) else "No explanation"
-                method = str(row['Calculation Method and Data Extraction Method']) if pd.notna(row['Calculation Method and Data Extraction Method']) else "No method"
-                field_context_lines.append(f"- {field_name}: {explanation} (Method: {method})")
-            field_context = "\n".join(field_context_lines)
+            field_context = self._field_context(valid_field_metadata, natural_language_query, k=2 * TOP_K_FIELDS)
         else:
             field_context = "No valid fields found in schema"
         
         parser = PydanticOutputParser(pydantic_object=QueryFields)
         
-        # Add schema fields to the prompt for better validation
-        schema_field_list = ", ".join(sorted(self.schema_fields)) if self.schema_fields else "No schema provided"
-        
         prompt_template = PromptTemplate(
             template="""You are an expert at analyzing natural language queries and extracting relevant database fields.
 
@@ -195,7 +171,9 @@ CRITICAL: Only use field names that exist in the "Available Fields" list above.
             query=natural_language_query
         )
         
-        response = self.llm.invoke([HumanMessage(content=prompt)])
+        return prompt, parser
+    
+    def _parse_extracted_fields(self, response, parser) -> QueryFields:
         print("##########################################################")
         print(f"Extract_field: {response.usage_metadata}")
         print("##########################################################")
@@ -212,24 +190,16 @@ CRITICAL: Only use field names that exist in the "Available Fields" list above.
         if valid_field_metadata is None or len(valid_field_metadata) == 0:
             return QueryFields(filtering_fields=[], grouping_fields=[], metric_fields=[])
         
-        # Create set of valid field names (case-insensitive)
-        valid_fields_lower = {str(field).lower(): str(field) 
-                             for field in valid_field_metadata['Field'] 
-                             if pd.notna(field)}
+        # Case-insensitive index of valid field names
+        catalog = self._schema_catalog()
         
         def validate_field(field_name: str) -> str:
             """Validate field exists in schema - EXACT MATCH ONLY"""
             if not isinstance(field_name, str):
                 field_name = str(field_name)
         
-            field_lower = field_name.lower().strip()
-    
-            # ONLY Direct match - NO PARTIAL MATCHING
-            if field_lower in valid_fields_lower:
-                return valid_fields_lower[field_lower]
-    
-            # NO PARTIAL MATCHING - remove field if not exact match
-            return None
+            # ONLY Direct match - NO PARTIAL MATCHING, None removes the field
+            return catalog.lookup(field_name)
         
         # Validate all field categories
         validated_filtering = [f for f in [validate_field(field) for field in query_fields.filtering_fields] if f is not None]
@@ -245,6 +215,23 @@ CRITICAL: Only use field names that exist in the "Available Fields" list above.
     def generate_elasticsearch_query(self, query_fields: QueryFields, 
                                    natural_language_query: str) -> Dict[str, Any]:
         """Step 2: Generate Elasticsearch DSL from validated fields"""
+        prompt = self._generate_query_prompt(query_fields, natural_language_query)
+        if isinstance(prompt, dict):
+            return prompt
+        response = self.llm.invoke([HumanMessage(content=prompt)])
+        return self._parse_generated_query(response)
+    
+    async def agenerate_elasticsearch_query(self, query_fields: QueryFields, 
+                                            natural_language_query: str) -> Dict[str, Any]:
+        """Step 2 (async, cancellable)"""
+        prompt = self._generate_query_prompt(query_fields, natural_language_query)
+        if isinstance(prompt, dict):
+            return prompt
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        return self._parse_generated_query(response)
+    
+    def _generate_query_prompt(self, query_fields: QueryFields, natural_language_query: str):
+        """Prompt of step 2, or the error dict when no field survived validation"""
         
         # Double-check that all fields exist in schema
         all_query_fields = (query_fields.filtering_fields + 
@@ -293,17 +280,11 @@ Return ONLY valid JSON for the Elasticsearch query DSL. Do not include any expla
                            "metric_fields", "field_context"]
         )
         
-        # Use only validated fields for field context
+        # Use only validated fields for field context: the chosen fields plus the closest others
         valid_field_metadata = self._filter_fields_by_schema()
         field_context = ""
         if valid_field_metadata is not None:
-            field_context_lines = []
-            for _, row in valid_field_metadata.iterrows():
-                field_name = str(row['Field']) if pd.notna(row['Field']) else "Unknown"
-                explanation = str(row['Explanation']) if pd.notna(row['Explanation']) else "No explanation"
-                method = str(row['Calculation Method and Data Extraction Method']) if pd.notna(row['Calculation Method and Data Extraction Method']) else "No method"
-                field_context_lines.append(f"- {field_name}: {explanation} (Method: {method})")
-            field_context = "\n".join(field_context_lines)
+            field_context = self._field_context(valid_field_metadata, natural_language_query, pinned=all_query_fields)
         
         prompt = prompt_template.format(
             query=natural_language_query,
@@ -313,7 +294,9 @@ Return ONLY valid JSON for the Elasticsearch query DSL. Do not include any expla
             field_context=field_context
         )
         
-        response = self.llm.invoke([HumanMessage(content=prompt)])
+        return prompt
+    
+    def _parse_generated_query(self, response) -> Dict[str, Any]:
         print(f"LLM Response: {response.usage_metadata}")
 
         try:
@@ -337,6 +320,20 @@ Return ONLY valid JSON for the Elasticsearch query DSL. Do not include any expla
         raw_fields = self.extract_query_fields(natural_language_query)
         
         # Step 2: Validate and correct fields against schema
+        validated_fields = self._validate_and_report(raw_fields)
+        
+        # Step 3: Generate Elasticsearch query
+        es_query = self.generate_elasticsearch_query(validated_fields, natural_language_query)
+        return self._query_result(raw_fields, validated_fields, es_query)
+    
+    async def aprocess_query(self, natural_language_query: str) -> Dict[str, Any]:
+        """process_query on the async model calls, so a pending run can be cancelled"""
+        raw_fields = await self.aextract_query_fields(natural_language_query)
+        validated_fields = self._validate_and_report(raw_fields)
+        es_query = await self.agenerate_elasticsearch_query(validated_fields, natural_language_query)
+        return self._query_result(raw_fields, validated_fields, es_query)
+    
+    def _validate_and_report(self, raw_fields: QueryFields) -> QueryFields:
         validated_fields = self.validate_and_correct_fields(raw_fields)
         
         # Output only the chosen fields
@@ -344,50 +341,67 @@ Return ONLY valid JSON for the Elasticsearch query DSL. Do not include any expla
         print(f"  Filtering Fields: {validated_fields.filtering_fields}")
         print(f"  Grouping Fields: {validated_fields.grouping_fields}")
         print(f"  Metric Fields: {validated_fields.metric_fields}")
-        
-        # Step 3: Generate Elasticsearch query
-        es_query = self.generate_elasticsearch_query(validated_fields, natural_language_query)
+        return validated_fields
+    
+    def _query_result(self, raw_fields: QueryFields, validated_fields: QueryFields, es_query: Dict[str, Any]) -> Dict[str, Any]:
+        valid_field_metadata = self._filter_fields_by_schema()
         
         return {
             "raw_fields": raw_fields.model_dump(),
             "validated_fields": validated_fields.model_dump(),
             "elasticsearch_query": es_query,
             "schema_fields_count": len(self.schema_fields),
-            "valid_csv_fields_count": len(self._filter_fields_by_schema()) if self._filter_fields_by_schema() is not None else 0
+            "valid_csv_fields_count": len(valid_field_metadata) if valid_field_metadata is not None else 0
         }
 
 
-def generate_elasticsearch_query_from_natural_language(query: str, mapping_path:str, description_path:str, save_folder: str = ".") -> str:
+def _build_generator(mapping_path: str, description_path: Union[str, FieldCatalog], save_folder: str = ".") -> EnhancedElasticsearchQueryGenerator:
+    """Generator with the field metadata and the mapping loaded"""
+    
+    # Hardcoded configuration
+    AZURE_OPENAI_ENDPOINT = "https://bnk9.openai.azure.com/"
+    AZURE_OPENAI_KEY = "ce8db1ddf4c548eeb72507885186bf4f"
+    DEPLOYMENT_NAME = "gpt-4o"
+
+    CSV_FILE_PATH = description_path if isinstance(description_path, FieldCatalog) else os.path.join(save_folder,description_path)
+    SCHEMA_FILE_PATH = os.path.join(save_folder, mapping_path)
+    
+    # Initialize the generator
+    generator = EnhancedElasticsearchQueryGenerator(
+        azure_openai_endpoint=AZURE_OPENAI_ENDPOINT,
+        azure_openai_key=AZURE_OPENAI_KEY,
+        deployment_name=DEPLOYMENT_NAME
+    )
+    
+    # Load the required files
+    generator.load_field_metadata(CSV_FILE_PATH)
+    generator.load_database_schema(SCHEMA_FILE_PATH)
+    return generator
+
+
+def _generation_error(query: str, e: Exception) -> Dict[str, Any]:
+    # Create error JSON if something goes wrong
+    return {
+        "error": "Failed to generate Elasticsearch query",
+        "message": str(e),
+        "query": query
+    }
+
+
+def generate_elasticsearch_query_from_natural_language(query: str, mapping_path:str, description_path:Union[str, FieldCatalog], save_folder: str = ".") -> str:
     """
     Convert natural language query to Elasticsearch DSL query and save to JSON file.
     
     Args:
         query (str): Natural language query string
+        description_path: field CSV path, or a brand field view (filter_field_description)
         save_folder (str): Folder path to save the JSON file, default is current directory
         
     Returns:
         str: the Elasticsearch query
     """
-    
-    # Hardcoded configuration
-    AZURE_OPENAI_ENDPOINT = "https://bnk9.openai.azure.com/"
-    AZURE_OPENAI_KEY = "ce8db1ddf4c548eeb72507885186bf4f"
-    DEPLOYMENT_NAME = "gpt-4o"
-
-    CSV_FILE_PATH = os.path.join(save_folder,description_path)
-    SCHEMA_FILE_PATH = os.path.join(save_folder, mapping_path)
-    
     try:
-        # Initialize the generator
-        generator = EnhancedElasticsearchQueryGenerator(
-            azure_openai_endpoint=AZURE_OPENAI_ENDPOINT,
-            azure_openai_key=AZURE_OPENAI_KEY,
-            deployment_name=DEPLOYMENT_NAME
-        )
-        
-        # Load the required files
-        generator.load_field_metadata(CSV_FILE_PATH)
-        generator.load_database_schema(SCHEMA_FILE_PATH)
+        generator = _build_generator(mapping_path, description_path, save_folder)
         
         # Process the query
         result = generator.process_query(query)
@@ -396,17 +410,25 @@ def generate_elasticsearch_query_from_natural_language(query: str, mapping_path:
         elasticsearch_query = result["elasticsearch_query"]
         
     except Exception as e:
-        # Create error JSON if something goes wrong
-        elasticsearch_query = {
-            "error": "Failed to generate Elasticsearch query",
-            "message": str(e),
-            "query": query
-        }
+        elasticsearch_query = _generation_error(query, e)
     
     # Return only the elasticsearch_query
     return elasticsearch_query
 
 
+async def agenerate_elasticsearch_query_from_natural_language(query: str, mapping_path:str, description_path:Union[str, FieldCatalog], save_folder: str = ".") -> str:
+    """
+    Async generate_elasticsearch_query_from_natural_language: it can run next to
+    other work and be cancelled (asyncio.CancelledError is not turned into an error JSON).
+    """
+    try:
+        generator = _build_generator(mapping_path, description_path, save_folder)
+        result = await generator.aprocess_query(query)
+        return result["elasticsearch_query"]
+    except Exception as e:
+        return _generation_error(query, e)
+
+
 # Usage example:
 # if __name__ == "__main__":
 #     # Example usage
@@ -1,5 +1,6 @@
 from autogen_core.memory import ListMemory, MemoryContent, MemoryMimeType
-from memory import field_description
+from memory import relevant_field_description
+from field_catalog import FieldCatalog
 # from file_path import filter_field_description
 import re
 from autogen_agentchat.agents import AssistantAgent, MessageFilterAgent, MessageFilterConfig, PerSourceFilter
@@ -17,12 +18,14 @@ async def get_Exeteam(
     task: Optional[str] = None,
     customer_name: Optional[str] = None,
     mapping: Optional[dict] = None,
-    field_list: Optional[list] = None
+    field_list: Optional[list] = None,
+    fields: Optional[FieldCatalog] = None
 ):
     model_client = get_model_client(temperature=0.0)    
     #DSLModifier
     DSLModifier_mem = ListMemory()
-    field_expl = field_description(os.path.join(mapping_dir,"filter_field_description.csv"), ["Field","Explanation","Calculation Method and Data Extraction Method"])
+    # task is the DSL: the fields it names are pinned, plus the closest others for corrections
+    field_expl = relevant_field_description(task or "", fields, ["Field","Explanation","Calculation Method and Data Extraction Method"])
     DSLGenmem = make_combined_json(field_explanation = field_expl)
     await DSLModifier_mem.add(MemoryContent(content=DSLGenmem, mime_type=MemoryMimeType.JSON))
 
@@ -11,13 +11,15 @@ from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermi
 from autogen_core.memory import ListMemory, MemoryContent, MemoryMimeType
 import re
 
-from memory import get_customer, field_description
+from memory import get_customer, relevant_field_description
 import os
 import json
 from function import make_combined_json, filter_field_description
 
-async def get_HistoryMatchTeam(rag_result):
-    field_expl = field_description(os.path.join(mapping_dir, "filter_field_description.csv"), ["Field","Explanation","Calculation Method and Data Extraction Method"])
+async def get_HistoryMatchTeam(rag_result, task = None, fields = None):
+    # task: requirement text, only the fields relevant to it go into the memories
+    # fields: brand field view (filter_field_description), None for every field
+    field_expl = relevant_field_description(task or "", fields, ["Field","Explanation","Calculation Method and Data Extraction Method"])
 
 
     # MatchEvaluatorAgent_mem
@@ -2,16 +2,68 @@ import pandas as pd
 from langchain_chroma import Chroma
 from langchain_openai import AzureOpenAIEmbeddings
 from langchain.docstore.document import Document
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import os
 import json
+from collections import OrderedDict
+import hashlib
 from config import rag_dir, get_embedding
+from llm_cache import LLM_CACHE_ENABLED, get_llm_store
 
 
 # Initialize embedding model
 embeddings = get_embedding()
 
-import shutil
+
+#===================================================================
+# Vector store registry config
+#===================================================================
+QUERY_EMBEDDING_CACHE_SIZE = 512     # in-memory entries, the llm_cache store keeps them across runs
+EMBED_BATCH_SIZE = 64                # documents per embedding request when indexing
+
+# (db_path, collection) -> open Chroma handle, reused across requests
+_vectorstores: Dict[Tuple[str, str], Chroma] = {}
+_query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+
+
+def get_vectorstore(brand: str, db_path: Optional[str] = None, embeddings_functions=embeddings) -> Chroma:
+    """
+    Open (once) the example store of a brand; later calls return the same handle,
+    so SQLite and the HNSW index stay loaded.
+    """
+    brand = brand.lower()
+    db_path = os.path.abspath(db_path or DSLExample_db_path(brand))
+    key = (db_path, brand)
+    if key not in _vectorstores:
+        _vectorstores[key] = Chroma(persist_directory=db_path, embedding_function=embeddings_functions,collection_name=brand,collection_metadata={"hnsw:space": "cosine"})
+    return _vectorstores[key]
+
+
+def close_vectorstore(brand: str, db_path: Optional[str] = None):
+    """Forget the handle of a brand (before its directory is rebuilt)."""
+    brand = brand.lower()
+    _vectorstores.pop((os.path.abspath(db_path or DSLExample_db_path(brand)), brand), None)
+
+
+def embed_query_cached(query: str, embeddings=embeddings) -> List[float]:
+    """Query vector from the LRU / disk cache, one embedding call on a miss."""
+    model = getattr(embeddings, "deployment", None) or getattr(embeddings, "model", "")
+    key = "query-embedding:" + hashlib.sha256(f"{model}\n{query}".encode("utf-8")).hexdigest()
+    vector = _query_embeddings.get(key)
+    if vector is not None:
+        _query_embeddings.move_to_end(key)
+        return vector
+
+    store = get_llm_store() if LLM_CACHE_ENABLED else None
+    vector = store.get(key) if store is not None else None
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        if store is not None:
+            store.set(key, vector)
+    _query_embeddings[key] = vector
+    if len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+        _query_embeddings.popitem(last=False)
+    return vector
 
 
 def DSLExample_db_path(brand) -> str:
@@ -23,73 +75,137 @@ def DSLExample_db_path(brand) -> str:
     elif brand.lower() == "aruba":
         return os.path.join(rag_dir, "ARUBA_Example_ChromaDB")
 
+def DSLExample_json_paths(brand) -> Tuple[str, str]:
+    """
+    (editable examples file, snapshot of what is indexed) of a wifi brand.
+    """
+    if brand.lower() == "huawei":
+        return os.path.join(rag_dir, "DSL_example_HUAWEI_copy.json"), os.path.join(rag_dir, "DSL_example_HUAWEI1.json")
+    elif brand.lower() == "aruba":
+        return os.path.join(rag_dir, "DSL_example_ARUBA_copy.json"), os.path.join(rag_dir, "DSL_example_ARUBA1.json")
+    raise ValueError(f"No DSL examples for brand '{brand}'")
+
+
+def example_document(item: Dict) -> Document:
+    title = item.get("title", "").strip()
+    logic = item.get("logic", "").strip()
+    description = item.get("description", "").strip()
+    dsl = item.get("dsl", {})
+    relevant_fields = item.get("relevant_fields", "")
+    note = item.get("note", "")
+
+    # embeded content（only for semantic similarity）
+
+    # page_content = f"Title: {title}\nDescription: {description}"
+    page_content = f"Title: {title}\nlogic: {logic}"
+
+    # metadata 
+    metadata = {
+        "title": title,
+        "logic": logic,
+        "description": description,
+        "dsl": json.dumps(dsl, ensure_ascii=False),
+        "relevant_fields": relevant_fields,
+        "note": note,
+    }
+    return Document(page_content=page_content, metadata=metadata)
+
+
+def example_id(doc: Document) -> str:
+    """Stable id = hash of what is stored, so an edited example gets a new id and the old one is dropped."""
+    content = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _write_json_atomic(path: str, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _upsert_documents(vectorstore: Chroma, documents: Dict[str, Document], batch_size: int = EMBED_BATCH_SIZE) -> int:
+    ids = list(documents)
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        vectorstore.add_documents([documents[doc_id] for doc_id in batch], ids=batch)
+    return len(ids)
+
+
 def embed_dsl_examples(
     brand: str,
     db_path: Optional[str] = None,
-    embeddings_functions=embeddings  
+    embeddings_functions=embeddings,
+    rebuild: bool = False,
 ) -> Dict[str, str]:
     """
-    Load DSL examples for a brand, embed them, and save into ChromaDB.   
+    Sync the DSL examples of a brand into ChromaDB.
+    Only new or changed examples are embedded (in batches), examples removed from
+    the file are deleted from the index. rebuild=True drops the DB and re-embeds everything.
     """
     db_path = db_path or DSLExample_db_path(brand)
 
     try:
-        if os.path.exists(db_path) and os.listdir(db_path):
-            shutil.rmtree(db_path)
+        if rebuild and os.path.exists(db_path) and os.listdir(db_path):
+            # through the client, not rmtree: chromadb keeps the open system of a path cached
+            get_vectorstore(brand, db_path, embeddings_functions).delete_collection()
+            close_vectorstore(brand, db_path)
             print(f"Existing vector DB at '{db_path}' removed for fresh embedding.")
         
-        if brand.lower() == "huawei":
-            RagDB_tempath = os.path.join(rag_dir, "DSL_example_HUAWEI_copy.json")
-            RagDB_path = os.path.join(rag_dir, "DSL_example_HUAWEI1.json")
-        elif brand.lower() == "aruba":
-            RagDB_tempath = os.path.join(rag_dir, "DSL_example_ARUBA_copy.json")
-            RagDB_path = os.path.join(rag_dir, "DSL_example_ARUBA1.json")
-
-
-
+        RagDB_tempath, RagDB_path = DSLExample_json_paths(brand)
         with open(RagDB_tempath, "r", encoding="utf-8") as f:
             examples = json.load(f)
-        with open(RagDB_path, "w", encoding="utf-8") as f:
-            json.dump(examples, f, ensure_ascii=False, indent=2)
+        _write_json_atomic(RagDB_path, examples)
 
-        # create Document list
-        documents: List[Document] = []
+        # content hash id -> Document (identical examples collapse into one)
+        documents: Dict[str, Document] = {}
         for item in examples:
-            title = item.get("title", "").strip()
-            logic = item.get("logic", "").strip()
-            description = item.get("description", "").strip()
-            dsl = item.get("dsl", {})
-            relevant_fields = item.get("relevant_fields", "")
-            note = item.get("note", "")
-
-            # embeded content（only for semantic similarity）
+            doc = example_document(item)
+            documents[example_id(doc)] = doc
 
-            # page_content = f"Title: {title}\nDescription: {description}"
-            page_content = f"Title: {title}\nlogic: {logic}"
+        vectorstore = get_vectorstore(brand, db_path, embeddings_functions)
+        indexed = set(vectorstore.get(include=[])["ids"])
+        stale = [doc_id for doc_id in indexed if doc_id not in documents]
+        new = {doc_id: doc for doc_id, doc in documents.items() if doc_id not in indexed}
+        if stale:
+            vectorstore.delete(ids=stale)
+        added = _upsert_documents(vectorstore, new)
 
-            # metadata 
-            metadata = {
-                "title": title,
-                "logic": logic,
-                "description": description,
-                "dsl": json.dumps(dsl, ensure_ascii=False),
-                "relevant_fields": relevant_fields,
-                "note": note,
-            }
+        return {"response": f"Indexed {len(documents)} DSL examples successfully ({added} embedded, {len(stale)} removed).", "action": "none"}
 
-            documents.append(Document(page_content=page_content, metadata=metadata))
+    except Exception as e:
+        return {"response": f"Error during embedding: {str(e)}", "action": "error"}
 
-        # create vectorstore
-        vectorstore = Chroma(persist_directory=db_path, embedding_function=embeddings_functions,collection_name=brand,collection_metadata={"hnsw:space": "cosine"})
-        vectorstore.add_documents(documents)
 
-        return {"response": f"Indexed {len(documents)} DSL examples successfully.", "action": "none"}
+def add_dsl_example(
+    brand: str,
+    example: Dict,
+    db_path: Optional[str] = None,
+    embeddings_functions=embeddings,
+) -> Dict[str, str]:
+    """
+    Save one new report to the brand's examples file and index it right away
+    (one embedding call, no rebuild).
+    """
+    try:
+        RagDB_tempath, RagDB_path = DSLExample_json_paths(brand)
+        with open(RagDB_tempath, "r", encoding="utf-8") as f:
+            all_report = json.load(f)
+        all_report.append(example)
+        _write_json_atomic(RagDB_tempath, all_report)
+        _write_json_atomic(RagDB_path, all_report)
+
+        doc = example_document(example)
+        doc_id = example_id(doc)
+        vectorstore = get_vectorstore(brand, db_path, embeddings_functions)
+        if not vectorstore.get(ids=[doc_id], include=[])["ids"]:
+            _upsert_documents(vectorstore, {doc_id: doc})
+        return {"response": f"Saved and indexed example '{doc.metadata['title']}'.", "action": "none"}
 
     except Exception as e:
-        return {"response": f"Error during embedding: {str(e)}", "action": "error"}
+        return {"response": f"Error during saving: {str(e)}", "action": "error"}
     
 
-from typing import Tuple
 def query_dsl_examples(
     query: str,
     brand:str,
@@ -101,18 +217,16 @@ def query_dsl_examples(
     Search DSL examples in a ChromaDB vector store by semantic similarity.
 
     - Uses the specified `brand` (e.g., huawei, aruba) to locate the correct DB.
-    - Retrieves the top_k most relevant examples via cosine distance.
+    - Retrieves the top_k most relevant examples via cosine distance
+      (one search on the shared store handle, the query vector comes from embed_query_cached).
     - Converts distance → similarity score (0–1, higher means more similar).
     - Each result includes: "title", "logic", "dsl", and "score".
     - Returns results as a JSON-formatted string, sorted by similarity (descending).
     
     """
-    brand = brand.lower()
-    db_path = db_path or DSLExample_db_path(brand=brand)
-    vectorstore = Chroma(persist_directory=db_path, embedding_function=embeddings,collection_name=brand,collection_metadata={"hnsw:space": "cosine"})
-    results = vectorstore.similarity_search_with_score(query, k=top_k)
-    
-    results: List[Tuple[Document, float]] = vectorstore.similarity_search_with_score(query, k=top_k)
+    vectorstore = get_vectorstore(brand, db_path, embeddings)
+    query_vector = embed_query_cached(query, embeddings)
+    results: List[Tuple[Document, float]] = vectorstore.similarity_search_by_vector_with_relevance_scores(query_vector, k=top_k)
 
     out: List[Dict] = []
     for doc, distance in results:
@@ -0,0 +1,122 @@
+"""
+Columnar flattener for OpenSearch aggregation results.
+
+Same output as tool.agg_json_to_rows (kept as the reference implementation),
+without building one dict per row:
+- the walk keeps the current bucket path on a stack (push/pop, no path.copy())
+- a bucket's key and metrics are recorded once as a span (start_row, end_row, value)
+  that is shared by every leaf row below it
+- spans are written into one NumPy buffer per column at the end
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: only needed for as_arrow=True
+    pa = None
+
+
+class _ColumnBuffers:
+    def __init__(self):
+        self.n_rows = 0
+        # column -> [(start, end, value)], in post-order (children before parents)
+        self.spans: Dict[str, List[Tuple[int, int, Any]]] = {}
+        # column -> (first row, expanded, depth, position in its bucket): first-appearance order of the rows
+        self.order: Dict[str, Tuple[int, bool, int, int]] = {}
+
+    def add_span(self, column: str, start: int, end: int, value: Any, depth: int, position: int, expanded: bool = False):
+        self.spans.setdefault(column, []).append((start, end, value))
+        # pd.json_normalize moves columns expanded from dict values to the end of the row
+        rank = (start, expanded, depth, position)
+        if column not in self.order or rank < self.order[column]:
+            self.order[column] = rank
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {}
+        for column in sorted(self.order, key=self.order.get):
+            buffer = np.empty(self.n_rows, dtype=object)
+            buffer[:] = np.nan
+            # parents were recorded after their children: apply them first so deeper levels win
+            for start, end, value in reversed(self.spans[column]):
+                buffer[start:end] = value
+            arrays[column] = buffer
+        return arrays
+
+
+def _push(stack: List[Tuple[str, Any, bool]], column: str, value: Any, expanded: bool = False):
+    """Push a cell; dict values (composite keys) become "column.sub" cells like pd.json_normalize."""
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _push(stack, f"{column}.{k}", v, True)
+    else:
+        stack.append((column, value, expanded))
+
+
+def _walk(node: Dict, stack: List[Tuple[str, Any, bool]], buffers: _ColumnBuffers, depth: int):
+    for agg_name, agg_val in node.items():
+        if isinstance(agg_val, dict) and "buckets" in agg_val:
+            for bucket in agg_val["buckets"]:
+                start = buffers.n_rows
+                mark = len(stack)
+                _push(stack, f"{agg_name}_key", bucket.get("key_as_string", bucket.get("key")))
+                for k, v in bucket.items():
+                    if isinstance(v, dict) and "value" in v:
+                        _push(stack, f"{agg_name}_{k}", v["value"])
+
+                has_sub = False
+                for k, v in bucket.items():
+                    if isinstance(v, dict) and "buckets" in v:
+                        has_sub = True
+                        _walk({k: v}, stack, buffers, depth + 1)
+                if not has_sub:
+                    buffers.n_rows += 1
+
+                end = buffers.n_rows
+                if end > start:
+                    for position, (column, value, expanded) in enumerate(stack[mark:]):
+                        buffers.add_span(column, start, end, value, depth, position, expanded)
+                del stack[mark:]
+
+        elif isinstance(agg_val, dict) and "value" in agg_val and depth == 0:
+            row = buffers.n_rows
+            for position, (column, value, expanded) in enumerate(stack):
+                buffers.add_span(column, row, row + 1, value, depth, position, expanded)
+            buffers.add_span(f"{agg_name}_value", row, row + 1, agg_val["value"], depth, len(stack))
+            buffers.n_rows += 1
+
+
+def agg_to_frame(data: Dict) -> pd.DataFrame:
+    """Flatten a parsed OpenSearch response into a DataFrame."""
+    buffers = _ColumnBuffers()
+    _walk(data.get("aggregations", {}), [], buffers, 0)
+    if not buffers.n_rows:
+        return pd.DataFrame()
+    return pd.DataFrame(buffers.to_arrays()).infer_objects()
+
+
+def agg_to_table(data: Dict) -> "pa.Table":
+    """Flatten a parsed OpenSearch response into a pyarrow Table."""
+    if pa is None:
+        raise ImportError("pyarrow is required for agg_to_table")
+    buffers = _ColumnBuffers()
+    _walk(data.get("aggregations", {}), [], buffers, 0)
+    columns = {}
+    for column, buffer in buffers.to_arrays().items():
+        try:
+            columns[column] = pa.array(buffer, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # mixed key types (e.g. numbers and strings): keep them as text
+            columns[column] = pa.array([None if v is np.nan else str(v) for v in buffer])
+    return pa.table(columns)
+
+
+def agg_json_to_table(json_path: str | Path, as_arrow: bool = False):
+    """Read a saved OpenSearch response and flatten it (DataFrame, or pyarrow Table with as_arrow)."""
+    with open(json_path, encoding="utf-8") as f:
+        data = json.load(f)
+    return agg_to_table(data) if as_arrow else agg_to_frame(data)
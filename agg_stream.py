@@ -0,0 +1,352 @@
+"""
+Streaming version of tool._walk_agg.
+
+The response body is parsed incrementally (ijson events) and rows are emitted
+to a sink as soon as a top-level bucket is complete, so the whole document and
+its pretty-printed copy are never held in memory. Rows are identical to
+tool.agg_json_to_rows.
+"""
+import csv
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import ijson
+except ImportError:  # optional: without ijson the body is parsed once at close()
+    ijson = None
+
+CHUNK_SIZE = 64 * 1024
+
+Event = Tuple[str, Any]
+
+
+# ---------- ① event consumers (generator coroutines, one event per send) ------
+def _skip_value(event: str, value: Any):
+    depth = 1 if event in ("start_map", "start_array") else 0
+    while depth:
+        event, value = yield
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+
+
+def _read_value(event: str, value: Any):
+    if event == "start_map":
+        obj = {}
+        while True:
+            event, value = yield
+            if event == "end_map":
+                return obj
+            key = value
+            event, value = yield
+            obj[key] = yield from _read_value(event, value)
+    if event == "start_array":
+        arr = []
+        while True:
+            event, value = yield
+            if event == "end_array":
+                return arr
+            arr.append((yield from _read_value(event, value)))
+    return value
+
+
+def _buckets(agg_name: str, on_rows: Callable[[List[Dict]], None]):
+    """Consume a "buckets" array (start_array already read), pass each bucket's rows on."""
+    while True:
+        event, value = yield
+        if event == "end_array":
+            return
+        if event == "start_map":
+            on_rows((yield from _bucket(agg_name)))
+        else:
+            yield from _skip_value(event, value)
+
+
+def _bucket(agg_name: str):
+    """Consume one bucket (start_map already read) and return its rows."""
+    key = None
+    key_as_string = None
+    has_key_as_string = False
+    metrics: List[Tuple[str, Any]] = []
+    child_rows: List[Dict] = []
+    has_sub = False
+
+    while True:
+        event, value = yield
+        if event == "end_map":
+            break
+        name = value
+        event, value = yield
+        if name == "key":
+            key = yield from _read_value(event, value)
+        elif name == "key_as_string":
+            key_as_string = yield from _read_value(event, value)
+            has_key_as_string = True
+        elif event == "start_map":
+            kind, payload = yield from _sub_agg(name)
+            if kind == "buckets":
+                has_sub = True
+                child_rows.extend(payload)
+            elif kind == "value":
+                metrics.append((f"{agg_name}_{name}", payload))
+        else:
+            yield from _skip_value(event, value)
+
+    prefix = {f"{agg_name}_key": key_as_string if has_key_as_string else key}
+    prefix.update(metrics)
+    if not has_sub:
+        return [prefix]
+    return [{**prefix, **row} for row in child_rows]
+
+
+def _sub_agg(agg_name: str):
+    """
+    Consume an aggregation object (start_map already read).
+    Return ("buckets", rows) for bucket aggs, ("value", v) for metrics, (None, None) otherwise.
+    """
+    rows: List[Dict] = []
+    has_buckets = False
+    has_value = False
+    metric_value = None
+
+    while True:
+        event, value = yield
+        if event == "end_map":
+            break
+        name = value
+        event, value = yield
+        if name == "buckets" and event == "start_array":
+            has_buckets = True
+            yield from _buckets(agg_name, rows.extend)
+        elif name == "value":
+            has_value = True
+            metric_value = yield from _read_value(event, value)
+        else:
+            yield from _skip_value(event, value)
+
+    if has_buckets:
+        return "buckets", rows
+    if has_value:
+        return "value", metric_value
+    return None, None
+
+
+def _aggregations(emit: Callable[[Dict], None]):
+    """Consume the top-level "aggregations" object (start_map already read)."""
+    def emit_rows(rows: List[Dict]):
+        for row in rows:
+            emit(row)
+
+    while True:
+        event, value = yield
+        if event == "end_map":
+            return
+        agg_name = value
+        event, value = yield
+        if event != "start_map":
+            yield from _skip_value(event, value)
+            continue
+
+        has_buckets = False
+        has_value = False
+        metric_value = None
+        while True:
+            event, value = yield
+            if event == "end_map":
+                break
+            name = value
+            event, value = yield
+            if name == "buckets" and event == "start_array":
+                has_buckets = True
+                yield from _buckets(agg_name, emit_rows)     # rows leave per top-level bucket
+            elif name == "value":
+                has_value = True
+                metric_value = yield from _read_value(event, value)
+            else:
+                yield from _skip_value(event, value)
+        if not has_buckets and has_value:
+            emit({f"{agg_name}_value": metric_value})
+
+
+def _document(emit: Callable[[Dict], None]):
+    event, value = yield
+    if event != "start_map":
+        yield from _skip_value(event, value)
+        return
+    while True:
+        event, value = yield
+        if event == "end_map":
+            return
+        name = value
+        event, value = yield
+        if name == "aggregations" and event == "start_map":
+            yield from _aggregations(emit)
+        else:
+            yield from _skip_value(event, value)
+
+
+def _iter_events(obj: Any) -> Iterator[Event]:
+    """ijson-like events of an already parsed object (fallback path)."""
+    if isinstance(obj, dict):
+        yield "start_map", None
+        for k, v in obj.items():
+            yield "map_key", k
+            yield from _iter_events(v)
+        yield "end_map", None
+    elif isinstance(obj, list):
+        yield "start_array", None
+        for item in obj:
+            yield from _iter_events(item)
+        yield "end_array", None
+    else:
+        yield "value", obj
+
+
+# ---------- ② push parser ------------------------------------------------------
+class AggRowParser:
+    """
+    Push parser: feed() raw body chunks, rows go to sink.write() as they complete.
+
+        parser = AggRowParser(sink)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+    """
+
+    def __init__(self, sink: "RowSink"):
+        self.sink = sink
+        self.row_count = 0
+        self._done = False
+        self._consumer = _document(self._emit)
+        next(self._consumer)
+        if ijson is not None:
+            self._events = ijson.sendable_list()
+            self._coro = ijson.basic_parse_coro(self._events, use_float=True)
+        else:
+            self._chunks: List[bytes] = []
+
+    def _emit(self, row: Dict):
+        self.row_count += 1
+        self.sink.write(row)
+
+    def _dispatch(self, events: Iterable[Event]):
+        for event in events:
+            if self._done:
+                return
+            try:
+                self._consumer.send(event)
+            except StopIteration:
+                self._done = True
+
+    def feed(self, chunk: bytes):
+        if ijson is None:
+            self._chunks.append(chunk)
+            return
+        self._coro.send(chunk)
+        self._dispatch(self._events)
+        del self._events[:]
+
+    def close(self) -> int:
+        """Finish parsing; return the number of rows emitted."""
+        if ijson is None:
+            self._dispatch(_iter_events(json.loads(b"".join(self._chunks))))
+            self._chunks = []
+        else:
+            self._coro.close()
+            self._dispatch(self._events)
+            del self._events[:]
+        return self.row_count
+
+
+# ---------- ③ tabular sinks ----------------------------------------------------
+def _flatten_row(row: Dict, parent_key: str = "") -> Dict:
+    """Same column naming as pd.json_normalize (composite keys become "agg_key.source")."""
+    items = {}
+    nested = {}
+    for k, v in row.items():
+        full_key = f"{parent_key}.{k}" if parent_key else k
+        if isinstance(v, dict):
+            nested.update(_flatten_row(v, full_key))
+        else:
+            items[full_key] = v
+    items.update(nested)    # like json_normalize, expanded columns go last
+    return items
+
+
+class RowSink:
+    """Receives flattened rows; close() finalizes the output."""
+
+    def write(self, row: Dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DataFrameSink(RowSink):
+    """Collect rows into a DataFrame (same result as agg_json_to_rows)."""
+
+    def __init__(self):
+        self.rows: List[Dict] = []
+        self.frame: Optional[pd.DataFrame] = None
+
+    def write(self, row: Dict):
+        self.rows.append(row)
+
+    def close(self) -> pd.DataFrame:
+        self.frame = pd.json_normalize(self.rows) if self.rows else pd.DataFrame()
+        self.rows = []
+        return self.frame
+
+
+class CsvSink(RowSink):
+    """
+    Write rows to a CSV file with constant memory.
+    Rows are spooled as JSON lines first because later buckets may add columns;
+    the header is known at close().
+    """
+
+    def __init__(self, csv_path: str | Path):
+        self.csv_path = str(csv_path)
+        self.columns: Dict[str, None] = {}
+        Path(self.csv_path).parent.mkdir(parents=True, exist_ok=True)
+        fd, self._spool_path = tempfile.mkstemp(suffix=".jsonl", dir=os.path.dirname(os.path.abspath(self.csv_path)))
+        self._spool = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, row: Dict):
+        flat = _flatten_row(row)
+        self.columns.update(dict.fromkeys(flat))
+        self._spool.write(json.dumps(flat, ensure_ascii=False, default=str) + "\n")
+
+    def close(self) -> str:
+        self._spool.close()
+        try:
+            with open(self._spool_path, "r", encoding="utf-8") as src, \
+                    open(self.csv_path, "w", encoding="utf-8", newline="") as dst:
+                writer = csv.DictWriter(dst, fieldnames=list(self.columns))
+                writer.writeheader()
+                for line in src:
+                    writer.writerow(json.loads(line))
+        finally:
+            os.remove(self._spool_path)
+        return self.csv_path
+
+
+# ---------- ④ entrances --------------------------------------------------------
+def stream_agg_file(json_path: str | Path, sink: RowSink, chunk_size: int = CHUNK_SIZE):
+    """Flatten a saved OpenSearch response file into sink without loading it whole."""
+    parser = AggRowParser(sink)
+    with open(json_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    parser.close()
+    return sink.close()
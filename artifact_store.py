@@ -0,0 +1,232 @@
+"""
+Session artifact store: every Streamlit session, service job or pipeline run
+writes into its own namespace instead of fixed files in result/ and team_state/.
+
+    ns = artifact_store.namespace(session_id)   # result/sessions/<id>/, team_state/sessions/<id>/
+    ns.path("DSLQuery.json")                    # result file of this session
+    ns.state_path("Req_state.json")             # team state of this session
+    ns.write_json("DSLQuery.json", dsl)         # atomic: temp file + os.replace
+
+    with use_namespace(ns):                     # tools such as Opendistro_search write into ns
+        ...
+    result_path("result.json")                  # active namespace, result_dir outside of one
+    mapping_path("flattened_mapping.json")      # the namespace's copy, mapping_dir outside of one
+
+Namespaces untouched for ARTIFACT_TTL are removed by gc(), which runs at most
+every GC_INTERVAL when a namespace is opened; namespaces in use in this
+process are never collected.
+"""
+import contextvars
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from config import mapping_dir, result_dir, team_state_dir
+
+#===================================================================
+# Artifact store config
+#===================================================================
+ARTIFACT_TTL = int(os.environ.get("ARTIFACT_TTL", str(24 * 3600)))     # seconds since last use
+GC_INTERVAL = 600
+SESSION_RESULT_DIR = os.path.join(result_dir, "sessions")
+SESSION_STATE_DIR = os.path.join(team_state_dir, "sessions")
+LAST_USED = ".last_used"
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def atomic_write(path: str, data: Union[str, bytes]):
+    """Write through a temp file in the same directory, readers never see a partial file."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    mode = "wb" if isinstance(data, bytes) else "w"
+    try:
+        with open(tmp_path, mode, **({} if isinstance(data, bytes) else {"encoding": "utf-8"})) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_json(path: str, data: Any, **kwargs):
+    kwargs = {"ensure_ascii": False, "indent": 2, "default": str, **kwargs}
+    atomic_write(path, json.dumps(data, **kwargs))
+
+
+class Namespace:
+    def __init__(self, name: str, result_root: str, state_root: str):
+        self.name = name
+        self.result_root = result_root
+        self.state_root = state_root
+
+    def touch(self):
+        """Mark the namespace as used now (resets its TTL)."""
+        os.makedirs(self.result_root, exist_ok=True)
+        marker = os.path.join(self.result_root, LAST_USED)
+        with open(marker, "a"):
+            pass
+        os.utime(marker)
+
+    @staticmethod
+    def _file(root: str, filename: str) -> str:
+        filename = os.path.basename(str(filename))      # names may come from an agent's tool call
+        if not filename or filename in (".", ".."):
+            raise ValueError(f"invalid artifact name '{filename}'")
+        os.makedirs(root, exist_ok=True)
+        return os.path.join(root, filename)
+
+    def path(self, filename: str) -> str:
+        return self._file(self.result_root, filename)
+
+    def state_path(self, filename: str) -> str:
+        return self._file(self.state_root, filename)
+
+    def write(self, filename: str, data: Union[str, bytes], state: bool = False) -> str:
+        path = self.state_path(filename) if state else self.path(filename)
+        atomic_write(path, data)
+        return path
+
+    def write_json(self, filename: str, data: Any, state: bool = False, **kwargs) -> str:
+        path = self.state_path(filename) if state else self.path(filename)
+        atomic_write_json(path, data, **kwargs)
+        return path
+
+    def last_used(self) -> float:
+        for path in (os.path.join(self.result_root, LAST_USED), self.result_root, self.state_root):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                continue
+        return 0.0
+
+    def remove(self):
+        shutil.rmtree(self.result_root, ignore_errors=True)
+        shutil.rmtree(self.state_root, ignore_errors=True)
+
+
+class ArtifactStore:
+    def __init__(self, result_root: str = SESSION_RESULT_DIR, state_root: str = SESSION_STATE_DIR,
+                 ttl: int = ARTIFACT_TTL, gc_interval: int = GC_INTERVAL):
+        self.result_root = result_root
+        self.state_root = state_root
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = {}
+        self._last_gc = 0.0
+
+    def namespace(self, name: Optional[str] = None) -> Namespace:
+        """Namespace of a session / job id (a new id when None), marked as used."""
+        name = name or uuid.uuid4().hex
+        if not _NAME_RE.match(name):
+            raise ValueError(f"invalid namespace '{name}'")
+        ns = Namespace(name, os.path.join(self.result_root, name), os.path.join(self.state_root, name))
+        ns.touch()
+        self.maybe_gc()
+        return ns
+
+    def names(self) -> List[str]:
+        names = set()
+        for root in (self.result_root, self.state_root):
+            if os.path.isdir(root):
+                names.update(n for n in os.listdir(root) if _NAME_RE.match(n))
+        return sorted(names)
+
+    def acquire(self, ns: Namespace):
+        with self._lock:
+            self._active[ns.name] = self._active.get(ns.name, 0) + 1
+        ns.touch()
+
+    def release(self, ns: Namespace):
+        with self._lock:
+            count = self._active.get(ns.name, 0) - 1
+            if count > 0:
+                self._active[ns.name] = count
+            else:
+                self._active.pop(ns.name, None)
+        ns.touch()
+
+    def gc(self, ttl: Optional[int] = None, now: Optional[float] = None) -> List[str]:
+        """Remove namespaces not used for ttl seconds; return their names."""
+        ttl = self.ttl if ttl is None else ttl
+        cutoff = (now or time.time()) - ttl
+        removed = []
+        for name in self.names():
+            with self._lock:
+                if name in self._active:
+                    continue
+            ns = Namespace(name, os.path.join(self.result_root, name), os.path.join(self.state_root, name))
+            if ns.last_used() < cutoff:
+                ns.remove()
+                removed.append(name)
+        return removed
+
+    def maybe_gc(self):
+        now = time.time()
+        if now - self._last_gc < self.gc_interval:
+            return
+        self._last_gc = now
+        try:
+            self.gc(now=now)
+        except OSError as e:
+            print(f"[artifact_store] gc failed: {e}")
+
+
+artifact_store = ArtifactStore()
+
+_current: "contextvars.ContextVar[Optional[Namespace]]" = contextvars.ContextVar("artifact_namespace", default=None)
+
+
+def current_namespace() -> Optional[Namespace]:
+    return _current.get()
+
+
+def enter_namespace(ns: Namespace) -> contextvars.Token:
+    """Make ns the active namespace of this task (and the tasks it starts) and keep it from gc."""
+    artifact_store.acquire(ns)
+    return _current.set(ns)
+
+
+def exit_namespace(token: contextvars.Token):
+    ns = _current.get()
+    _current.reset(token)
+    if ns is not None:
+        artifact_store.release(ns)
+
+
+@contextmanager
+def use_namespace(ns: Namespace) -> Iterator[Namespace]:
+    token = enter_namespace(ns)
+    try:
+        yield ns
+    finally:
+        exit_namespace(token)
+
+
+def result_path(filename: str) -> str:
+    """Where a tool writes a result file: the active namespace, result_dir outside of one."""
+    ns = current_namespace()
+    return ns.path(filename) if ns is not None else os.path.join(result_dir, os.path.basename(filename))
+
+
+def team_state_path(filename: str) -> str:
+    ns = current_namespace()
+    return ns.state_path(filename) if ns is not None else os.path.join(team_state_dir, os.path.basename(filename))
+
+
+def mapping_path(filename: str) -> str:
+    """
+    Customer mapping file (flattened_mapping.json, raw_mapping.json) of the active
+    namespace, mapping_dir outside of one. Inside a namespace there is no fallback
+    to mapping_dir, which holds whichever customer was fetched last: the path is
+    returned even before get_flattened_mapping wrote it, and reading it fails.
+    """
+    ns = current_namespace()
+    return ns.path(filename) if ns is not None else os.path.join(mapping_dir, os.path.basename(filename))
@@ -0,0 +1,240 @@
+"""
+Batch report generation: finalized requirements in, one report per item out.
+
+    python batch.py requirements.jsonl --workers 4
+    python batch.py weekly_clients.json --customers HKJC,CafeDeCoral --mode thinking
+
+The input is a .jsonl file (one requirement per line) or a .json file (one
+requirement or a list), each in the RequirementsFinalizer format:
+
+    {"customer": "HKJC", "summary": "...", "mentioned_metrics": [...], ...}
+
+An item may also be {"id": ..., "customer_name": ..., "requirement": {...}}.
+--customers runs every requirement once per listed customer. Customer names
+are resolved with customer_directory up front (an unknown one stops the batch
+before anything runs) and items use the canonical name.
+
+Items skip the Req chat and go through pipeline.py (cache/history, DSL,
+execute, export) on a bounded worker pool. All items share one process, so the
+LLM cache, model connection pools, field catalogs, mapping text and keyword
+cache are reused across them. Each item writes to <out>/<item id>/ and the run
+ends with <out>/summary.json (status, latency and token usage per item).
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import result_dir
+from customer_directory import customer_directory
+from es_client import aclose_es_client
+from keyword_cache import keyword_cache
+from llm_cache import llm_cache_stats
+from mapping_cache import mapping_cache
+from model_registry import aclose_model_clients
+from pipeline import PipelineInput, report_pipeline
+
+#===================================================================
+# Batch config
+#===================================================================
+BATCH_WORKERS = 4
+BATCH_OUTPUT_DIR = os.path.join(result_dir, "batch")
+
+
+@dataclass
+class BatchItem:
+    item_id: str
+    customer_name: str
+    requirement: Dict[str, Any]
+
+
+@dataclass
+class BatchResult:
+    item_id: str
+    customer_name: str
+    status: str                         # "completed" | "failed"
+    latency: float
+    report_path: Optional[str] = None
+    dsl_source: Optional[str] = None
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", str(text)).strip("_") or "item"
+
+
+def load_items(path: str, customers: Optional[Sequence[str]] = None) -> List[BatchItem]:
+    """
+    Read the requirement file; with customers, every requirement is repeated per customer.
+    Raise ValueError when an item has no customer or one customer_directory does not know.
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if path.endswith(".jsonl"):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = json.load(f)
+            records = records if isinstance(records, list) else [records]
+
+    items: List[BatchItem] = []
+    used_ids = set()
+    unknown = []
+    for i, record in enumerate(records, 1):
+        requirement = record.get("requirement", record)
+        base_id = record.get("id") or f"{i:03d}"
+        for customer in customers or [record.get("customer_name") or requirement.get("customer", "")]:
+            if not customer:
+                raise ValueError(f"item {base_id} has no customer, add \"customer\" or use --customers")
+            entry = customer_directory.resolve(customer)
+            if entry is None:
+                unknown.append(f"{base_id}: {customer}")
+                continue
+            item_id = _slug(f"{base_id}-{entry.name}")
+            n = 1
+            while item_id in used_ids:         # repeated ids must not share an output directory
+                n += 1
+                item_id = _slug(f"{base_id}-{entry.name}-{n}")
+            used_ids.add(item_id)
+            items.append(BatchItem(item_id=item_id, customer_name=entry.name,
+                                   requirement={**requirement, "customer": entry.name}))
+    if unknown:
+        raise ValueError(f"unknown customers: {', '.join(unknown)}")
+    return items
+
+
+async def run_item(item: BatchItem, mode: str, history_check: bool, output_dir: str) -> BatchResult:
+    inputs = PipelineInput(
+        customer_name=item.customer_name,
+        requirement=item.requirement,
+        mode=mode,
+        history_check=history_check,
+        speculative=True,
+        output_dir=os.path.join(output_dir, item.item_id),
+    )
+    start = time.perf_counter()
+    try:
+        run = await report_pipeline(inputs).run(inputs)
+    except Exception as e:
+        return BatchResult(item.item_id, item.customer_name, "failed", time.perf_counter() - start, error=str(e))
+
+    export = run.output("export")
+    dsl = run.output("dsl")
+    return BatchResult(
+        item_id=item.item_id,
+        customer_name=item.customer_name,
+        status="completed" if export is not None else "failed",
+        latency=time.perf_counter() - start,
+        report_path=export.report_path if export is not None else None,
+        dsl_source=dsl.source if dsl is not None else None,
+        error="; ".join(f"{stage}: {error}" for stage, error in run.errors.items()) or None,
+        timings={stage: round(seconds, 3) for stage, seconds in run.timings.items()},
+        usage=dict(run.usage),
+    )
+
+
+async def warm_up_customer(customer_name: str) -> int:
+    """Fetch the customer's mapping, then load its keyword fields with one _msearch (best effort)."""
+    try:
+        entry = await mapping_cache.get(customer_name)
+    except Exception as e:
+        print(f"[batch] mapping of {customer_name} not loaded: {e}")
+        return 0
+    fields = [name for name, field_type in entry["flattened"].items() if field_type == "keyword"]
+    return await keyword_cache.warm_up(customer_name, fields=fields)
+
+
+async def run_batch(
+    items: Sequence[BatchItem],
+    workers: int = BATCH_WORKERS,
+    mode: str = "fast",
+    history_check: bool = False,
+    output_dir: str = BATCH_OUTPUT_DIR,
+) -> List[BatchResult]:
+    """Run the items on `workers` concurrent pipelines, results in input order."""
+    os.makedirs(output_dir, exist_ok=True)
+    # mapping + one _msearch per customer up front, every item of that customer then hits both caches
+    await asyncio.gather(*(warm_up_customer(c) for c in {item.customer_name for item in items}))
+
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(len(items)):
+        queue.put_nowait(i)
+    results: List[Optional[BatchResult]] = [None] * len(items)
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            results[i] = await run_item(items[i], mode, history_check, output_dir)
+            r = results[i]
+            print(f"[{r.status}] {r.item_id} {r.latency:.1f}s {r.error or r.report_path}")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(workers, len(items))))))
+    return results
+
+
+def summarize(results: Sequence[BatchResult], wall_time: float) -> Dict[str, Any]:
+    latencies = sorted(r.latency for r in results)
+    prompt_tokens = sum(r.usage.get("prompt_tokens", 0) for r in results)
+    completion_tokens = sum(r.usage.get("completion_tokens", 0) for r in results)
+    stages: Dict[str, List[float]] = {}
+    for r in results:
+        for stage, seconds in r.timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "items": len(results),
+        "completed": sum(r.status == "completed" for r in results),
+        "failed": sum(r.status != "completed" for r in results),
+        "wall_time": round(wall_time, 3),
+        "latency": {
+            "mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+            "p50": round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+            "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else 0.0,
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+        "stage_mean": {stage: round(statistics.mean(v), 3) for stage, v in stages.items()},
+        "tokens": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+        "llm_cache": llm_cache_stats.as_dict(),
+        "results": [asdict(r) for r in results],
+    }
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate reports for a file of finalized requirements.")
+    parser.add_argument("requirements", help=".jsonl or .json file of RequirementsFinalizer JSONs")
+    parser.add_argument("--customers", type=str, default=None, help="comma separated, run every requirement per customer")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help=f"concurrent items (default: {BATCH_WORKERS})")
+    parser.add_argument("--mode", choices=["fast", "thinking"], default="fast")
+    parser.add_argument("--history", action="store_true", help="check the DSL example history before writing a DSL")
+    parser.add_argument("--out", type=str, default=BATCH_OUTPUT_DIR, help="output directory")
+    args = parser.parse_args(argv)
+
+    customers = [c.strip() for c in args.customers.split(",") if c.strip()] if args.customers else None
+    items = load_items(args.requirements, customers)
+    start = time.perf_counter()
+    try:
+        results = await run_batch(items, args.workers, args.mode, args.history, args.out)
+    finally:
+        await aclose_es_client()
+        await aclose_model_clients()
+
+    summary = summarize(results, time.perf_counter() - start)
+    summary_path = os.path.join(args.out, "summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"{summary['completed']}/{summary['items']} completed in {summary['wall_time']}s, "
+          f"p50 {summary['latency']['p50']}s, {summary['tokens']['total_tokens']} tokens. Summary: {summary_path}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,239 @@
+"""
+Composite-aggregation pagination for large `terms` groupings.
+
+A DSL whose aggregation tree starts with a chain of plain `terms` groupings
+(terms -> terms -> ... -> any sub-aggs) is rewritten into one `composite`
+aggregation whose sources are those terms fields. Only groupings that ask for
+all terms qualify: a terms with a small `size` or a doc_count `order` is a
+top-N and stays as it is. Pages are fetched with
+`after_key` (the next page is requested while the current one is processed),
+and every page is turned back into the original nested `terms` shape, so the
+flatteners and result.json readers see the same structure and column names,
+only complete (no `sum_other_doc_count` truncation) and ordered by key.
+"""
+import asyncio
+import copy
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+from es_client import SEARCH_TIMEOUT, es_request
+
+#===================================================================
+# Composite paging config
+#===================================================================
+COMPOSITE_PAGE_SIZE = 200       # composite buckets per request (each may hold a date_histogram)
+MAX_PAGES = 10000
+TERMS_PARAMS = {"field", "size", "shard_size", "show_term_doc_count_error", "order"}
+ALL_TERMS_SIZE = 1000           # a terms size from here on asks for every term, below it a top-N
+# pipeline aggs that must sit under a multi-bucket parent, OpenSearch rejects them directly under composite
+PARENT_PIPELINE_AGGS = {
+    "bucket_selector", "bucket_sort", "bucket_script", "derivative", "cumulative_sum",
+    "cumulative_cardinality", "serial_diff", "moving_avg", "moving_fn", "normalize",
+}
+
+
+@dataclass
+class CompositePlan:
+    agg_name: str                       # name of the composite aggregation (= first terms name)
+    sources: List[str]                  # terms names, outermost first
+    body: Dict[str, Any]                # rewritten DSL (without "after")
+    page_size: int = COMPOSITE_PAGE_SIZE
+    took: int = 0
+    pages: int = 0
+    timed_out: bool = False             # some page timed out
+    failed_shards: int = 0
+    truncated: bool = False             # stopped at MAX_PAGES with pages left
+
+    @property
+    def complete(self) -> bool:
+        """Every page was fetched in full, the merged result may be cached."""
+        return not (self.timed_out or self.failed_shards or self.truncated)
+
+
+def _aggs_key(node: Dict) -> Optional[str]:
+    if "aggs" in node:
+        return "aggs"
+    if "aggregations" in node:
+        return "aggregations"
+    return None
+
+
+def _key_order(terms: Dict) -> Optional[str]:
+    """"asc" / "desc" for a terms ordered by _key (the default of composite), None for any other order."""
+    order = terms.get("order", {"_key": "asc"})
+    if isinstance(order, list):
+        order = order[0] if len(order) == 1 else {}
+    if not isinstance(order, dict) or set(order) != {"_key"} or order["_key"] not in ("asc", "desc"):
+        return None
+    return order["_key"]
+
+
+def _plain_terms(agg: Any) -> Optional[Dict]:
+    """Return the terms body of an agg that can become a composite source, else None."""
+    if not isinstance(agg, dict) or "terms" not in agg:
+        return None
+    if set(agg) - {"terms", "aggs", "aggregations"}:
+        return None
+    terms = agg["terms"]
+    if not isinstance(terms, dict) or "field" not in terms or set(terms) - TERMS_PARAMS:
+        return None
+    if "size" in terms and not (isinstance(terms["size"], int) and terms["size"] >= ALL_TERMS_SIZE):
+        return None         # top-N by doc_count, paging would return every term instead
+    if "order" in terms and _key_order(terms) is None:
+        return None
+    return terms
+
+
+def _has_parent_pipeline(aggs: Dict) -> bool:
+    return any(isinstance(agg, dict) and set(agg) & PARENT_PIPELINE_AGGS for agg in aggs.values())
+
+
+def rewrite_to_composite(query: Union[str, dict], page_size: int = COMPOSITE_PAGE_SIZE) -> Optional[CompositePlan]:
+    """
+    Rewrite the top-level terms chain of a DSL into a composite aggregation.
+    Return None when the DSL does not have that shape (the caller runs it as is):
+    - exactly one top-level aggregation, a plain `terms` (no include/script ...)
+      without a top-N `size` (below ALL_TERMS_SIZE) and ordered by _key if at all
+    - the chain continues while a level holds exactly one plain `terms` sub-agg
+    - the sub-aggs of the innermost terms become the composite sub-aggs, so none
+      of them may be a parent pipeline agg (bucket_selector, bucket_sort ...)
+    """
+    if isinstance(query, str):
+        try:
+            query = json.loads(query)
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(query, dict):
+        return None
+    root_key = _aggs_key(query)
+    if root_key is None or len(query[root_key]) != 1:
+        return None
+
+    agg_name, agg = next(iter(query[root_key].items()))
+    if _plain_terms(agg) is None:
+        return None
+
+    sources = []
+    names = []
+    node_name, node = agg_name, agg
+    while True:
+        terms = _plain_terms(node)
+        source = {"field": terms["field"]}
+        if _key_order(terms) == "desc":
+            source["order"] = "desc"
+        sources.append({node_name: {"terms": source}})
+        names.append(node_name)
+        sub_key = _aggs_key(node)
+        sub_aggs = node.get(sub_key, {}) if sub_key else {}
+        if len(sub_aggs) == 1:
+            child_name, child = next(iter(sub_aggs.items()))
+            if _plain_terms(child) is not None:
+                node_name, node = child_name, child
+                continue
+        break
+    if _has_parent_pipeline(sub_aggs):
+        return None
+
+    composite = {"composite": {"size": page_size, "sources": sources}}
+    if sub_aggs:
+        composite["aggs"] = copy.deepcopy(sub_aggs)
+
+    body = {k: copy.deepcopy(v) for k, v in query.items() if k != root_key}
+    body["size"] = 0
+    body["aggs"] = {agg_name: composite}
+    return CompositePlan(agg_name=agg_name, sources=names, body=body, page_size=page_size)
+
+
+def nest_page(plan: CompositePlan, buckets: List[Dict]) -> Dict[str, Any]:
+    """Turn composite buckets into the nested terms aggregations of the original DSL."""
+    root = {"buckets": []}
+    for bucket in buckets:
+        node = root
+        for level, name in enumerate(plan.sources):
+            key = bucket["key"][name]
+            level_buckets = node["buckets"]
+            if level_buckets and level_buckets[-1]["key"] == key:
+                child = level_buckets[-1]
+            else:
+                child = {"key": key, "doc_count": 0}
+                level_buckets.append(child)
+            child["doc_count"] += bucket.get("doc_count", 0)
+            if level + 1 < len(plan.sources):
+                node = child.setdefault(plan.sources[level + 1], {"buckets": []})
+            else:
+                child.update({k: v for k, v in bucket.items() if k not in ("key", "doc_count")})
+    return {plan.sources[0]: root}
+
+
+def merge_page(target: Dict[str, Any], page: Dict[str, Any], sources: List[str]):
+    """Append a nested page to the merged aggregations (pages are key-ordered, so only the last bucket can continue)."""
+    name = sources[0]
+    if name not in target:
+        target[name] = page[name]
+        return
+    target_buckets = target[name]["buckets"]
+    for bucket in page[name]["buckets"]:
+        if target_buckets and target_buckets[-1]["key"] == bucket["key"] and len(sources) > 1:
+            last = target_buckets[-1]
+            last["doc_count"] += bucket["doc_count"]
+            merge_page(last, bucket, sources[1:])
+        else:
+            target_buckets.append(bucket)
+
+
+async def _fetch_page(index: str, plan: CompositePlan, after_key: Optional[Dict]) -> Dict:
+    body = copy.deepcopy(plan.body)
+    if after_key is not None:
+        body["aggs"][plan.agg_name]["composite"]["after"] = after_key
+    response = await es_request("GET", f"/{index}/_search", body=body, timeout=SEARCH_TIMEOUT)
+    if response.status_code != 200:
+        raise RuntimeError(f"Request failed with status {response.status_code}: {response.text}")
+    return response.json()
+
+
+async def iter_composite_pages(index: str, plan: CompositePlan) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield each page as nested terms aggregations.
+    The request for page n+1 is already in flight while page n is consumed.
+    """
+    next_page = asyncio.create_task(_fetch_page(index, plan, None))
+    try:
+        while next_page is not None:
+            result = await next_page
+            next_page = None
+            composite = result.get("aggregations", {}).get(plan.agg_name, {})
+            buckets = composite.get("buckets", [])
+            after_key = composite.get("after_key")
+
+            plan.took += result.get("took", 0)
+            plan.pages += 1
+            plan.timed_out = plan.timed_out or bool(result.get("timed_out"))
+            plan.failed_shards += result.get("_shards", {}).get("failed", 0)
+            if buckets and after_key is not None:
+                if plan.pages < MAX_PAGES:
+                    next_page = asyncio.create_task(_fetch_page(index, plan, after_key))
+                else:
+                    plan.truncated = True
+            if buckets:
+                yield nest_page(plan, buckets)
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+async def composite_search(index: str, plan: CompositePlan) -> Dict[str, Any]:
+    """Run all pages and return one response in the original (nested terms) shape."""
+    aggregations: Dict[str, Any] = {}
+    async for page in iter_composite_pages(index, plan):
+        merge_page(aggregations, page, plan.sources)
+    aggregations.setdefault(plan.sources[0], {"buckets": []})
+    aggregations[plan.sources[0]].update({"doc_count_error_upper_bound": 0, "sum_other_doc_count": 0})
+    return {
+        "took": plan.took,
+        "timed_out": plan.timed_out,
+        "_shards": {"failed": plan.failed_shards},
+        "composite_pages": plan.pages,
+        "composite_complete": plan.complete,
+        "aggregations": aggregations,
+    }
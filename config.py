@@ -1,40 +1,20 @@
 import yaml
-from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
 from langchain_openai import AzureOpenAIEmbeddings
 import os
+from model_registry import get_registry
 
 #===================================================================
 # GPT-4o config
 #===================================================================
 def get_model_client(config_path="model_config.yaml", temperature: float = 0.0):
-    with open(config_path, "r") as f:
-        cfg = yaml.safe_load(f)["azure"]
-
-    return AzureOpenAIChatCompletionClient(
-        azure_deployment=cfg["deployment"],
-        model=cfg["model"],
-        api_version=cfg["api_version"],
-        azure_endpoint=cfg["endpoint"],
-        api_key=cfg["api_key"],
-        temperature=temperature,    
-        model_info=cfg["model_info"]
-    )
+    # shared per (section, temperature): config parsed once, one connection pool per deployment (see model_registry.py)
+    return get_registry(config_path).get("azure", temperature=temperature)
 
 #===================================================================
 #GPT-4o-mini    
 #===================================================================
 def get_mini_model_client(config_path="model_config.yaml"):
-    with open(config_path, "r") as f:
-        cfg = yaml.safe_load(f)["mini"]
-
-    return AzureOpenAIChatCompletionClient(
-        azure_deployment=cfg["deployment"],
-        model=cfg["model"],
-        api_version=cfg["api_version"],
-        azure_endpoint=cfg["endpoint"],
-        api_key=cfg["api_key"],
-        model_info=cfg["model_info"]
-    )
+    return get_registry(config_path).get("mini")
 
 #===================================================================
 # Azure embedding config
@@ -0,0 +1,125 @@
+"""
+Customer directory: customer.xlsx and wifi_customer_brand.xlsx parsed once.
+
+    customer_directory.options_text()         # "customer options: ..." for CustomerFinderAgent
+    customer_directory.brand("hkjc")          # -> "HUAWEI"
+    customer_directory.resolve("Cafe de Coral")  # -> CustomerEntry("CafeDeCoral", "ARUBA", "cafedecoral-*")
+
+Lookups are dict hits on a normalised name (case, spaces and punctuation
+ignored) with a difflib fallback for near misses. The workbooks are re-read
+only when their mtime changes, so Excel parsing is off the per-turn path.
+"""
+import difflib
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from config import mapping_dir
+from es_client import index_pattern
+
+#===================================================================
+# Customer directory config
+#===================================================================
+CUSTOMER_XLSX = os.path.join(mapping_dir, "customer.xlsx")
+BRAND_XLSX = os.path.join(mapping_dir, "wifi_customer_brand.xlsx")
+CUSTOMER_COLUMN = "customer"
+BRAND_CUSTOMER_COLUMN = "Customer"
+BRAND_COLUMN = "WifiBrand"
+FUZZY_CUTOFF = 0.8
+
+
+def normalize(name: str) -> str:
+    return re.sub(r"[\W_]+", "", str(name)).casefold()
+
+
+@dataclass(frozen=True)
+class CustomerEntry:
+    name: str
+    brand: Optional[str]
+    index: str
+
+
+class CustomerDirectory:
+    def __init__(self, customer_path: str = CUSTOMER_XLSX, brand_path: str = BRAND_XLSX, customer_column: str = CUSTOMER_COLUMN):
+        self.customer_path = customer_path
+        self.brand_path = brand_path
+        self.customer_column = customer_column
+        self._lock = threading.Lock()
+        self._mtimes: Tuple[Optional[float], Optional[float]] = (None, None)
+        self._customers: List[str] = []
+        self._entries: Dict[str, CustomerEntry] = {}
+        self._options_text = ""
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def refresh(self, force: bool = False):
+        """(Re)load the workbooks when either file changed on disk."""
+        mtimes = (self._mtime(self.customer_path), self._mtime(self.brand_path))
+        if not force and mtimes == self._mtimes and self._mtimes != (None, None):
+            return
+        with self._lock:
+            if not force and mtimes == self._mtimes and self._mtimes != (None, None):
+                return
+            df = pd.read_excel(self.customer_path)
+            if self.customer_column not in df.columns:
+                raise ValueError(f"column '{self.customer_column}' is not exist. Only: {list(df.columns)}")
+            customers = [str(c).strip() for c in df[self.customer_column].dropna().unique().tolist()]
+
+            brands: Dict[str, Tuple[str, str]] = {}
+            if mtimes[1] is not None:
+                bf = pd.read_excel(self.brand_path).dropna(subset=[BRAND_CUSTOMER_COLUMN])
+                for customer, brand in zip(bf[BRAND_CUSTOMER_COLUMN], bf[BRAND_COLUMN]):
+                    brands[normalize(customer)] = (str(customer).strip(), None if pd.isna(brand) else str(brand).strip())
+
+            entries: Dict[str, CustomerEntry] = {}
+            for name in customers + [name for name, _ in brands.values()]:
+                key = normalize(name)
+                if key and key not in entries:
+                    brand = brands.get(key, (name, None))[1]
+                    entries[key] = CustomerEntry(name=name, brand=brand, index=index_pattern(name))
+
+            self._customers = customers
+            self._entries = entries
+            self._options_text = "customer options: \n" + "\n".join(f"- {c}" for c in customers)
+            self._mtimes = mtimes
+
+    def customers(self) -> List[str]:
+        self.refresh()
+        return list(self._customers)
+
+    def options_text(self) -> str:
+        """Customer list in the CustomerFinderAgent memory format."""
+        self.refresh()
+        return self._options_text
+
+    def match(self, name: str, cutoff: float = FUZZY_CUTOFF) -> Optional[str]:
+        """Normalised key of the closest known customer, None when nothing is close enough."""
+        key = normalize(name)
+        if key in self._entries:
+            return key
+        close = difflib.get_close_matches(key, list(self._entries), n=1, cutoff=cutoff)
+        return close[0] if close else None
+
+    def resolve(self, name: str, fuzzy: bool = True) -> Optional[CustomerEntry]:
+        """Entry of a customer, exact (case-insensitive) first, then the closest fuzzy match."""
+        if not name:
+            return None
+        self.refresh()
+        key = self.match(name) if fuzzy else normalize(name)
+        return self._entries.get(key) if key else None
+
+    def brand(self, name: str) -> Optional[str]:
+        entry = self.resolve(name)
+        return entry.brand if entry else None
+
+
+customer_directory = CustomerDirectory()
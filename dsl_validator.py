@@ -0,0 +1,269 @@
+"""
+Static DSL checks against the index mapping (replaces the KeywordChecker LLM turn).
+
+- every `field` of the query and aggs trees is resolved against the mapping
+- text fields with a keyword sub-field get ".keyword" where exact values are
+  needed (term/terms/prefix/wildcard/regexp, aggregations, sort)
+- ".keyword" is removed from fields that have no keyword sub-field
+- string bounds of date ranges are rewritten to yyyy-MM-dd'T'HH:mm:ss
+  (same instant, the time range itself is not changed)
+- fields missing from the mapping are reported
+"""
+import copy
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from artifact_store import mapping_path
+
+#===================================================================
+# Validator config
+#===================================================================
+DATE_FORMAT = "yyyy-MM-dd'T'HH:mm:ss"
+DATE_STRFTIME = "%Y-%m-%dT%H:%M:%S"
+EXACT_QUERIES = {"term", "terms", "prefix", "wildcard", "regexp", "fuzzy", "terms_set"}
+FULLTEXT_QUERIES = {"match", "match_phrase", "match_phrase_prefix", "match_bool_prefix"}
+FIELD_KEYS = {"field"}          # aggregations, exists, composite sources ...
+RANGE_KEYS = ("gte", "gt", "lte", "lt", "from", "to")
+META_FIELDS = {"_id", "_index", "_count", "_key", "_term", "_score", "_doc"}
+
+
+def _raw_properties(raw: Dict[str, Any]) -> Dict[str, Any]:
+    if "mappings" in raw:
+        return raw["mappings"].get("properties", {})
+    if len(raw) == 1:
+        return list(raw.values())[0].get("mappings", {}).get("properties", {})
+    return raw
+
+
+def _walk_properties(properties: Dict[str, Any], parent: str = ""):
+    for name, info in properties.items():
+        path = f"{parent}.{name}" if parent else name
+        if "type" in info:
+            yield path, info["type"], "keyword" in info.get("fields", {})
+        if "properties" in info:
+            yield from _walk_properties(info["properties"], path)
+
+
+class DSLValidator:
+    """
+    Field table built once from the mapping:
+    field -> (type, has keyword sub-field)
+    The raw mapping is preferred: the flattened one reports text+keyword fields
+    as "keyword", so it cannot tell whether ".keyword" is needed.
+    """
+
+    def __init__(self, flattened: Optional[Dict[str, str]] = None, raw: Optional[Dict[str, Any]] = None):
+        self.fields: Dict[str, Tuple[str, bool]] = {}
+        if raw:
+            for path, field_type, has_keyword in _walk_properties(_raw_properties(raw)):
+                self.fields[path] = (field_type, has_keyword)
+        for path, field_type in (flattened or {}).items():
+            self.fields.setdefault(path, (field_type, False))
+
+    @classmethod
+    def from_files(
+        cls,
+        flattened_path: Optional[str] = None,
+        raw_path: Optional[str] = None,
+    ) -> "DSLValidator":
+        """Defaults are the mapping files of the active session (artifact_store.mapping_path)."""
+        flattened_path = flattened_path or mapping_path("flattened_mapping.json")
+        raw_path = raw_path or mapping_path("raw_mapping.json")
+        with open(flattened_path, "r", encoding="utf-8") as f:
+            flattened = json.load(f)
+        raw = None
+        if raw_path and os.path.exists(raw_path):
+            with open(raw_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        return cls(flattened, raw)
+
+    # ---------- field resolution --------------------------------------------
+    def resolve(self, field: str, exact: bool) -> Tuple[str, Optional[str]]:
+        """Return (fixed field, note). note is "unknown" for fields missing from the mapping."""
+        if not isinstance(field, str) or field in META_FIELDS or "*" in field:
+            return field, None
+        base = field[:-len(".keyword")] if field.endswith(".keyword") else field
+        info = self.fields.get(base)
+        if info is None:
+            return field, "unknown"
+        field_type, has_keyword = info
+        if field.endswith(".keyword"):
+            if has_keyword or field in self.fields:
+                return field, None
+            return base, f"{field} -> {base} (no keyword sub-field)"
+        if exact and field_type == "text" and has_keyword:
+            return f"{field}.keyword", f"{field} -> {field}.keyword"
+        return field, None
+
+    def is_date(self, field: str) -> bool:
+        return self.fields.get(field, ("", False))[0] in ("date", "date_nanos")
+
+    # ---------- tree walk ---------------------------------------------------
+    def validate(self, dsl: Union[str, Dict[str, Any]]) -> "ValidationReport":
+        if isinstance(dsl, str):
+            dsl = json.loads(dsl)
+        report = ValidationReport(copy.deepcopy(dsl))
+        fixed = report.dsl
+        if isinstance(fixed.get("query"), dict):
+            self._query(fixed["query"], report)
+        for key in ("aggs", "aggregations"):
+            if isinstance(fixed.get(key), dict):
+                self._aggs(fixed[key], report)
+        if "sort" in fixed:
+            fixed["sort"] = self._sort(fixed["sort"], report)
+        return report
+
+    def _fix(self, field: str, exact: bool, report: "ValidationReport") -> str:
+        fixed, note = self.resolve(field, exact)
+        if note == "unknown":
+            report.unknown_fields.append(field)
+        elif note:
+            report.changes.append(note)
+        return fixed
+
+    def _query(self, node: Any, report: "ValidationReport"):
+        if isinstance(node, list):
+            for item in node:
+                self._query(item, report)
+            return
+        if not isinstance(node, dict):
+            return
+        for key, value in list(node.items()):
+            if key in EXACT_QUERIES or key in FULLTEXT_QUERIES:
+                if isinstance(value, dict):
+                    exact = key in EXACT_QUERIES
+                    node[key] = {
+                        (self._fix(k, exact, report) if k not in ("boost", "_name") else k): v
+                        for k, v in value.items()
+                    }
+            elif key == "range" and isinstance(value, dict):
+                node[key] = {}
+                for field, bounds in value.items():
+                    fixed = self._fix(field, False, report)
+                    if isinstance(bounds, dict) and self.is_date(fixed):
+                        bounds = self._date_bounds(fixed, bounds, report)
+                    node[key][fixed] = bounds
+            elif key in FIELD_KEYS and isinstance(value, str):
+                node[key] = self._fix(value, False, report)
+            else:
+                self._query(value, report)
+
+    def _aggs(self, aggs: Dict[str, Any], report: "ValidationReport"):
+        for agg in aggs.values():
+            if not isinstance(agg, dict):
+                continue
+            for kind, body in agg.items():
+                if kind in ("aggs", "aggregations") and isinstance(body, dict):
+                    self._aggs(body, report)
+                elif kind == "composite" and isinstance(body, dict):
+                    for source in body.get("sources", []):
+                        for spec in source.values():
+                            for inner in spec.values():
+                                if isinstance(inner, dict) and "field" in inner:
+                                    inner["field"] = self._fix(inner["field"], True, report)
+                elif kind in ("filter", "filters") and isinstance(body, dict):
+                    self._query(body, report)
+                elif isinstance(body, dict):
+                    if isinstance(body.get("field"), str):
+                        body["field"] = self._fix(body["field"], True, report)
+                    if "sort" in body:
+                        body["sort"] = self._sort(body["sort"], report)
+
+    def _sort(self, sort: Any, report: "ValidationReport") -> Any:
+        items = sort if isinstance(sort, list) else [sort]
+        fixed = []
+        for item in items:
+            if isinstance(item, str):
+                fixed.append(self._fix(item, True, report))
+            elif isinstance(item, dict):
+                fixed.append({self._fix(k, True, report): v for k, v in item.items()})
+            else:
+                fixed.append(item)
+        return fixed if isinstance(sort, list) else fixed[0]
+
+    def _date_bounds(self, field: str, bounds: Dict[str, Any], report: "ValidationReport") -> Dict[str, Any]:
+        bounds = dict(bounds)
+        parsed: Dict[str, datetime] = {}
+        for op in RANGE_KEYS:
+            value = bounds.get(op)
+            if not isinstance(value, str) or value.startswith("now") or value.isdigit() or "||" in value:
+                continue
+            try:
+                parsed[op] = datetime.fromisoformat(value.strip().replace("Z", "+00:00").replace("/", "-"))
+            except ValueError:
+                report.warnings.append(f"{field}: cannot read date '{value}'")
+        if not parsed:
+            return bounds
+
+        # the format has no offset: move it to time_zone (or convert to the existing time_zone / UTC)
+        aware = {op: dt for op, dt in parsed.items() if dt.tzinfo is not None}
+        if aware and "time_zone" not in bounds:
+            offsets = {dt.utcoffset() for dt in aware.values()}
+            if len(offsets) == 1 and len(aware) == len(parsed):
+                minutes = int(offsets.pop().total_seconds() // 60)
+                bounds["time_zone"] = f"{'+' if minutes >= 0 else '-'}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+            else:
+                parsed.update({op: dt.astimezone(timezone.utc) for op, dt in aware.items()})
+        elif aware:
+            target = _zone(bounds["time_zone"])
+            if target is None:
+                report.warnings.append(f"{field}: unknown time_zone '{bounds['time_zone']}'")
+                return bounds
+            parsed.update({op: dt.astimezone(target) for op, dt in aware.items()})
+
+        changed = False
+        for op, dt in parsed.items():
+            text = dt.strftime(DATE_STRFTIME)
+            if text != bounds[op]:
+                bounds[op] = text
+                changed = True
+        strings = [bounds[op] for op in RANGE_KEYS if isinstance(bounds.get(op), str)]
+        if len(parsed) == len(strings) and bounds.get("format") != DATE_FORMAT:
+            bounds["format"] = DATE_FORMAT
+            changed = True
+        if changed:
+            report.changes.append(f"{field}: date format -> {DATE_FORMAT}")
+        return bounds
+
+
+def _zone(name: str):
+    m = re.fullmatch(r"([+-])(\d{2}):?(\d{2})", name)
+    if m:
+        delta = timedelta(hours=int(m.group(2)), minutes=int(m.group(3)))
+        return timezone(delta if m.group(1) == "+" else -delta)
+    if name.upper() in ("UTC", "Z", "GMT"):
+        return timezone.utc
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except Exception:
+        return None
+
+
+class ValidationReport:
+    def __init__(self, dsl: Dict[str, Any]):
+        self.dsl = dsl
+        self.changes: List[str] = []
+        self.unknown_fields: List[str] = []
+        self.warnings: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.unknown_fields
+
+    def summary(self) -> str:
+        lines = []
+        if self.changes:
+            lines.append("Fixed: " + "; ".join(dict.fromkeys(self.changes)))
+        if self.unknown_fields:
+            lines.append("Unknown fields: " + ", ".join(dict.fromkeys(self.unknown_fields)))
+        lines.extend(self.warnings)
+        return "\n".join(lines) or "No change needed."
+
+
+def validate_dsl(dsl: Union[str, Dict[str, Any]], validator: Optional[DSLValidator] = None) -> ValidationReport:
+    """Validate a DSL with the mapping of the active session (or the given validator)."""
+    return (validator or DSLValidator.from_files()).validate(dsl)
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+from typing import Dict, Optional, Union
+
+import httpx
+
+#===================================================================
+# OpenSearch connection config
+#===================================================================
+es_url = "https://jumphost.hkt-ems.com:443"
+es_auth = ("internship", "P@ssw0rd")
+es_headers = {"Content-Type": "application/json"}
+
+# connection pool: bounded, keep-alive so each query skips the TCP+TLS handshake
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = 60.0
+CONNECT_TIMEOUT = 10.0
+# _search has no read timeout by default (long aggregations ran unbounded before the shared client);
+# set ES_SEARCH_TIMEOUT to cap it
+SEARCH_TIMEOUT: Optional[float] = float(os.environ["ES_SEARCH_TIMEOUT"]) if os.environ.get("ES_SEARCH_TIMEOUT") else None
+
+# one client per running event loop (Streamlit starts a new loop on every rerun)
+_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+
+def index_pattern(customer_name: str) -> str:
+    """
+    Build the index pattern of a customer, e.g. "HKJC" -> "hkjc-*".
+    "*" means all customers.
+    """
+    if customer_name == "*":
+        return "*"
+    return f"{customer_name.lower()}-*"
+
+
+def get_es_client() -> httpx.AsyncClient:
+    """
+    Return the shared AsyncClient of the running event loop, create it on first use.
+    Clients of loops that are already closed are dropped.
+    """
+    loop = asyncio.get_running_loop()
+    for old_loop in [l for l in _clients if l.is_closed()]:
+        _clients.pop(old_loop, None)
+
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=es_url,
+            auth=es_auth,
+            headers=es_headers,
+            verify=False,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+        _clients[loop] = client
+    return client
+
+
+def _encode_body(body: Union[str, bytes, dict, None]) -> Optional[Union[str, bytes]]:
+    if body is None or isinstance(body, (str, bytes)):
+        return body
+    return json.dumps(body, ensure_ascii=False)
+
+
+async def es_request(
+    method: str,
+    path: str,
+    body: Union[str, bytes, dict, None] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    headers: Optional[Dict[str, str]] = None,
+) -> httpx.Response:
+    """
+    Send one request to OpenSearch through the shared pool.
+
+    :param method:  HTTP method, e.g. "GET"
+    :param path:    path after the cluster url, e.g. "/hkjc-*/_search"
+    :param body:    query body as dict or JSON string
+    :param timeout: per-call read timeout in seconds, None for no limit (see SEARCH_TIMEOUT)
+    :param headers: extra headers, e.g. the NDJSON content type of _msearch
+    """
+    client = get_es_client()
+    return await client.request(
+        method,
+        path,
+        content=_encode_body(body),
+        headers=headers,
+        timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+    )
+
+
+def es_stream(
+    method: str,
+    path: str,
+    body: Union[str, bytes, dict, None] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+):
+    """
+    Streaming variant of es_request, used as `async with es_stream(...) as response:`.
+    The body is read with response.aiter_bytes() instead of being loaded at once.
+    """
+    return get_es_client().stream(
+        method,
+        path,
+        content=_encode_body(body),
+        timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+    )
+
+
+async def aclose_es_client() -> None:
+    """Close the client of the running event loop (call before the loop ends)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.pop(loop, None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
@@ -0,0 +1,199 @@
+"""
+Field catalog: the field CSV parsed once and kept in memory.
+
+    catalog = get_field_catalog(csv_path, schema_fields=..., brand="HUAWEI")
+    view = get_brand_view("HUAWEI")             # all_field.csv restricted to the brand's FieldSetIDs
+    catalog.text(["Field", "Explanation"])      # rendered prompt block, cached per column subset
+    catalog.fields                              # rows with a field name (ES_Query / tool.py shape)
+    catalog.lookup("DATA.clients.RSSI")         # -> "data.clients.rssi"
+
+A catalog is keyed by (CSV path, CSV mtime, mapping hash, FieldSetIDs), so
+editing the CSV or switching the mapping builds a new one; everything else is
+a dict lookup. Brand and mapping filters are vectorized (isin on lower-cased
+names). Catalogs are read-only, so one brand view is shared by every session
+and nothing is written to disk per request.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from config import mapping_dir
+
+#===================================================================
+# Field catalog config
+#===================================================================
+ALL_FIELD_CSV = os.path.join(mapping_dir, "all_field.csv")
+ENCODINGS = ["utf-8-sig", "windows-1252", "latin-1"]
+BRAND_FIELD_SETS = {            # FieldSetID 0 is shared, the others belong to one wifi brand
+    "HUAWEI": [0, 1],
+    "ARUBA": [0, 2],
+}
+MAX_CATALOGS = 32
+
+
+def read_csv_any(csv_path: str) -> pd.DataFrame:
+    """Read a CSV trying the usual Excel encodings, chardet as last resort; header BOM and padding stripped."""
+    for enc in ENCODINGS:
+        try:
+            df = pd.read_csv(csv_path, encoding=enc)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        import chardet
+        with open(csv_path, "rb") as f:
+            result = chardet.detect(f.read())
+        df = pd.read_csv(csv_path, encoding=result["encoding"])
+    df.columns = df.columns.str.strip().str.replace('\ufeff', '')
+    return df
+
+
+def mapping_hash(schema_fields: Optional[Iterable[str]]) -> str:
+    if not schema_fields:
+        return ""
+    text = "\n".join(sorted(schema_fields))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def brand_field_sets(brand: Optional[str]) -> Optional[Tuple[int, ...]]:
+    """FieldSetIDs of a wifi brand; None (every row) for an unknown brand."""
+    field_sets = BRAND_FIELD_SETS.get(str(brand).upper()) if brand else None
+    return tuple(field_sets) if field_sets else None
+
+
+class FieldCatalog:
+    def __init__(
+        self,
+        raw: pd.DataFrame,
+        schema_fields: Optional[Iterable[str]] = None,
+        field_sets: Optional[Sequence[int]] = None,
+        csv_path: Optional[str] = None,
+    ):
+        table = raw.dropna(how="all", axis=0)
+        if "Field" in table.columns:
+            table = table.assign(Field=table["Field"].map(lambda v: str(v).strip() if pd.notna(v) else v))
+
+        if field_sets is not None and "FieldSetID" in table.columns:
+            set_ids = pd.to_numeric(table["FieldSetID"], errors="coerce")
+            table = table[set_ids.isin(field_sets)]
+
+        named = table["Field"].notna() & (table["Field"].astype(str) != "") if "Field" in table.columns else None
+        if schema_fields and named is not None:
+            schema_lower = {f.lower() for f in schema_fields}
+            table = table[table["Field"].astype(str).str.lower().isin(schema_lower)]
+            named = named[table.index]
+
+        self.csv_path = csv_path
+        self.field_sets = tuple(field_sets) if field_sets is not None else None
+        self.schema_fields = set(schema_fields) if schema_fields else None
+        self.table = table                  # every non-empty row, notes included (field_description)
+        self.fields = table[named].fillna("") if named is not None else table.iloc[0:0]
+        self.index: Dict[str, str] = {f.lower(): f for f in self.fields["Field"]} if len(self.fields) else {}
+        self._texts: Dict[Tuple, str] = {}
+        self._records: Optional[str] = None
+
+    def restrict(self, schema_fields: Optional[Iterable[str]]) -> "FieldCatalog":
+        """Same CSV and FieldSetIDs, limited to the fields of a mapping."""
+        return get_field_catalog(self.csv_path, schema_fields, field_sets=self.field_sets)
+
+    def lookup(self, field_name) -> Optional[str]:
+        """Canonical spelling of a field, case-insensitive; None when it is not in the catalog."""
+        return self.index.get(str(field_name).strip().lower())
+
+    def __contains__(self, field_name) -> bool:
+        return self.lookup(field_name) is not None
+
+    def rows(self, field_names: Iterable[str]) -> pd.DataFrame:
+        wanted = {str(f).strip().lower() for f in field_names}
+        return self.fields[self.fields["Field"].str.lower().isin(wanted)]
+
+    def text(self, columns: Sequence[str], item_sep: str = ", ", row_sep: str = "\n") -> str:
+        """Selected columns rendered one row per line (field_description format), cached."""
+        key = (tuple(columns), item_sep, row_sep)
+        if key not in self._texts:
+            self._texts[key] = render_rows(self.table, columns, item_sep, row_sep)
+        return self._texts[key]
+
+    def records_json(self) -> str:
+        """Field rows as a JSON records string (Get_csv_tool), cached."""
+        if self._records is None:
+            self._records = self.fields.to_json(orient="records", force_ascii=False, indent=2)
+        return self._records
+
+
+def render_rows(df: pd.DataFrame, columns: Sequence[str], item_sep: str = ", ", row_sep: str = "\n") -> str:
+    """Join the non-empty values of the selected columns per row, then the rows."""
+    df = df.dropna(how="all", axis=0).dropna(how="all", axis=1)
+    valid_cols = [c for c in columns if c in df.columns]
+    if not valid_cols:
+        return ""
+
+    # item_sep with one ':' keeps the "column: value" form
+    labelled = len(item_sep.split(":")) == 2
+    prefixes = [f"{c}{item_sep.split(':')[0]}" if labelled else "" for c in valid_cols]
+    columns_values = [df[c].tolist() for c in valid_cols]
+
+    row_strings: List[str] = []
+    for values in zip(*columns_values):
+        parts = [f"{p}{v}" for p, v in zip(prefixes, values) if pd.notna(v)]
+        if parts:
+            row_strings.append(item_sep.join(parts))
+    return row_sep.join(row_strings)
+
+
+_raw: Dict[str, Tuple[float, pd.DataFrame]] = {}
+_catalogs: Dict[Tuple, FieldCatalog] = {}
+
+
+def _raw_table(csv_path: str) -> Tuple[float, pd.DataFrame]:
+    mtime = os.path.getmtime(csv_path)
+    cached = _raw.get(csv_path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, read_csv_any(csv_path))
+        _raw[csv_path] = cached
+    return cached
+
+
+def get_field_catalog(
+    csv_path: str = ALL_FIELD_CSV,
+    schema_fields: Optional[Iterable[str]] = None,
+    brand: Optional[str] = None,
+    field_sets: Optional[Sequence[int]] = None,
+) -> FieldCatalog:
+    """Catalog of csv_path restricted to a mapping and a brand (or FieldSetIDs), built once per version."""
+    csv_path = os.path.abspath(csv_path)
+    schema_fields = set(schema_fields) if schema_fields else None
+    field_sets = tuple(field_sets) if field_sets is not None else brand_field_sets(brand)
+    mtime, raw = _raw_table(csv_path)
+    key = (csv_path, mtime, mapping_hash(schema_fields), field_sets)
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        if len(_catalogs) >= MAX_CATALOGS:
+            _catalogs.pop(next(iter(_catalogs)))
+        catalog = FieldCatalog(raw, schema_fields=schema_fields, field_sets=field_sets, csv_path=csv_path)
+        _catalogs[key] = catalog
+    return catalog
+
+
+def get_brand_view(brand: Optional[str], csv_path: str = ALL_FIELD_CSV) -> FieldCatalog:
+    """In-memory view of all_field.csv for a wifi brand (what filter_field_description.csv used to hold)."""
+    return get_field_catalog(csv_path, brand=brand)
+
+
+def as_catalog(source: Union[str, FieldCatalog, None]) -> FieldCatalog:
+    """Accept a catalog/view or a CSV path; None is every field of all_field.csv."""
+    if isinstance(source, FieldCatalog):
+        return source
+    return get_field_catalog(source or ALL_FIELD_CSV)
+
+
+def load_schema_fields(schema_path: str) -> set:
+    """Field names of a flattened mapping JSON; empty when missing or invalid."""
+    try:
+        with open(schema_path, "r", encoding="utf-8") as f:
+            return set(json.load(f).keys())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return set()
@@ -0,0 +1,231 @@
+"""
+Top-k field retrieval over all_field.csv.
+
+Prompts used to carry every row of the field CSV. FieldRetriever ranks the
+rows against the requirement instead and prompts keep only the k most
+relevant fields:
+
+    score = LEXICAL_WEIGHT * bm25 (normalised) + (1 - LEXICAL_WEIGHT) * cosine
+
+bm25 runs over the field name (split on dots, underscores and camelCase),
+explanation and calculation method; cosine compares get_embedding() vectors.
+Row vectors are embedded once and kept in the llm_cache store, the ranking
+falls back to lexical only when the embedding endpoint is unavailable.
+
+PINNED_FIELDS and every field named verbatim in the query are always kept,
+and a group note such as "data.clients.[...]" follows any kept field under it.
+"""
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from config import get_embedding
+from field_catalog import ALL_FIELD_CSV, get_field_catalog
+from llm_cache import LLM_CACHE_ENABLED, get_llm_store
+
+#===================================================================
+# Field retrieval config
+#===================================================================
+TOP_K_FIELDS = int(os.environ.get("TOP_K_FIELDS", "15"))
+PINNED_FIELDS = ("@timestamp", "site", "mode")
+LEXICAL_WEIGHT = 0.5
+NAME_WEIGHT = 3                 # field name tokens count this many times in bm25
+BM25_K1 = 1.2
+BM25_B = 0.75
+GROUP_SUFFIX = ".[...]"
+TEXT_COLUMNS = ["Explanation", "Calculation Method and Data Extraction Method"]
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "each", "for", "from", "in", "is", "it",
+    "of", "on", "or", "per", "should", "that", "the", "this", "to", "when", "with", "using",
+}
+
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens; camelCase and dotted names are split into their parts."""
+    words = _CAMEL_RE.sub(" ", str(text))
+    return [t.lower() for t in _TOKEN_RE.findall(words) if t.lower() not in STOPWORDS]
+
+
+def _field_name(value) -> Optional[str]:
+    if pd.isna(value) or not str(value).strip():
+        return None
+    return str(value).strip()
+
+
+class FieldRetriever:
+    def __init__(self, df: pd.DataFrame, embeddings=None):
+        self.fields: List[str] = []
+        self.texts: List[str] = []
+        docs: List[List[str]] = []
+        for _, row in df.iterrows():
+            field = _field_name(row.get("Field"))
+            if field is None or field in self.fields:
+                continue
+            text = " ".join(str(row[c]) for c in TEXT_COLUMNS if c in df.columns and pd.notna(row[c]))
+            self.fields.append(field)
+            self.texts.append(f"{field}: {text}")
+            docs.append(tokenize(field) * NAME_WEIGHT + tokenize(text))
+
+        self._tf = [Counter(d) for d in docs]
+        self._len = np.array([len(d) for d in docs], dtype=float)
+        self._avg_len = float(self._len.mean()) if len(docs) else 0.0
+        df_counts = Counter(t for d in docs for t in set(d))
+        n = len(docs)
+        self._idf = {t: math.log(1 + (n - c + 0.5) / (c + 0.5)) for t, c in df_counts.items()}
+
+        self._embeddings = embeddings
+        self._embedding_failed = False
+        self._doc_vectors: Optional[np.ndarray] = None
+        self._query_vectors: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_csv(cls, file_path: str = ALL_FIELD_CSV, embeddings=None) -> "FieldRetriever":
+        return cls(get_field_catalog(file_path).table, embeddings=embeddings)
+
+    # ---------- scoring ---------------------------------------------------------------
+    def lexical_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.fields))
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in enumerate(self._tf):
+                f = tf.get(term, 0)
+                if f:
+                    norm = 1 - BM25_B + BM25_B * self._len[i] / self._avg_len
+                    scores[i] += idf * f * (BM25_K1 + 1) / (f + BM25_K1 * norm)
+        return scores
+
+    def _embedder(self):
+        if self._embeddings is None:
+            self._embeddings = get_embedding()
+        return self._embeddings
+
+    def _vectors(self) -> np.ndarray:
+        """Row vectors, embedded once per row text and kept in the llm_cache store across runs."""
+        if self._doc_vectors is None:
+            store = get_llm_store() if LLM_CACHE_ENABLED else {}
+            keys = ["field-embedding:" + hashlib.sha256(t.encode("utf-8")).hexdigest() for t in self.texts]
+            vectors = [store.get(k) for k in keys]
+            missing = [i for i, v in enumerate(vectors) if v is None]
+            if missing:
+                embedded = self._embedder().embed_documents([self.texts[i] for i in missing])
+                for i, vector in zip(missing, embedded):
+                    vectors[i] = vector
+                    store[keys[i]] = vector
+            matrix = np.array(vectors, dtype=float)
+            self._doc_vectors = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        return self._doc_vectors
+
+    def semantic_scores(self, query: str) -> Optional[np.ndarray]:
+        """Cosine similarity per field, None when embeddings are unavailable (lexical ranking only)."""
+        if self._embedding_failed or not self.fields:
+            return None
+        try:
+            vector = self._query_vectors.get(query)
+            if vector is None:
+                vector = np.array(self._embedder().embed_query(query), dtype=float)
+                vector = vector / np.linalg.norm(vector)
+                self._query_vectors[query] = vector
+            return self._vectors() @ vector
+        except Exception as e:
+            print(f"[field_retrieval] embeddings unavailable, lexical ranking only: {e}")
+            self._embedding_failed = True
+            return None
+
+    def scores(self, query: str) -> Dict[str, float]:
+        """Hybrid score per lower-cased field name."""
+        lexical = self.lexical_scores(query)
+        if lexical.max(initial=0.0) > 0:
+            lexical = lexical / lexical.max()
+        semantic = self.semantic_scores(query)
+        if semantic is None:
+            combined = lexical
+        else:
+            combined = LEXICAL_WEIGHT * lexical + (1 - LEXICAL_WEIGHT) * np.clip(semantic, 0.0, 1.0)
+        return {f.lower(): s for f, s in zip(self.fields, combined.tolist())}
+
+    # ---------- selection -------------------------------------------------------------
+    def mentioned(self, query: str, candidates: Iterable[str]) -> List[str]:
+        """Candidates named verbatim in the query (a DSL, a confirmed field list, ...)."""
+        lowered = query.lower()
+        found = []
+        for field in candidates:
+            name = field.lower()
+            if name.endswith(GROUP_SUFFIX):
+                continue
+            if re.search(r"(?<![\w.@])" + re.escape(name) + r"(?![\w])", lowered):
+                found.append(field)
+        return found
+
+    def top_k(
+        self,
+        query: str,
+        k: int = TOP_K_FIELDS,
+        pinned: Sequence[str] = PINNED_FIELDS,
+        candidates: Optional[Sequence[str]] = None,
+    ) -> List[str]:
+        """
+        Names of the selected fields: pinned and mentioned fields first, then the
+        k best scoring candidates (default: every indexed field).
+        """
+        candidates = list(candidates) if candidates is not None else list(self.fields)
+        by_lower = {c.lower(): c for c in candidates}
+        keep = [by_lower[p.lower()] for p in pinned if p.lower() in by_lower]
+        keep += [f for f in self.mentioned(query, candidates) if f not in keep]
+
+        scores = self.scores(query)
+        ranked = sorted(
+            (c for c in candidates if c not in keep and not c.endswith(GROUP_SUFFIX)),   # group notes follow their fields
+            key=lambda c: scores.get(c.lower(), 0.0),
+            reverse=True,
+        )
+        return keep + ranked[:k]
+
+
+def select_rows(
+    df: pd.DataFrame,
+    query: str,
+    k: int = TOP_K_FIELDS,
+    pinned: Sequence[str] = PINNED_FIELDS,
+    retriever: Optional[FieldRetriever] = None,
+) -> pd.DataFrame:
+    """
+    Rows of a field table (all_field.csv or a brand filtered copy) relevant to
+    query, in their original order. Rows without a field name are kept as notes.
+    """
+    retriever = retriever or get_field_retriever()
+    names = [_field_name(v) for v in df["Field"]]
+    candidates = list(dict.fromkeys(n for n in names if n is not None))
+    keep = {f.lower() for f in retriever.top_k(query, k=k, pinned=pinned, candidates=candidates)}
+
+    groups = [n for n in candidates if n.endswith(GROUP_SUFFIX)]
+    for group in groups:
+        prefix = group[: -len(GROUP_SUFFIX)].lower() + "."
+        if any(f.startswith(prefix) for f in keep):
+            keep.add(group.lower())
+
+    mask = [n is None or n.lower() in keep for n in names]
+    return df[mask]
+
+
+_retrievers: Dict[str, tuple] = {}
+
+
+def get_field_retriever(csv_path: str = ALL_FIELD_CSV) -> FieldRetriever:
+    """One retriever per field catalog, rebuilt when the CSV changes on disk."""
+    catalog = get_field_catalog(csv_path)
+    cached = _retrievers.get(csv_path)
+    if cached is None or cached[0] is not catalog:
+        cached = (catalog, FieldRetriever(catalog.table))
+        _retrievers[csv_path] = cached
+    return cached[1]
@@ -2,39 +2,27 @@ import pandas as pd
 import json
 import pandas as pd
 from config import mapping_dir
+from field_catalog import FieldCatalog, get_brand_view
+from customer_directory import customer_directory
+from artifact_store import atomic_write
 import os
 
 def classify_brand(customer_name):
     """
     To classify the wifi brand of current customer
+    (case-insensitive, close spellings accepted; see customer_directory)
     """
-    df = pd.read_excel(os.path.join(mapping_dir, "wifi_customer_brand.xlsx"))
-    
-    df["Customer"] = df["Customer"].str.lower()
-    brand_lookup = dict(zip(df["Customer"], df["WifiBrand"]))
-    print(f"brand_lookup: {brand_lookup}")
-    print(f"customer_name: {customer_name}")    
-    brand = brand_lookup.get(customer_name.lower())
-    print(brand)
+    brand = customer_directory.brand(customer_name)
+    print(f"customer_name: {customer_name}, brand: {brand}")
     return brand
 
 
-def filter_field_description(brand: str, input_csv: str = "all_field.csv", output_csv: str = "filter_field_description.csv"):
+def filter_field_description(brand: str) -> FieldCatalog:
     """
-    based on current customer's wifi brand, to filter "all_field.csv".
+    based on current customer's wifi brand, the in-memory view of "all_field.csv"
+    (FieldSetID 0 + the brand's set). Nothing is written, so sessions of different brands do not collide.
     """
-    input_csv = os.path.join(mapping_dir, input_csv)
-    output_csv = os.path.join(mapping_dir, output_csv)    
-    df = pd.read_csv(input_csv)
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '') 
-    df["FieldSetID"] = pd.to_numeric(df["FieldSetID"], errors="coerce")
-
-    if brand == "HUAWEI":
-        df = df[df["FieldSetID"].isin([0, 1])]
-    elif brand == "ARUBA":
-        df = df[df["FieldSetID"].isin([0, 2])]
-
-    df.to_csv(output_csv, index=False)
+    return get_brand_view(brand)
 
 def make_combined_json(output_file=None, **kwargs):
     """
@@ -131,6 +119,9 @@ def stream_data(data: str,time_sleep: float = 0.005):
 
 from typing import Union
 from pathlib import Path
+from es_client import es_url, es_auth, MAX_CONNECTIONS, MAX_KEEPALIVE_CONNECTIONS, KEEPALIVE_EXPIRY, CONNECT_TIMEOUT
+import inspect
+import time_slice
 
 def write_export_script(
     customer_name: str,
@@ -151,6 +142,9 @@ def write_export_script(
         except json.JSONDecodeError:
             raise ValueError("`query` must be dict or valid JSON_str。")
 
+    # time-slice planner/merger is stdlib only: inline it so the script stays standalone
+    time_slice_source = inspect.getsource(time_slice)
+
     # gen script
     script = f'''# -*- coding: utf-8 -*-
 """
@@ -159,38 +153,48 @@ Auto-generated OpenSearch aggregation exporter.
 Usage:
     python {{__file__}}                          
     python {{__file__}} --customer HKJC --excel out.xlsx --query-file q.json
+    python {{__file__}} --time-slices 4     # split a long @timestamp range into parallel requests
 """
 import json
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Union
 import pandas as pd
-import requests
-from requests.auth import HTTPBasicAuth
+import httpx
 import argparse
 import sys
 
-def site_agg_to_excel(
-    query_str: Union[str, Dict],
-    customer_name: str,
-    excel_path: Optional[Union[str, Path]] = None,
-) -> Tuple[str, pd.DataFrame]:
-    index_name = f"{{customer_name.lower()}}-*"
-    es_url = "https://jumphost.hkt-ems.com:443"
-    auth = HTTPBasicAuth("internship", "P@ssw0rd")  
-    headers = {{"Content-Type": "application/json"}}
-    search_url = f"{{es_url}}/{{index_name}}/_search"
+ES_URL = {json.dumps(es_url)}
+ES_AUTH = {tuple(es_auth)!r}
+
+_client: Optional[httpx.Client] = None
+
+def get_client() -> httpx.Client:
+    """Shared pooled client, keep-alive across queries of one run."""
+    global _client
+    if _client is None:
+        _client = httpx.Client(
+            base_url=ES_URL,
+            auth=ES_AUTH,
+            headers={{"Content-Type": "application/json"}},
+            verify=False,
+            limits=httpx.Limits(
+                max_connections={MAX_CONNECTIONS},
+                max_keepalive_connections={MAX_KEEPALIVE_CONNECTIONS},
+                keepalive_expiry={KEEPALIVE_EXPIRY},
+            ),
+            timeout=httpx.Timeout(60.0, connect={CONNECT_TIMEOUT}),
+        )
+    return _client
+
+# ---------- time slices (inlined from time_slice.py) ----------
+{time_slice_source}
+# ---------- end of time slices ----------
 
+def _search(search_url: str, query_str: Union[str, Dict]) -> Dict:
     payload = query_str if isinstance(query_str, str) else json.dumps(query_str, ensure_ascii=False)
 
     try:
-        resp = requests.get(
-            search_url,
-            auth=auth,
-            headers=headers,
-            data=payload,
-            verify=False,   
-            timeout=60,
-        )
+        resp = get_client().request("GET", search_url, content=payload)
     except Exception as e:
         raise RuntimeError(f"Failed to query OpenSearch: {{e}}") from e
 
@@ -198,10 +202,25 @@ def site_agg_to_excel(
         raise RuntimeError(f"Request failed: {{resp.status_code}} {{resp.text}}")
 
     try:
-        result = resp.json()
+        return resp.json()
     except Exception as e:
         raise ValueError(f"Response is not valid JSON: {{e}}") from e
 
+def site_agg_to_excel(
+    query_str: Union[str, Dict],
+    customer_name: str,
+    excel_path: Optional[Union[str, Path]] = None,
+    time_slices: int = 0,
+) -> Tuple[str, pd.DataFrame]:
+    index_name = f"{{customer_name.lower()}}-*"
+    search_url = f"/{{index_name}}/_search"
+
+    plan = plan_time_slices(query_str, time_slices) if time_slices > 1 else None
+    if plan is not None:
+        result = run_sliced_sync(plan, lambda body: _search(search_url, body))
+    else:
+        result = _search(search_url, query_str)
+
     def _walk_agg(node: Dict, path: Dict, rows: List[Dict]):
         for agg_name, agg_val in (node or {{}}).items():
             if isinstance(agg_val, dict) and "buckets" in agg_val:
@@ -249,6 +268,7 @@ def main(argv=None):
     parser.add_argument("--customer", type=str, default=DEFAULT_CUSTOMER, help="customer_name (default: embedded)")
     parser.add_argument("--excel", type=str, default=DEFAULT_EXCEL, help="excel output path (default: embedded)")
     parser.add_argument("--query-file", type=str, default=None, help="path to JSON file as query body (optional)")
+    parser.add_argument("--time-slices", type=int, default=0, help="split the @timestamp range into N concurrent requests (0: off)")
     args = parser.parse_args(argv)
 
     # query-file first, otherwise DEFAULT_QUERY_JSON
@@ -258,13 +278,12 @@ def main(argv=None):
     else:
         query_obj = json.loads(DEFAULT_QUERY_JSON)
 
-    excel_file, _df = site_agg_to_excel(query_obj, args.customer, args.excel)
+    excel_file, _df = site_agg_to_excel(query_obj, args.customer, args.excel, args.time_slices)
     print(f"Exported to: {{excel_file}}")
 
 if __name__ == "__main__":
     sys.exit(main())
 '''
     out_path = Path(out_path)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(script, encoding="utf-8")
+    atomic_write(str(out_path), script)
     return str(out_path.resolve())
\ No newline at end of file
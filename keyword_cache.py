@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from es_client import es_request, index_pattern
+from mapping_cache import mapping_cache
+
+#===================================================================
+# Keyword cache config
+#===================================================================
+KEYWORD_TTL = 15 * 60             # fresh: served without touching the cluster
+KEYWORD_STALE_TTL = 24 * 3600     # stale: served at once, refreshed in background
+KEYWORD_SIZE = 10000
+WARMUP_TIMEOUT = 120
+
+
+def keyword_field(field_name: str) -> str:
+    """Field used for the terms aggregation (same rule as get_keyword)."""
+    if "keyword" not in field_name:
+        return field_name + ".keyword"
+    return field_name
+
+
+def _terms_body(field_name: str) -> dict:
+    return {
+        "size": 0,
+        "aggs": {
+            "all_values": {
+                "terms": {
+                    "field": field_name,
+                    "size": KEYWORD_SIZE
+                }
+            }
+        }
+    }
+
+
+def _bucket_keys(result: dict) -> List:
+    buckets = result.get("aggregations", {}).get("all_values", {}).get("buckets", [])
+    return [bucket["key"] for bucket in buckets]
+
+
+class KeywordCache:
+    """
+    Per-(customer, field) cache of keyword values with stale-while-revalidate.
+
+    - age < KEYWORD_TTL:            return cached values
+    - age < KEYWORD_STALE_TTL:      return cached values, refresh in background
+    - otherwise / missing:          query the cluster (one in-flight query per key)
+    """
+
+    def __init__(self, ttl: int = KEYWORD_TTL, stale_ttl: int = KEYWORD_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: Dict[Tuple[str, str], Tuple[List, float]] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    @staticmethod
+    def make_key(customer_name: str, field_name: str) -> Tuple[str, str]:
+        return index_pattern(customer_name), keyword_field(field_name)
+
+    async def _fetch(self, key: Tuple[str, str]) -> List:
+        index, field_name = key
+        response = await es_request("GET", f"/{index}/_search", body=_terms_body(field_name), timeout=30)
+        response.raise_for_status()
+        values = _bucket_keys(response.json())
+        self._entries[key] = (values, time.time())
+        return values
+
+    def _task_for(self, key: Tuple[str, str]) -> asyncio.Task:
+        """Return the running fetch of key, start one if none (tasks of closed loops are dropped)."""
+        task = self._inflight.get(key)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.create_task(self._fetch(key))
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+            self._inflight[key] = task
+        return task
+
+    def _forget(self, key: Tuple[str, str], task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()    # mark background refresh errors as retrieved
+
+    async def get(self, customer_name: str, field_name: str) -> List:
+        key = self.make_key(customer_name, field_name)
+        entry = self._entries.get(key)
+        if entry is not None:
+            values, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                return values
+            if age < self.stale_ttl:
+                self._task_for(key)
+                return values
+        return await asyncio.shield(self._task_for(key))
+
+    async def warm_up(
+        self,
+        customer_name: str,
+        fields: Optional[List[str]] = None,
+        mapping_path: Optional[str] = None,
+    ) -> int:
+        """
+        Load all keyword fields of a customer with one _msearch.
+        Fields default to the "keyword" entries of the customer's own flattened mapping
+        (mapping_cache, or the file at mapping_path), never a file another customer wrote.
+        Return the number of fields cached; errors are swallowed (warm-up is best effort).
+        """
+        try:
+            if fields is None and mapping_path:
+                with open(mapping_path, "r", encoding="utf-8") as f:
+                    mapping = json.load(f)
+                fields = [field for field, field_type in mapping.items() if field_type == "keyword"]
+            elif fields is None:
+                mapping = (await mapping_cache.get(customer_name))["flattened"]
+                fields = [field for field, field_type in mapping.items() if field_type == "keyword"]
+            keys = list(dict.fromkeys(self.make_key(customer_name, field) for field in fields))
+            if not keys:
+                return 0
+
+            lines = []
+            for index, field_name in keys:
+                lines.append(json.dumps({"index": index}))
+                lines.append(json.dumps(_terms_body(field_name), ensure_ascii=False))
+            body = "\n".join(lines) + "\n"
+
+            response = await es_request(
+                "GET", "/_msearch", body=body, timeout=WARMUP_TIMEOUT,
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+            response.raise_for_status()
+
+            now = time.time()
+            cached = 0
+            for key, result in zip(keys, response.json().get("responses", [])):
+                if "error" in result:
+                    continue
+                self._entries[key] = (_bucket_keys(result), now)
+                cached += 1
+            return cached
+        except Exception as e:
+            print(f"Keyword warm-up failed: {e}")
+            return 0
+
+    def invalidate(self, customer_name: Optional[str] = None):
+        """Drop the entries of one customer, or everything."""
+        if customer_name is None:
+            self._entries.clear()
+            return
+        index = index_pattern(customer_name)
+        for key in [k for k in self._entries if k[0] == index]:
+            self._entries.pop(key, None)
+
+
+keyword_cache = KeywordCache()
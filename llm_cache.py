@@ -0,0 +1,277 @@
+"""
+Memoized LLM responses for deterministic (temperature 0) calls.
+
+CachedChatCompletionClient wraps an AutoGen ChatCompletionClient,
+LangChainLLMCache plugs the same store into LangChain models (ES_Query.py).
+Both share one diskcache directory (size bounded, least-recently-used eviction)
+and one LLMCacheStats counter.
+
+AutoGen key = sha256(model, temperature, messages, tools, json_output, extra args).
+The messages include the system message and the memory contents, because
+AssistantAgent adds memory to the model context before calling create().
+
+Inside fresh_completions() (a pipeline stage retry) cached answers are not
+read: the same temperature-0 answer would fail the same way again. The new
+answer replaces the cached one.
+"""
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Dict, Iterator, Literal, Mapping, Optional, Sequence, Union
+
+import diskcache
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from pydantic import BaseModel
+
+#===================================================================
+# LLM cache config
+#===================================================================
+LLM_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache")
+LLM_CACHE_SIZE = 256 * 1024 * 1024
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+
+
+class LLMCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+            "saved_prompt_tokens": self.saved_prompt_tokens,
+            "saved_completion_tokens": self.saved_completion_tokens,
+        }
+
+
+llm_cache_stats = LLMCacheStats()
+_stores: Dict[str, diskcache.Cache] = {}
+_skip_reads: ContextVar[bool] = ContextVar("llm_cache_skip_reads", default=False)
+
+
+@contextmanager
+def fresh_completions(enabled: bool = True) -> Iterator[None]:
+    """Skip cache reads (writes still happen) in this context and the tasks it starts."""
+    token = _skip_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _skip_reads.reset(token)
+
+
+def get_llm_store(directory: str = LLM_CACHE_DIR, size_limit: int = LLM_CACHE_SIZE) -> diskcache.Cache:
+    """One diskcache per directory, shared by every wrapper in the process."""
+    if directory not in _stores:
+        _stores[directory] = diskcache.Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+    return _stores[directory]
+
+
+class CachedChatCompletionClient(ChatCompletionClient):
+    """
+    Drop-in ChatCompletionClient: answers repeated requests from the disk cache
+    (zero tokens, no model latency) and forwards the rest to `client`.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        model: str,
+        temperature: float = 0.0,
+        store: Optional[diskcache.Cache] = None,
+        stats: LLMCacheStats = llm_cache_stats,
+    ):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.store = store if store is not None else get_llm_store()
+        self.stats = stats
+
+    def _key(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema],
+        json_output: Optional[bool | type[BaseModel]],
+        extra_create_args: Mapping[str, Any],
+    ) -> str:
+        if isinstance(json_output, type) and issubclass(json_output, BaseModel):
+            json_output = json.dumps(json_output.model_json_schema())
+        data = {
+            "model": self.model,
+            "temperature": self.temperature,
+            "messages": [message.model_dump() for message in messages],
+            "tools": [(tool.schema if isinstance(tool, Tool) else tool) for tool in tools],
+            "json_output": json_output,
+            "extra_create_args": dict(extra_create_args),
+        }
+        text = json.dumps(data, sort_keys=True, default=str)
+        return "autogen:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[CreateResult]:
+        cached = None if _skip_reads.get() else self.store.get(key)
+        if cached is None:
+            self.stats.misses += 1
+            return None
+        result = CreateResult.model_validate(cached)
+        self.stats.hits += 1
+        self.stats.saved_prompt_tokens += result.usage.prompt_tokens
+        self.stats.saved_completion_tokens += result.usage.completion_tokens
+        # a hit costs nothing: models_usage and run totals must not count the original call again
+        return result.model_copy(update={"cached": True, "usage": RequestUsage(prompt_tokens=0, completion_tokens=0)})
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = self._key(messages, tools, json_output, extra_create_args)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        result = await self.client.create(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self.store.set(key, result.model_dump())
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        key = self._key(messages, tools, json_output, extra_create_args)
+        cached = self._lookup(key)
+        if cached is not None:
+            if isinstance(cached.content, str):
+                yield cached.content
+            yield cached
+            return
+        async for item in self.client.create_stream(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            if isinstance(item, CreateResult):
+                self.store.set(key, item.model_dump())
+            yield item
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self.client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self.client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self.client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.client.model_info
+
+
+def cached_client(client: ChatCompletionClient, model: str, temperature: float) -> ChatCompletionClient:
+    """Wrap only deterministic clients: sampled answers (temperature > 0) are meant to differ."""
+    if not LLM_CACHE_ENABLED or temperature != 0:
+        return client
+    return CachedChatCompletionClient(client, model=model, temperature=temperature)
+
+
+# ---------- LangChain ---------------------------------------------------------------
+try:
+    from langchain_core.caches import BaseCache
+except ImportError:  # optional: only ES_Query.py uses LangChain
+    BaseCache = object
+
+
+def _free_generation(gen, stats: LLMCacheStats):
+    """Copy of a cached ChatGeneration with zero token usage (the saved tokens go to stats)."""
+    message = getattr(gen, "message", None)
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return gen
+    stats.saved_prompt_tokens += usage.get("input_tokens", 0)
+    stats.saved_completion_tokens += usage.get("output_tokens", 0)
+    free = {**usage, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    return gen.model_copy(update={"message": message.model_copy(update={"usage_metadata": free})})
+
+
+class LangChainLLMCache(BaseCache):
+    """
+    LangChain cache on the same store. llm_string already carries the model
+    name and temperature; prompt is the serialized message list.
+    """
+
+    def __init__(self, store: Optional[diskcache.Cache] = None, stats: LLMCacheStats = llm_cache_stats):
+        self.store = store if store is not None else get_llm_store()
+        self.stats = stats
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return "langchain:" + hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        cached = None if _skip_reads.get() else self.store.get(self._key(prompt, llm_string))
+        if cached is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return [_free_generation(gen, self.stats) for gen in cached]
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        self.store.set(self._key(prompt, llm_string), list(return_val))    # Generations are pickled by diskcache
+
+    def clear(self, **kwargs: Any) -> None:
+        for key in list(self.store.iterkeys()):
+            if str(key).startswith("langchain:"):
+                self.store.delete(key)
+
+
+def get_langchain_cache() -> Optional[LangChainLLMCache]:
+    return LangChainLLMCache() if LLM_CACHE_ENABLED else None
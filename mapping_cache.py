@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from config import mapping_dir
+from es_client import es_request, index_pattern
+
+#===================================================================
+# Mapping cache config
+#===================================================================
+VERSION_CHECK_INTERVAL = 60     # seconds an in-memory entry is trusted without a version check
+
+
+class MappingCacheError(Exception):
+    """Raised when the cluster can not provide a mapping."""
+
+
+class MappingCache:
+    """
+    Per-customer cache of the raw and flattened index mapping, in memory and on disk.
+
+    An entry is keyed on a version: the hash of the customer's index set
+    (`_cat/indices`, names + uuids). Checking the version is a tiny request;
+    the full `_mapping` is only downloaded when the index set changes.
+    """
+
+    def __init__(self, cache_dir: str = os.path.join(mapping_dir, "cache")):
+        self.cache_dir = cache_dir
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._checked_at: Dict[str, float] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, index: str) -> str:
+        safe_name = index.replace("*", "_all").replace("/", "_")
+        return os.path.join(self.cache_dir, f"{safe_name}.json")
+
+    def _load(self, index: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(index)
+        if entry is not None:
+            return entry
+        try:
+            with open(self._entry_path(index), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self._entries[index] = entry
+        return entry
+
+    def _store(self, index: str, entry: Dict[str, Any]):
+        self._entries[index] = entry
+        path = self._entry_path(index)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    async def fetch_version(index: str) -> str:
+        """Hash of the index set behind an index pattern."""
+        response = await es_request("GET", f"/_cat/indices/{index}?h=index,uuid&format=json", timeout=10)
+        response.raise_for_status()
+        indices = sorted(f"{row.get('index')}:{row.get('uuid')}" for row in response.json())
+        return hashlib.sha256("\n".join(indices).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    async def _fetch_mapping(index: str) -> Dict[str, Any]:
+        from tool import flatten_es_mapping
+
+        response = await es_request("GET", f"/{index}/_mapping")
+        if response.status_code != 200:
+            raise MappingCacheError(f"Request failed with status {response.status_code}: {response.text}")
+        full_result = response.json()
+        if not full_result:
+            raise MappingCacheError("Mapping returned empty.")
+        first_index = list(full_result.keys())[0]
+        mapping_result = {first_index: full_result[first_index]}
+        return {"raw": mapping_result, "flattened": flatten_es_mapping(mapping_result)}
+
+    async def get(self, customer_name: str) -> Dict[str, Any]:
+        """
+        Return {"version", "raw", "flattened"} of a customer.
+        Recently checked entries are returned as they are; older ones are
+        revalidated with fetch_version before the mapping is downloaded again.
+        """
+        index = index_pattern(customer_name)
+        entry = self._load(index)
+        if entry is not None and time.time() - self._checked_at.get(index, 0) < VERSION_CHECK_INTERVAL:
+            return entry
+
+        version = await self.fetch_version(index)
+        self._checked_at[index] = time.time()
+        if entry is not None and entry.get("version") == version:
+            return entry
+
+        entry = {"version": version, **await self._fetch_mapping(index)}
+        self._store(index, entry)
+        return entry
+
+    def invalidate(self, customer_name: Optional[str] = None):
+        """Drop one customer's entry (or all) from memory and disk."""
+        if customer_name is None:
+            self._entries.clear()
+            self._checked_at.clear()
+            paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+        else:
+            index = index_pattern(customer_name)
+            self._entries.pop(index, None)
+            self._checked_at.pop(index, None)
+            paths = [self._entry_path(index)]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+mapping_cache = MappingCache()
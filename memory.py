@@ -1,11 +1,14 @@
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Sequence, Union
 import pandas as pd
 import os
 import json
 import requests
 from requests.auth import HTTPBasicAuth
 from config import mapping_dir
+from customer_directory import CUSTOMER_COLUMN, CUSTOMER_XLSX, CustomerDirectory, customer_directory
+from field_catalog import FieldCatalog, as_catalog, render_rows
+from field_retrieval import TOP_K_FIELDS, PINNED_FIELDS, select_rows
 
 
 def get_customer(filename: str = "customer.xlsx", customer_column: str = "customer") -> str:
@@ -21,61 +24,51 @@ def get_customer(filename: str = "customer.xlsx", customer_column: str = "custom
     """
     excel_path = os.path.join(mapping_dir, filename)
     try:
-        df = pd.read_excel(excel_path)
-        if customer_column not in df.columns:
-            raise ValueError(f"column '{customer_column}' is not exist. Only: {list(df.columns)}")
-        customers = df[customer_column].dropna().unique().tolist()
-        formatted_output = "customer options: \n" + "\n".join(f"- {c}" for c in customers)
-        return formatted_output
+        # 工作簿只在文件变化时重新解析（customer_directory）
+        if excel_path == CUSTOMER_XLSX and customer_column == CUSTOMER_COLUMN:
+            return customer_directory.options_text()
+        return CustomerDirectory(customer_path=excel_path, customer_column=customer_column).options_text()
     except Exception as e:
         return (f": {e}")
     
 
 def field_description(
-    file_path: str,
+    file_path: Union[str, FieldCatalog],
     columns: list[str],
     item_sep: str = ", ",
     row_sep: str = "\n",
-    encoding: str = "ISO-8859-1",
 ) -> str:
     """
     读取 CSV，将选定列的非空内容拼成一个纯文本字符串。
+    CSV 只解析一次（field_catalog），同样的列组合直接返回缓存的文本。
 
-    :param file_path: CSV 文件路径
+    :param file_path: CSV 文件路径，或字段视图（get_brand_view）
     :param columns:   需要拼接的列名列表
     :param item_sep:  同一行内各列之间的分隔符
     :param row_sep:   行与行之间的分隔符
-    :param encoding:  文件编码
     :return:          拼接后的字符串
     """
-    # 读取 CSV
-    df = pd.read_csv(file_path, encoding=encoding)
+    return as_catalog(file_path).text(columns, item_sep, row_sep)
 
-    # 清理空行空列
-    df.dropna(how="all", axis=0, inplace=True)
-    df.dropna(how="all", axis=1, inplace=True)
 
-    # 仅保留存在且需要的列
-    valid_cols = [c for c in columns if c in df.columns]
-    if not valid_cols:
-        return ""        # 没有任何合法列，直接返回空串
-
-    df = df[valid_cols]
-
-    # 将每行转成字符串
-    row_strings: list[str] = []
-    for _, row in df.iterrows():
-        # 只收集非空字段
-        parts = [
-            f"{col}{item_sep.split(':')[0]}{row[col]}"  # 保留 “列名: 值” 形式
-            if len(item_sep.split(":")) == 2 else f"{row[col]}"
-            for col in valid_cols
-            if pd.notna(row[col])
-        ]
-        if parts:
-            row_strings.append(item_sep.join(parts))
+def relevant_field_description(
+    query: str,
+    file_path: Union[str, FieldCatalog],
+    columns: list[str],
+    k: int = TOP_K_FIELDS,
+    pinned: Sequence[str] = PINNED_FIELDS,
+    item_sep: str = ", ",
+    row_sep: str = "\n",
+) -> str:
+    """
+    同 field_description，但只保留与 query 最相关的 k 个字段（field_retrieval）。
+    pinned 字段和 query 中直接出现的字段总是保留。
 
-    # 拼成整体字符串
-    all_fields = row_sep.join(row_strings)
-    final = all_fields
-    return final
\ No newline at end of file
+    :param query:     需求 / summary / DSL 文本
+    :param k:         保留的字段数（不含 pinned）
+    :param pinned:    必须保留的字段
+    """
+    catalog = as_catalog(file_path)
+    if not query or "Field" not in catalog.table.columns:
+        return catalog.text(columns, item_sep, row_sep)
+    return render_rows(select_rows(catalog.table, query, k=k, pinned=pinned), columns, item_sep, row_sep)
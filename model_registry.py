@@ -0,0 +1,121 @@
+"""
+Shared model clients.
+
+model_config.yaml is parsed once per path. Clients are handed out per
+(event loop, config section, temperature) and all clients of one section share
+one httpx connection pool, so building a team no longer opens new sockets to
+the model endpoint. MODEL_MAX_CONNECTIONS bounds the concurrent requests per
+deployment; aclose_model_clients() releases the pools of the running loop.
+"""
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import yaml
+from autogen_core.models import ChatCompletionClient
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+
+from llm_cache import cached_client
+
+#===================================================================
+# Model client pool config
+#===================================================================
+MODEL_MAX_CONNECTIONS = 8           # concurrent requests per deployment, more wait for a connection
+MODEL_MAX_KEEPALIVE_CONNECTIONS = 8
+MODEL_KEEPALIVE_EXPIRY = 60.0
+MODEL_TIMEOUT = 120.0
+MODEL_CONNECT_TIMEOUT = 10.0
+
+LoopKey = Optional[asyncio.AbstractEventLoop]
+
+
+def _loop_key() -> LoopKey:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None         # built at import time (outside any loop)
+
+
+class ModelRegistry:
+    def __init__(self, config_path: str = "model_config.yaml"):
+        self.config_path = config_path
+        self._config: Optional[Dict[str, Any]] = None
+        self._pools: Dict[Tuple[LoopKey, str], httpx.AsyncClient] = {}
+        self._clients: Dict[Tuple[LoopKey, str, Optional[float]], ChatCompletionClient] = {}
+
+    def config(self, section: str) -> Dict[str, Any]:
+        if self._config is None:
+            with open(self.config_path, "r") as f:
+                self._config = yaml.safe_load(f)
+        return self._config[section]
+
+    def _prune(self):
+        """Forget pools and clients of event loops that are closed (Streamlit reruns)."""
+        for key in [k for k in self._pools if k[0] is not None and k[0].is_closed()]:
+            self._pools.pop(key, None)
+        for key in [k for k in self._clients if k[0] is not None and k[0].is_closed()]:
+            self._clients.pop(key, None)
+
+    def http_pool(self, section: str) -> httpx.AsyncClient:
+        key = (_loop_key(), section)
+        pool = self._pools.get(key)
+        if pool is None or pool.is_closed:
+            pool = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=MODEL_MAX_CONNECTIONS,
+                    max_keepalive_connections=MODEL_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=MODEL_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(MODEL_TIMEOUT, connect=MODEL_CONNECT_TIMEOUT),
+            )
+            self._pools[key] = pool
+        return pool
+
+    def get(self, section: str = "azure", temperature: Optional[float] = None) -> ChatCompletionClient:
+        """Shared client of a config section; temperature None keeps the deployment default."""
+        self._prune()
+        key = (_loop_key(), section, temperature)
+        client = self._clients.get(key)
+        pool = self._pools.get(key[:2])
+        if client is not None and pool is not None and not pool.is_closed:
+            return client
+
+        cfg = self.config(section)
+        kwargs: Dict[str, Any] = dict(
+            azure_deployment=cfg["deployment"],
+            model=cfg["model"],
+            api_version=cfg["api_version"],
+            azure_endpoint=cfg["endpoint"],
+            api_key=cfg["api_key"],
+            model_info=cfg["model_info"],
+            http_client=self.http_pool(section),
+        )
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        client = AzureOpenAIChatCompletionClient(**kwargs)
+        if temperature is not None:
+            client = cached_client(client, model=cfg["model"], temperature=temperature)
+        self._clients[key] = client
+        return client
+
+    async def aclose(self):
+        """Close the connection pools of the running loop (call when a run ends)."""
+        loop = _loop_key()
+        for key in [k for k in self._clients if k[0] is loop]:
+            self._clients.pop(key, None)
+        for key in [k for k in self._pools if k[0] is loop]:
+            await self._pools.pop(key).aclose()
+
+
+_registries: Dict[str, ModelRegistry] = {}
+
+
+def get_registry(config_path: str = "model_config.yaml") -> ModelRegistry:
+    if config_path not in _registries:
+        _registries[config_path] = ModelRegistry(config_path)
+    return _registries[config_path]
+
+
+async def aclose_model_clients():
+    for registry in _registries.values():
+        await registry.aclose()
@@ -0,0 +1,651 @@
+"""
+Headless report pipeline: Req -> Cache/History -> Field -> DSL -> Execute -> Export.
+
+The stages form an async DAG. A stage starts as soon as its dependencies have
+finished, so independent stages overlap (the speculative fast DSL runs next to
+the history check). Every stage has a typed output, a timeout, a retry budget
+and an optional process-wide concurrency limit.
+
+    inputs = PipelineInput(customer_name="HKJC", requirement={...}, mode="fast")
+    async for event in report_pipeline(inputs).run_stream(inputs):
+        ...                                 # PipelineEvent(stage, kind, data)
+
+    run = await report_pipeline(inputs).run(inputs)
+    run.output("export").report_path, run.usage, run.timings
+
+Event kinds: started, message, info, retry, completed, skipped, cancelled,
+failed; the last event is stage "pipeline" with kind completed or failed.
+run_team.py (Streamlit) is one consumer of this stream.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+from autogen_agentchat.messages import TextMessage
+from autogen_core import CancellationToken
+from langchain_core.callbacks import get_usage_metadata_callback
+
+from artifact_store import Namespace, artifact_store, atomic_write_json, mapping_path, use_namespace
+from customer_directory import customer_directory
+from DSLTeam import get_DSLteam
+from ES_Query import agenerate_elasticsearch_query_from_natural_language
+from ExecuteTeam import get_Exeteam
+from FieldTeam import get_fieldTeam
+from field_catalog import FieldCatalog
+from function import classify_brand, extract_json_string, filter_field_description, write_export_script
+from HistoryMatchTeam import get_HistoryMatchTeam
+from keyword_cache import keyword_cache
+from llm_cache import fresh_completions
+from RAG import query_dsl_examples
+from ReqTeam import get_Reqteam
+from requirement_cache import requirement_cache
+from tool import agg_json_to_excel, get_flattened_mapping
+
+#===================================================================
+# Pipeline config
+#===================================================================
+STAGE_TIMEOUTS = {          # seconds per attempt
+    "req": 900,
+    "cache": 60,
+    "history": 300,
+    "fast_dsl": 300,
+    "field": 300,
+    "dsl": 300,
+    "execute": 600,
+    "export": 300,
+}
+STAGE_RETRIES = {"fast_dsl": 1, "field": 1, "dsl": 1, "execute": 1}
+STAGE_CONCURRENCY = {"execute": 4, "export": 2}     # running stages of that name per process
+RETRY_BACKOFF = 2.0         # seconds, doubled per retry
+REQ_MAX_TURNS = 8
+HISTORY_TOP_K = 3
+NO_HISTORY = "No such historical report"
+
+FINISHED = {"completed", "skipped", "cancelled", "failed"}
+
+
+class StageError(Exception):
+    """A stage failure that retrying cannot fix."""
+    retryable = False
+
+
+class RequirementNeedsInput(StageError):
+    """The requirement agents asked the user a question; headless runs cannot answer it."""
+
+
+# ---------- inputs / outputs ------------------------------------------------------------
+@dataclass
+class PipelineInput:
+    customer_name: str = ""
+    requirement: Optional[Dict[str, Any]] = None    # confirmed requirement JSON; None runs the Req agents on prompt
+    prompt: str = ""
+    mode: str = "fast"                              # "fast" | "thinking"
+    history_check: bool = True
+    speculative: bool = True                        # fast mode: write the DSL while history is checked
+    use_requirement_cache: bool = True
+    session_id: Optional[str] = None                # artifact namespace (Streamlit session, job); None is run_id
+    output_dir: Optional[str] = None                # DSL, report and script; None is the namespace
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+
+
+@dataclass
+class RequirementOutput:
+    requirement: Dict[str, Any]
+    requirement_text: str
+    summary: str
+    customer_name: str
+    brand: Optional[str]
+    fields: FieldCatalog
+    mapping: str
+
+
+@dataclass
+class HistoryOutput:
+    matched: bool
+    dsl: Optional[Dict[str, Any]] = None
+    source: str = "none"            # "cache" | "history" | "none"
+    score: Optional[float] = None
+
+
+@dataclass
+class FieldOutput:
+    field_list: str
+
+
+@dataclass
+class DSLOutput:
+    dsl: Dict[str, Any]
+    source: str                     # "cache" | "history" | "fast" | "thinking"
+
+
+@dataclass
+class ExecuteOutput:
+    dsl: Dict[str, Any]
+    json_path: str
+
+
+@dataclass
+class ExportOutput:
+    report_path: str
+    report_df: pd.DataFrame
+    report_bytes: bytes
+    dsl_path: str
+    script_path: str
+
+
+@dataclass
+class PipelineEvent:
+    run_id: str
+    stage: str
+    kind: str
+    data: Any = None
+    attempt: int = 1
+    at: float = field(default_factory=time.time)
+
+
+# ---------- engine ----------------------------------------------------------------------
+@dataclass
+class Stage:
+    name: str
+    run: Callable[["PipelineRun"], Awaitable[Any]]
+    deps: Tuple[str, ...] = ()
+    when: Optional[Callable[["PipelineRun"], bool]] = None
+    timeout: Optional[float] = None
+    retries: int = 0
+    concurrency: Optional[int] = None
+    optional: bool = False          # a failure does not stop the dependent stages (their input is None)
+
+
+_semaphores: Dict[Tuple[asyncio.AbstractEventLoop, str, int], asyncio.Semaphore] = {}
+
+
+def _semaphore(name: str, limit: int) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _semaphores if k[0].is_closed()]:
+        _semaphores.pop(key, None)
+    key = (loop, name, limit)
+    if key not in _semaphores:
+        _semaphores[key] = asyncio.Semaphore(limit)
+    return _semaphores[key]
+
+
+class PipelineRun:
+    """State of one run: inputs, stage outputs and statuses, the event queue."""
+
+    def __init__(self, inputs: PipelineInput, cancellation_token: Optional[CancellationToken] = None):
+        self.inputs = inputs
+        self.run_id = inputs.run_id
+        self.namespace: Namespace = artifact_store.namespace(inputs.session_id or inputs.run_id)
+        self.cancellation_token = cancellation_token or CancellationToken()
+        self.outputs: Dict[str, Any] = {}
+        self.status: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.queue: "asyncio.Queue[PipelineEvent]" = asyncio.Queue()
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        self.timings: Dict[str, float] = {}     # seconds per finished stage attempt chain
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+        self._blocked: Set[str] = set()         # skipped because a dependency failed
+
+    def add_usage(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.usage["prompt_tokens"] += prompt_tokens or 0
+        self.usage["completion_tokens"] += completion_tokens or 0
+
+    def emit(self, stage: str, kind: str, data: Any = None, attempt: int = 1):
+        self.queue.put_nowait(PipelineEvent(self.run_id, stage, kind, data, attempt))
+
+    def message(self, stage: str, source: str, content: str):
+        self.emit(stage, "message", {"source": source, "content": content})
+
+    def output(self, name: str) -> Any:
+        """Output of a completed stage, None otherwise."""
+        return self.outputs.get(name) if self.status.get(name) == "completed" else None
+
+    def cancel_stage(self, name: str):
+        """Cancel a running or pending stage (the loser of a speculative race)."""
+        self._cancelled.add(name)
+        task = self._tasks.get(name)
+        if task is not None and not task.done():
+            task.cancel()
+
+
+class Pipeline:
+    def __init__(self, stages: Sequence[Stage]):
+        self.stages = {s.name: s for s in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("duplicate stage names")
+        for stage in stages:
+            missing = [d for d in stage.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"stage {stage.name} depends on unknown stages {missing}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, int] = {}
+
+        def visit(name: str):
+            if state.get(name) == 1:
+                raise ValueError(f"dependency cycle through {name}")
+            if state.get(name) == 2:
+                return
+            state[name] = 1
+            for dep in self.stages[name].deps:
+                visit(dep)
+            state[name] = 2
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    async def run_stream(
+        self,
+        inputs: PipelineInput,
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[PipelineEvent, None]:
+        run = PipelineRun(inputs, cancellation_token)
+        async for event in self._stream(run):
+            yield event
+
+    async def run(self, inputs: PipelineInput, cancellation_token: Optional[CancellationToken] = None) -> PipelineRun:
+        run = PipelineRun(inputs, cancellation_token)
+        async for _ in self._stream(run):
+            pass
+        return run
+
+    async def _stream(self, run: PipelineRun) -> AsyncGenerator[PipelineEvent, None]:
+        driver = asyncio.create_task(self._drive(run))
+        run.cancellation_token.link_future(driver)
+        try:
+            while True:
+                getter = asyncio.create_task(run.queue.get())
+                done, _ = await asyncio.wait({getter, driver}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    event = getter.result()
+                    yield event
+                    if event.stage == "pipeline":
+                        break
+                    continue
+                getter.cancel()
+                if driver.cancelled():
+                    yield PipelineEvent(run.run_id, "pipeline", "failed", "cancelled")
+                    break
+                driver.result()     # re-raise an engine error
+        finally:
+            if not driver.done():
+                driver.cancel()
+            for task in run._tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    async def _drive(self, run: PipelineRun):
+        # stage tasks inherit the namespace, so tools and teams write into it
+        with use_namespace(run.namespace):
+            await self._schedule(run)
+
+    async def _schedule(self, run: PipelineRun):
+        pending = list(self.order)
+        while pending or run._tasks:
+            for name in list(pending):
+                deps = self.stages[name].deps
+                if all(run.status.get(d) in FINISHED for d in deps):
+                    pending.remove(name)
+                    run._tasks[name] = asyncio.create_task(self._run_stage(run, self.stages[name]))
+            running = [t for t in run._tasks.values() if not t.done()]
+            if not running:
+                if pending:     # cannot happen with a validated DAG
+                    raise RuntimeError(f"stages never became ready: {pending}")
+                break
+            await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+        failed = [n for n, status in run.status.items()
+                  if (status == "failed" and not self.stages[n].optional) or n in run._blocked]
+        kind = "failed" if failed else "completed"
+        run.emit("pipeline", kind, {"status": dict(run.status), "errors": dict(run.errors),
+                                    "usage": dict(run.usage), "timings": dict(run.timings)})
+
+    def _blocked_by(self, run: PipelineRun, stage: Stage) -> Optional[str]:
+        for dep in stage.deps:
+            if dep in run._blocked or (run.status.get(dep) == "failed" and not self.stages[dep].optional):
+                return dep
+        return None
+
+    async def _run_stage(self, run: PipelineRun, stage: Stage):
+        name = stage.name
+        blocker = self._blocked_by(run, stage)
+        if blocker is not None:
+            run._blocked.add(name)
+            run.status[name] = "skipped"
+            run.emit(name, "skipped", f"{blocker} failed")
+            return
+        if name in run._cancelled:
+            run.status[name] = "cancelled"
+            run.emit(name, "cancelled")
+            return
+        if stage.when is not None and not stage.when(run):
+            run.status[name] = "skipped"
+            run.emit(name, "skipped")
+            return
+
+        limit = stage.concurrency
+        semaphore = _semaphore(name, limit) if limit else None
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            run.status[name] = "running"
+            run.emit(name, "started", attempt=attempt)
+            try:
+                # a retry asks the models again instead of replaying the cached answer that failed
+                with fresh_completions(attempt > 1):
+                    if semaphore is not None:
+                        async with semaphore:
+                            output = await asyncio.wait_for(stage.run(run), stage.timeout)
+                    else:
+                        output = await asyncio.wait_for(stage.run(run), stage.timeout)
+            except asyncio.CancelledError:
+                if name not in run._cancelled:
+                    raise
+                run.status[name] = "cancelled"
+                run.timings[name] = time.perf_counter() - started
+                run.emit(name, "cancelled", attempt=attempt)
+                return
+            except Exception as e:
+                error = f"timed out after {stage.timeout}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+                if attempt <= stage.retries and getattr(e, "retryable", True):
+                    run.emit(name, "retry", error, attempt=attempt)
+                    await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+                    continue
+                run.status[name] = "failed"
+                run.errors[name] = error
+                run.timings[name] = time.perf_counter() - started
+                run.emit(name, "failed", error, attempt=attempt)
+                return
+
+            run.outputs[name] = output
+            run.status[name] = "completed"
+            run.timings[name] = time.perf_counter() - started
+            run.emit(name, "completed", output, attempt=attempt)
+            return
+
+
+# ---------- stages ----------------------------------------------------------------------
+def _save_team_state(run: PipelineRun, filename: str, state: Dict[str, Any]):
+    run.namespace.write_json(filename, state, state=True)
+
+
+async def _stream_team(run: PipelineRun, stage: str, team, task: str):
+    """Run a team, count its token usage and forward its chat messages as pipeline events."""
+    async for msg in team.run_stream(task=task, cancellation_token=run.cancellation_token):
+        usage = getattr(msg, "models_usage", None)
+        if usage is not None:
+            run.add_usage(usage.prompt_tokens, usage.completion_tokens)
+        if not isinstance(msg, TextMessage) or msg.source == "user":
+            continue
+        run.message(stage, msg.source, msg.content)
+
+
+async def _run_requirement_agents(run: PipelineRun) -> Tuple[Dict[str, Any], str]:
+    """
+    The Req chat without a user: customer finder -> filter finder -> requirements
+    analyzer, each stage handing its result to the next as run_team.py does on rerun.
+    """
+    inputs = run.inputs
+    state_path = run.namespace.state_path("Req_state.json")
+    stage, task, passed = "customer_finder_agent", inputs.prompt, ""
+    customer_name = inputs.customer_name
+    for _ in range(REQ_MAX_TURNS):
+        agent = await get_Reqteam(stage=stage, state_path=state_path)
+        next_stage, passing, done = None, False, False
+        async for msg in agent.run_stream(task=task, cancellation_token=run.cancellation_token):
+            usage = getattr(msg, "models_usage", None)
+            if usage is not None:
+                run.add_usage(usage.prompt_tokens, usage.completion_tokens)
+            if not isinstance(msg, TextMessage):
+                continue
+            if "CUSTOMER_FOUND" in msg.content:
+                next_stage, passing = "filter_finder_agent", True
+            elif "PASS to analyzer" in msg.content:
+                next_stage, passing = "requirements_analyzer", True
+            if msg.source == "RequirementsFinalizer":
+                if "mentioned_methodology" in msg.content:
+                    done = True
+                if ("_CONFIRMED:" in msg.content) and ("Question:" not in msg.content):
+                    passing = True
+            if msg.source != "user":
+                run.message("req", msg.source, msg.content)
+
+        state = await agent.save_state()
+        run.namespace.write_json("Req_state.json", state, state=True, ensure_ascii=True)
+        last = state["llm_context"]["messages"][-1]["content"]
+
+        if done:
+            return extract_json_string(last), customer_name
+        if not passing:
+            raise RequirementNeedsInput(last)
+        if next_stage == "filter_finder_agent":
+            customer_name = extract_json_string(last)
+            await keyword_cache.warm_up(customer_name)
+            passed = f"{inputs.prompt}; customer_name:{customer_name}"
+        elif next_stage == "requirements_analyzer":
+            confirmed = json.dumps(extract_json_string(last), default=str, indent=2)
+            passed = f"{passed}; confirmed: {confirmed}"
+        stage = next_stage or stage
+        task = passed
+    raise StageError(f"requirement not confirmed after {REQ_MAX_TURNS} turns")
+
+
+_mapping_cache: Dict[str, Tuple[float, str]] = {}
+
+
+def _mapping_text(path: Optional[str] = None) -> str:
+    """flattened_mapping.json (of the run's namespace) as prompt text, re-read only when the file changes."""
+    path = path or mapping_path("flattened_mapping.json")
+    mtime = os.path.getmtime(path)
+    cached = _mapping_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (mtime, json.dumps(json.load(f), ensure_ascii=False, indent=2))
+        _mapping_cache[path] = cached
+    return cached[1]
+
+
+async def req_stage(run: PipelineRun) -> RequirementOutput:
+    inputs = run.inputs
+    if inputs.requirement is not None:
+        requirement = inputs.requirement
+        if isinstance(requirement, str):
+            requirement = json.loads(requirement)
+        customer_name = inputs.customer_name
+    else:
+        requirement, customer_name = await _run_requirement_agents(run)
+
+    entry = customer_directory.resolve(customer_name) if isinstance(customer_name, str) else None
+    if entry is not None:
+        customer_name = entry.name
+    brand = classify_brand(customer_name)
+    # this customer's mapping into the run's namespace (mapping_cache hit when the Req chat already fetched it)
+    await get_flattened_mapping(customer_name)
+    return RequirementOutput(
+        requirement=requirement,
+        requirement_text=json.dumps(requirement, ensure_ascii=False, indent=2),
+        summary=requirement["summary"],
+        customer_name=customer_name,
+        brand=brand,
+        fields=filter_field_description(brand),
+        mapping=_mapping_text(),
+    )
+
+
+async def cache_stage(run: PipelineRun) -> HistoryOutput:
+    """Requirement cache: a near-identical requirement reuses its DSL."""
+    req: RequirementOutput = run.output("req")
+    if not run.inputs.use_requirement_cache:
+        return HistoryOutput(matched=False)
+    hit = await asyncio.to_thread(requirement_cache.lookup, req.requirement, req.customer_name, req.brand)
+    if hit is None:
+        return HistoryOutput(matched=False)
+    run.emit("cache", "info", f"Same requirement answered before (similarity {hit['score']:.2f}), reusing its DSL.")
+    return HistoryOutput(matched=True, dsl=hit["dsl"], source="cache", score=hit["score"])
+
+
+async def history_stage(run: PipelineRun) -> HistoryOutput:
+    req: RequirementOutput = run.output("req")
+    rag_result = await asyncio.to_thread(query_dsl_examples, query=req.summary, brand=req.brand, top_k=HISTORY_TOP_K)
+    run.emit("history", "info", req.summary)
+    team = await get_HistoryMatchTeam(rag_result=rag_result, task=req.requirement_text, fields=req.fields)
+    await _stream_team(run, "history", team, req.requirement_text)
+    state = await team.save_state()
+    _save_team_state(run, "HistoryTeam_state.json", state)
+
+    last = state["agent_states"]["RoundRobinGroupChatManager"]["message_thread"][-1]["content"]
+    if NO_HISTORY in last:
+        return HistoryOutput(matched=False)
+    run.cancel_stage("fast_dsl")        # history won, drop the speculative DSL
+    return HistoryOutput(matched=True, dsl=extract_json_string(last), source="history")
+
+
+def _matched(run: PipelineRun) -> Optional[HistoryOutput]:
+    """The cache or history hit that replaces DSL writing, if any."""
+    for name in ("cache", "history"):
+        found: Optional[HistoryOutput] = run.output(name)
+        if found is not None and found.matched:
+            return found
+    return None
+
+
+async def fast_dsl_stage(run: PipelineRun) -> Dict[str, Any]:
+    req: RequirementOutput = run.output("req")
+    with get_usage_metadata_callback() as usage:
+        dsl = await agenerate_elasticsearch_query_from_natural_language(
+            query=req.requirement_text, description_path=req.fields, mapping_path=mapping_path("raw_mapping.json"))
+    for metadata in usage.usage_metadata.values():
+        run.add_usage(metadata.get("input_tokens", 0), metadata.get("output_tokens", 0))
+    # the generator reports its failures as an error JSON; raise so the retry budget and dsl_stage see them
+    if isinstance(dsl, dict) and "error" in dsl:
+        raise RuntimeError(f"{dsl['error']}: {dsl.get('message', '')}")
+    run.emit("fast_dsl", "info", dsl)
+    return dsl
+
+
+async def field_stage(run: PipelineRun) -> FieldOutput:
+    req: RequirementOutput = run.output("req")
+    team = await get_fieldTeam(task=req.summary, mapping=req.mapping, user_require=req.requirement, fields=req.fields)
+    await _stream_team(run, "field", team, req.summary)
+    state = await team.save_state()
+    _save_team_state(run, "FieldTeam_state.json", state)
+
+    field_list = state["agent_states"]["RoundRobinGroupChatManager"]["message_thread"][-1]["content"]
+    return FieldOutput(field_list=json.dumps(extract_json_string(field_list), default=str, indent=2))
+
+
+async def dsl_stage(run: PipelineRun) -> DSLOutput:
+    matched = _matched(run)
+    if matched is not None:
+        return DSLOutput(dsl=matched.dsl, source=matched.source)
+    if run.inputs.mode == "fast":
+        dsl = run.output("fast_dsl")
+        if dsl is None:
+            raise StageError(run.errors.get("fast_dsl", "fast DSL generation did not run"))
+        return DSLOutput(dsl=dsl, source="fast")
+
+    req: RequirementOutput = run.output("req")
+    fields: FieldOutput = run.output("field")
+    team = await get_DSLteam(task=req.requirement_text, customer_name=req.customer_name, mapping=req.mapping,
+                             field_list=fields.field_list, fields=req.fields)
+    await _stream_team(run, "dsl", team, req.requirement_text)
+    state = await team.save_state()
+    _save_team_state(run, "DSLTeam_state.json", state)
+
+    last = state["agent_states"]["RoundRobinGroupChatManager"]["message_thread"][-1]["content"]
+    return DSLOutput(dsl=extract_json_string(text=last), source="thinking")
+
+
+async def execute_stage(run: PipelineRun) -> ExecuteOutput:
+    req: RequirementOutput = run.output("req")
+    dsl = run.output("dsl").dsl
+    task = json.dumps(dsl, indent=2, ensure_ascii=False)
+    team = await get_Exeteam(task=task, customer_name=req.customer_name, fields=req.fields)
+    await _stream_team(run, "execute", team, task)
+    state = await team.save_state()
+    _save_team_state(run, "Exeteam_state.json", state)
+
+    json_path = None
+    for msg in reversed(state["agent_states"]["RoundRobinGroupChatManager"]["message_thread"]):
+        if msg.get("type") != "TextMessage":
+            continue
+        if msg.get("source") == "DSLModifier":
+            dsl = extract_json_string(msg.get("content"))
+            break
+        if msg.get("source") == "DSLExecutor":
+            json_path = json.dumps(extract_json_string(msg.get("content")), ensure_ascii=False, indent=2).strip("\"'")
+    if json_path is None:
+        raise StageError("DSLExecutor did not report a result file")
+    return ExecuteOutput(dsl=dsl, json_path=json_path)
+
+
+async def export_stage(run: PipelineRun) -> ExportOutput:
+    req: RequirementOutput = run.output("req")
+    executed: ExecuteOutput = run.output("execute")
+    output_dir = run.inputs.output_dir or run.namespace.result_root
+    os.makedirs(output_dir, exist_ok=True)
+    dsl_path = os.path.join(output_dir, "DSLQuery.json")
+    script_path = os.path.join(output_dir, "result.py")
+    atomic_write_json(dsl_path, executed.dsl, default=None)
+
+    # Create report (written once; the DataFrame is reused for display and download)
+    report_path, report_df = await asyncio.to_thread(
+        agg_json_to_excel, json_path=executed.json_path, excel_path=os.path.join(output_dir, "result.xlsx"))
+    with open(report_path, "rb") as f:
+        report_bytes = f.read()
+    if run.output("dsl").source != "cache":
+        requirement_cache.store_dsl(req.requirement, req.customer_name, req.brand, executed.dsl)
+
+    # Create python script
+    write_export_script(customer_name=req.customer_name, excel_path="result.xlsx", query=executed.dsl, out_path=script_path)
+    return ExportOutput(report_path=report_path, report_df=report_df, report_bytes=report_bytes,
+                        dsl_path=dsl_path, script_path=script_path)
+
+
+def report_pipeline(inputs: PipelineInput, concurrency: Optional[Dict[str, int]] = None) -> Pipeline:
+    """
+    The report DAG for one set of options. In fast mode with speculation the
+    fast DSL only waits for the cache lookup, so it runs next to the history check.
+    concurrency overrides STAGE_CONCURRENCY per stage name.
+    """
+    limits = {**STAGE_CONCURRENCY, **(concurrency or {})}
+
+    def _stage(name: str, run, deps: Tuple[str, ...] = (), when=None, optional: bool = False) -> Stage:
+        return Stage(
+            name=name,
+            run=run,
+            deps=deps,
+            when=when,
+            timeout=STAGE_TIMEOUTS.get(name),
+            retries=STAGE_RETRIES.get(name, 0),
+            concurrency=limits.get(name),
+            optional=optional,
+        )
+
+    fast = inputs.mode == "fast"
+    speculative = fast and inputs.speculative and inputs.history_check
+    return Pipeline([
+        _stage("req", req_stage),
+        _stage("cache", cache_stage, deps=("req",), optional=True),
+        _stage("history", history_stage, deps=("cache",), optional=True,
+               when=lambda run: inputs.history_check and _matched(run) is None),
+        # optional: a history match can still replace a failed fast DSL, dsl_stage fails when it cannot
+        _stage("fast_dsl", fast_dsl_stage, deps=("cache",) if speculative else ("cache", "history"), optional=True,
+               when=lambda run: fast and _matched(run) is None),
+        _stage("field", field_stage, deps=("history",),
+               when=lambda run: not fast and _matched(run) is None),
+        _stage("dsl", dsl_stage, deps=("history", "fast_dsl", "field")),
+        _stage("execute", execute_stage, deps=("dsl",)),
+        _stage("export", export_stage, deps=("execute",)),
+    ])
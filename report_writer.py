@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+from openpyxl import Workbook
+
+#===================================================================
+# Report output config
+#===================================================================
+XLSX_MAX_ROWS = 200_000         # above this Excel is slow to write and to open
+EXCEL_ROW_LIMIT = 1_048_575     # hard sheet limit (without the header row)
+
+MIME_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def choose_format(n_rows: int) -> str:
+    """xlsx for normal reports, parquet (csv without pyarrow) for large ones."""
+    if n_rows <= XLSX_MAX_ROWS:
+        return "xlsx"
+    try:
+        import pyarrow  # noqa: F401
+        return "parquet"
+    except ImportError:
+        return "csv"
+
+
+def write_xlsx(df: pd.DataFrame, path: str | Path):
+    """
+    Constant-memory Excel writer (openpyxl write-only mode): rows are
+    streamed to the sheet one by one instead of building the workbook in memory.
+    """
+    if len(df) > EXCEL_ROW_LIMIT:
+        raise ValueError(f"{len(df)} rows exceed the Excel sheet limit, use csv or parquet.")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([str(c) for c in df.columns])
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(path)
+
+
+def write_csv(df: pd.DataFrame, path: str | Path):
+    df.to_csv(path, index=False)
+
+
+def write_parquet(df: pd.DataFrame, path: str | Path):
+    df.to_parquet(path, index=False)
+
+
+WRITERS: Dict[str, Callable[[pd.DataFrame, str | Path], None]] = {
+    "xlsx": write_xlsx,
+    "csv": write_csv,
+    "parquet": write_parquet,
+}
+
+
+def write_report(
+    df: pd.DataFrame,
+    output_path: str | Path,
+    fmt: Optional[str] = None,
+) -> Tuple[str, str]:
+    """
+    Write a report DataFrame once, in the format picked by choose_format (or fmt).
+    The suffix of output_path is replaced by the format.
+    Return (written path, format).
+    """
+    fmt = fmt or choose_format(len(df))
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown report format '{fmt}'. Only: {list(WRITERS)}")
+    path = Path(output_path).with_suffix(f".{fmt}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    WRITERS[fmt](df, tmp_path)
+    os.replace(tmp_path, path)
+    return str(path), fmt
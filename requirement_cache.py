@@ -0,0 +1,148 @@
+"""
+Semantic requirement cache: (requirement JSON, customer, brand) -> final DSL.
+
+A requirement close enough to one that already produced a working report
+(cosine similarity >= threshold, same customer and brand) reuses its DSL and
+goes straight to execution, skipping the History, Field and DSL teams.
+The filters and the time range must match exactly (normalized, in the Chroma
+`where` clause): "site X" vs "site Y" or "last 7d" vs "last 30d" embed almost
+identically but need a different DSL.
+Entries are stored after a successful execution only and expire: a DSL with
+fixed @timestamp bounds was written for the day it was generated ("last 7
+days" then), so it is only reused for ABSOLUTE_BOUNDS_TTL.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional, Union
+
+from langchain.docstore.document import Document
+from langchain_chroma import Chroma
+
+from config import rag_dir, get_embedding
+from result_cache import has_absolute_time_bounds
+
+#===================================================================
+# Requirement cache config
+#===================================================================
+REQUIREMENT_CACHE_DIR = os.path.join(rag_dir, "Requirement_Cache_ChromaDB")
+REQUIREMENT_CACHE_THRESHOLD = float(os.environ.get("REQUIREMENT_CACHE_THRESHOLD", "0.95"))
+REQUIREMENT_CACHE_TTL = int(os.environ.get("REQUIREMENT_CACHE_TTL", str(7 * 24 * 3600)))   # DSL with now-relative or no time range
+ABSOLUTE_BOUNDS_TTL = int(os.environ.get("REQUIREMENT_CACHE_ABSOLUTE_TTL", "3600"))     # DSL with fixed time bounds
+COLLECTION_NAME = "requirements"
+
+
+def requirement_text(requirement: Union[str, Dict[str, Any]]) -> str:
+    """Canonical text of a requirement JSON (sorted keys), the text that gets embedded."""
+    if isinstance(requirement, str):
+        try:
+            requirement = json.loads(requirement)
+        except json.JSONDecodeError:
+            return " ".join(requirement.split())
+    return json.dumps(requirement, sort_keys=True, ensure_ascii=False)
+
+
+def _normalize_slot(value: Any) -> str:
+    """Order- and case-insensitive text of a requirement slot, e.g. mentioned_filters."""
+    items = value if isinstance(value, list) else [value] if value not in (None, "") else []
+    normalized = set()
+    for item in items:
+        text = item if isinstance(item, str) else json.dumps(item, sort_keys=True, ensure_ascii=False)
+        text = " ".join(text.lower().split())
+        if text:
+            normalized.add(text)
+    return json.dumps(sorted(normalized), ensure_ascii=False)
+
+
+def exact_slots(requirement: Union[str, Dict[str, Any]]) -> Dict[str, str]:
+    """Metadata that has to be equal for a hit: normalized filters and time range."""
+    if isinstance(requirement, str):
+        try:
+            requirement = json.loads(requirement)
+        except json.JSONDecodeError:
+            requirement = {}
+    if not isinstance(requirement, dict):
+        requirement = {}
+    return {
+        "filters": _normalize_slot(requirement.get("mentioned_filters")),
+        "time_range": _normalize_slot(requirement.get("mentioned_time_range")),
+    }
+
+
+class RequirementCache:
+    def __init__(self, db_path: str = REQUIREMENT_CACHE_DIR, threshold: float = REQUIREMENT_CACHE_THRESHOLD, embeddings=None):
+        self.db_path = db_path
+        self.threshold = threshold
+        self._embeddings = embeddings
+        self._store: Optional[Chroma] = None
+        self.stats = {"hits": 0, "misses": 0, "corrupt": 0, "stores": 0, "errors": 0,
+                      "last_score": None, "last_error": None}
+
+    @property
+    def store(self) -> Chroma:
+        if self._store is None:
+            self._store = Chroma(
+                persist_directory=self.db_path,
+                embedding_function=self._embeddings or get_embedding(),
+                collection_name=COLLECTION_NAME,
+                collection_metadata={"hnsw:space": "cosine"},
+            )
+        return self._store
+
+    @staticmethod
+    def ttl_for(dsl: Union[str, Dict[str, Any]]) -> int:
+        return ABSOLUTE_BOUNDS_TTL if has_absolute_time_bounds(dsl) else REQUIREMENT_CACHE_TTL
+
+    def _error(self, e: Exception):
+        self.stats["errors"] += 1
+        self.stats["last_error"] = str(e)
+
+    @staticmethod
+    def _entry_id(text: str, customer_name: str, brand: str) -> str:
+        return hashlib.sha256(f"{customer_name.lower()}\n{brand.lower()}\n{text}".encode("utf-8")).hexdigest()
+
+    def lookup(self, requirement: Union[str, Dict[str, Any]], customer_name: str, brand: str) -> Optional[Dict[str, Any]]:
+        """Return {"dsl", "score", "requirement"} of the closest live cached requirement above threshold, else None."""
+        text = requirement_text(requirement)
+        where = {"$and": [{"customer": customer_name.lower()}, {"brand": (brand or "").lower()},
+                          {"expires_at": {"$gt": time.time()}}]
+                 + [{key: value} for key, value in exact_slots(requirement).items()]}
+        try:
+            results = self.store.similarity_search_with_score(text, k=1, filter=where)
+        except Exception as e:
+            self._error(e)
+            results = []
+
+        score = max(0.0, min(1.0, 1.0 - float(results[0][1]))) if results else None
+        self.stats["last_score"] = score
+        if score is None or score < self.threshold:
+            self.stats["misses"] += 1
+            return None
+
+        doc = results[0][0]
+        try:
+            dsl = json.loads(doc.metadata["dsl"])
+        except (KeyError, TypeError, json.JSONDecodeError):
+            self.stats["misses"] += 1
+            self.stats["corrupt"] += 1
+            return None
+        self.stats["hits"] += 1
+        return {"dsl": dsl, "score": score, "requirement": doc.page_content}
+
+    def store_dsl(self, requirement: Union[str, Dict[str, Any]], customer_name: str, brand: str, dsl: Union[str, Dict[str, Any]]):
+        """Remember the DSL that answered a requirement (same requirement text overwrites) until ttl_for(dsl)."""
+        text = requirement_text(requirement)
+        dsl_text = dsl if isinstance(dsl, str) else json.dumps(dsl, ensure_ascii=False)
+        metadata = {"customer": customer_name.lower(), "brand": (brand or "").lower(), "dsl": dsl_text,
+                    "expires_at": time.time() + self.ttl_for(dsl), **exact_slots(requirement)}
+        entry_id = self._entry_id(text, customer_name, brand or "")
+        try:
+            self.store.delete(ids=[entry_id])
+            self.store.add_documents([Document(page_content=text, metadata=metadata)], ids=[entry_id])
+            self.stats["stores"] += 1
+        except Exception as e:
+            self._error(e)
+
+
+requirement_cache = RequirementCache()
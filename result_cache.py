@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Collection, Dict, Optional, Union
+
+from artifact_store import atomic_write
+from config import result_dir
+
+#===================================================================
+# Result cache config
+#===================================================================
+RELATIVE_TTL = 120              # query uses now-… or an open time range: data keeps moving
+ABSOLUTE_TTL = 24 * 3600        # query is fully inside a closed, past time range
+SETTLE_SECONDS = 3600           # recent data may still be ingested, treat as relative
+MAX_ENTRIES = 64
+MAX_BYTES = 512 * 1024 * 1024
+DATE_FIELD_RE = re.compile(r"^@?timestamp$", re.IGNORECASE)    # read as a date without the mapping
+
+
+def canonicalize_dsl(query: Union[str, dict]) -> str:
+    """
+    Canonical text of a DSL: sorted keys, no insignificant whitespace.
+    Non-JSON input only gets its whitespace collapsed.
+    """
+    if isinstance(query, str):
+        try:
+            query = json.loads(query)
+        except json.JSONDecodeError:
+            return " ".join(query.split())
+    return json.dumps(query, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def _iter_ranges(node: Any):
+    """Yield every {field: bounds} dict found under a "range" key."""
+    if isinstance(node, dict):
+        for k, v in node.items():
+            if k == "range" and isinstance(v, dict):
+                yield v
+            else:
+                yield from _iter_ranges(v)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _iter_ranges(item)
+
+
+def _to_epoch_seconds(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # epoch_millis is the common case, small numbers are epoch_second
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        if value.isdigit():
+            return _to_epoch_seconds(int(value))
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _is_date_range(field: str, bounds: Dict[str, Any], date_fields: Optional[Collection[str]] = None) -> bool:
+    """
+    A range on a date field. With the date fields of the mapping that is all that
+    counts; without it: (@)timestamp, an explicit format, or ISO date bounds.
+    """
+    if date_fields is not None:
+        return field in date_fields
+    if "format" in bounds or DATE_FIELD_RE.match(field):
+        return True
+    return any(isinstance(v, str) and not v.isdigit() and _to_epoch_seconds(v) is not None for v in bounds.values())
+
+
+def ttl_for(query: Union[str, dict], date_fields: Optional[Collection[str]] = None) -> int:
+    """
+    Pick the TTL of a query result.
+    Relative ranges (now-…), open ranges and queries without a time range change
+    as new documents arrive; closed ranges that ended before SETTLE_SECONDS do not.
+    Only ranges on date fields count, a numeric range (bytes, response_time) is no
+    time bound. date_fields are the date / date_nanos fields of the customer mapping.
+    """
+    if isinstance(query, str):
+        if re.search(r"\bnow\b", query):
+            return RELATIVE_TTL
+        try:
+            query = json.loads(query)
+        except json.JSONDecodeError:
+            return RELATIVE_TTL
+
+    upper_bounds = []
+    for range_clause in _iter_ranges(query):
+        for field, bounds in range_clause.items():
+            if not isinstance(bounds, dict) or not _is_date_range(field, bounds, date_fields):
+                continue
+            if any(isinstance(v, str) and "now" in v for v in bounds.values()):
+                return RELATIVE_TTL
+            upper = bounds.get("lte", bounds.get("lt", bounds.get("to")))
+            upper_bounds.append(_to_epoch_seconds(upper))
+
+    if not upper_bounds or any(u is None for u in upper_bounds):
+        return RELATIVE_TTL
+    if max(upper_bounds) > time.time() - SETTLE_SECONDS:
+        return RELATIVE_TTL
+    return ABSOLUTE_TTL
+
+
+def has_absolute_time_bounds(query: Union[str, dict], date_fields: Optional[Collection[str]] = None) -> bool:
+    """True when a date range of the query has a fixed bound (not now-…): its window does not move with time."""
+    if isinstance(query, str):
+        try:
+            query = json.loads(query)
+        except json.JSONDecodeError:
+            return False
+    for range_clause in _iter_ranges(query):
+        for field, bounds in range_clause.items():
+            if not isinstance(bounds, dict) or not _is_date_range(field, bounds, date_fields):
+                continue
+            for op in ("gt", "gte", "lt", "lte", "from", "to"):
+                value = bounds.get(op)
+                if value is not None and not (isinstance(value, str) and "now" in value):
+                    return True
+    return False
+
+
+class ResultCache:
+    """
+    Content-addressed LRU cache of raw OpenSearch responses.
+
+    key   = sha256(index pattern + canonical DSL)
+    value = response body, stored as <key>.json under cache_dir
+    index.json keeps expiry, size and LRU order so the cache survives restarts.
+    Safe to share between the threads of the Streamlit server: the index is
+    guarded by a lock and every write goes through its own temp file.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = os.path.join(result_dir, "cache"),
+        max_entries: int = MAX_ENTRIES,
+        max_bytes: int = MAX_BYTES,
+    ):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(index: str, query: Union[str, dict]) -> str:
+        text = f"{index}\n{canonicalize_dsl(query)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _tmp_path(self, key: str) -> str:
+        return f"{self._body_path(key)}.{uuid.uuid4().hex[:8]}.tmp"
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for key, meta in entries:
+            if os.path.exists(self._body_path(key)):
+                self._entries[key] = meta
+
+    def _save_index(self):
+        atomic_write(self.index_path, json.dumps(list(self._entries.items())))
+
+    def _drop(self, key: str):
+        self._entries.pop(key, None)
+        try:
+            os.remove(self._body_path(key))
+        except FileNotFoundError:
+            pass
+
+    def get_path(self, key: str) -> Optional[str]:
+        """Return the cached body path of a live entry, or None."""
+        with self._lock:
+            meta = self._entries.get(key)
+            if meta is None:
+                return None
+            if meta["expires_at"] < time.time() or not os.path.exists(self._body_path(key)):
+                self._drop(key)
+                self._save_index()
+                return None
+            self._entries.move_to_end(key)
+            return self._body_path(key)
+
+    def copy_to(self, key: str, output_path: str) -> bool:
+        """Copy a cached body to output_path. Return False on miss."""
+        body_path = self.get_path(key)
+        if body_path is None:
+            return False
+        try:
+            shutil.copyfile(body_path, output_path)
+        except FileNotFoundError:       # evicted by another session in between
+            return False
+        return True
+
+    def put(self, key: str, body: bytes, ttl: int):
+        tmp_path = self._tmp_path(key)
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        self._commit(key, tmp_path, ttl)
+
+    def put_file(self, key: str, src_path: str, ttl: int, move: bool = False):
+        """Store a body that is already on disk. src_path is kept unless move=True."""
+        tmp_path = self._tmp_path(key)
+        if move:
+            shutil.move(src_path, tmp_path)
+        else:
+            shutil.copyfile(src_path, tmp_path)
+        self._commit(key, tmp_path, ttl)
+
+    def _commit(self, key: str, tmp_path: str, ttl: int):
+        with self._lock:
+            os.replace(tmp_path, self._body_path(key))
+            self._entries[key] = {"expires_at": time.time() + ttl, "size": os.path.getsize(self._body_path(key))}
+            self._entries.move_to_end(key)
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, m in self._entries.items() if m["expires_at"] < now]:
+            self._drop(key)
+        total = sum(m["size"] for m in self._entries.values())
+        while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+            key, meta = next(iter(self._entries.items()))
+            total -= meta["size"]
+            self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+            self._save_index()
+
+
+result_cache = ResultCache()
@@ -1,19 +1,21 @@
 from autogen_agentchat.messages import TextMessage
 from autogen_core import CancellationToken
-from tool import  Get_keyword_tool, Get_mapping_tool, Opendistro_search, agg_json_to_excel
-from function import classify_brand, filter_field_description, flatten_es_mapping, extract_json_string, stream_data, write_export_script
-from RAG import query_dsl_examples
-import re, io, os, json, asyncio, aiofiles, time
+from tool import  Get_keyword_tool, Get_mapping_tool, Opendistro_search
+from function import flatten_es_mapping, extract_json_string, stream_data
+from RAG import add_dsl_example
+import re, io, os, json, asyncio, aiofiles, time, uuid
 from pathlib import Path
 import pandas as pd
 from config import team_state_dir, mapping_dir, rag_dir, get_model_client, result_dir
+from es_client import aclose_es_client
+from model_registry import aclose_model_clients
+from keyword_cache import keyword_cache
+from report_writer import MIME_TYPES
+from customer_directory import customer_directory
+from artifact_store import artifact_store, enter_namespace, exit_namespace
 
-from ES_Query import generate_elasticsearch_query_from_natural_language
-from HistoryMatchTeam import get_HistoryMatchTeam
 from ReqTeam import get_Reqteam
-from FieldTeam import get_fieldTeam
-from DSLTeam import get_DSLteam
-from ExecuteTeam import get_Exeteam
+from pipeline import PipelineInput, report_pipeline
 from ReportSaverTeam import get_ReportSaverTeam
 
 import streamlit as st
@@ -21,23 +23,22 @@ import streamlit as st
 client = get_model_client()
 
 async def main():
+    # every browser session reads and writes its own artifact namespace (artifact_store.py)
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    session_store = artifact_store.namespace(st.session_state.session_id)
+    namespace_token = enter_namespace(session_store)
     try:    
         # st.title("Report Generator")
         
-        target_dsl_path = Path(os.path.join(result_dir,"DSLQuery.json"))
-        target_py_script = (os.path.join(result_dir, "result.py"))
-
-        #delete Reqstate in last session
-        if "delete_Reqstate" not in st.session_state:
-            st.session_state.delete_Reqstate = False
-        if not st.session_state.delete_Reqstate:
-            Req_state_path = os.path.join(team_state_dir, "Req_state.json")
-            if os.path.exists(Req_state_path):
-                os.remove(Req_state_path)
-            st.session_state.delete_Reqstate = True
+        target_dsl_path = Path(session_store.path("DSLQuery.json"))
+        target_py_script = session_store.path("result.py")
 
         if "history_check" not in st.session_state:
             st.session_state.history_check = True  
+
+        if "speculative" not in st.session_state:
+            st.session_state.speculative = True
         
         if "messages" not in st.session_state:
             st.session_state.messages = []
@@ -88,6 +89,7 @@ async def main():
                     key="mode",
                 )
                 st.checkbox("History check", key="history_check")
+                st.checkbox("Write DSL while checking history (fast mode)", key="speculative")
 
         # show chat history
         if st.session_state.messages: 
@@ -107,7 +109,7 @@ async def main():
  
             st.session_state.field_select = True        #field_select always True as default
             # state_path= f"{st.session_state.Req_stage}.json"
-            state_path= os.path.join(team_state_dir,"Req_state.json")
+            state_path= session_store.state_path("Req_state.json")
             Req_team = await get_Reqteam(stage = st.session_state.Req_stage, state_path= state_path)
             if st.session_state.passing_turn:
                 Req_stream = Req_team.run_stream(task= st.session_state.Req_passed_message)
@@ -147,14 +149,19 @@ async def main():
                     st.write_stream(stream_data(Reqteam_msg.content))
                     
             
-            async with aiofiles.open(state_path, "w") as file:
-                Req_state = await Req_team.save_state()
-                await file.write(json.dumps(Req_state, default=str, indent=2,))
+            Req_state = await Req_team.save_state()
+            session_store.write_json("Req_state.json", Req_state, state=True, ensure_ascii=True)
 
             Req_lastmsg = Req_state["llm_context"]["messages"][-1]["content"]
                             
             if st.session_state.Req_stage == "filter_finder_agent" and st.session_state.passing_turn:
                 st.session_state.customer_name = extract_json_string(Req_lastmsg)
+                # canonical spelling from customer.xlsx, so brand and index pattern agree
+                entry = customer_directory.resolve(st.session_state.customer_name) if isinstance(st.session_state.customer_name, str) else None
+                if entry is not None:
+                    st.session_state.customer_name = entry.name
+                # one _msearch for all keyword fields, so filter confirmation hits the cache
+                await keyword_cache.warm_up(st.session_state.customer_name)
                 st.session_state.Req_passed_message = f"{st.session_state.user_input}; customer_name:{st.session_state.customer_name}"
                 st.rerun()
             elif st.session_state.Req_stage == "requirements_analyzer" and st.session_state.passing_turn:
@@ -168,203 +175,108 @@ async def main():
             if NEXT_STAGE:
                 # retriving data from req_state.json
                 user_requirement = extract_json_string(Req_lastmsg)
-                
-                
-                requirement = json.dumps(user_requirement, ensure_ascii=False, indent=2)
-                with open(os.path.join(mapping_dir,"flattened_mapping.json"), "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                mapping = json.dumps(data, ensure_ascii=False, indent=2)
-                summary = user_requirement["summary"]
-                
-                # pre-processing base on customer              
-                brand = classify_brand(st.session_state.customer_name)
-                print(f"Brand: {brand}")
-                print(f"customer_name: {st.session_state.customer_name}")
-                print(f"customer_name type: {type(st.session_state.customer_name)}")
-
-                st.session_state.brand = brand
-                filter_field_description(brand)
-                # embed_fields_from_csv()
-
-                #History match
-                if st.session_state.history_check: 
-                    with st.status("Finding history...", expanded=False) as history_status:
-                        try:
-                            rag_result = query_dsl_examples(query = summary, brand=brand, top_k = 3)
-                            with st.chat_message("ai"):
-                                st.write(summary)
-                            
-                            
-                            history_team = await get_HistoryMatchTeam(rag_result = rag_result)
-                            history_stream = history_team.run_stream(task = requirement)
-                            
-
-                            async for his_msg in history_stream:
-                                if not isinstance(his_msg, TextMessage):
-                                    continue
-                                if his_msg.source == "user":
-                                    continue
-                                st.session_state.messages.append({"role": his_msg.source, "content": his_msg.content})
-                                with st.chat_message("ai"):
-                                    st.write_stream(stream_data(his_msg.content))
-                            HistoryTeam_state = await history_team.save_state()
-                            with open(os.path.join(team_state_dir, "HistoryTeam_state.json"), "w", encoding="utf-8") as f:
-                                json.dump(HistoryTeam_state, f, ensure_ascii=False, indent=2, default=str)
-                            
-                            HistoryTeam_msgs = HistoryTeam_state["agent_states"]["RoundRobinGroupChatManager"]["message_thread"]
-                            HistoryTeam_lastmsgs = HistoryTeam_msgs[-1]["content"]
-                            
-                            if "No such historical report" not in HistoryTeam_lastmsgs:
-                                st.session_state.field_select = False
-                                history_status.update(label="History founded.", state="complete")
-                            else:
-                                history_status.update(label="History not founded.", state="complete")
-                        except Exception as e:
-                            history_status.update(label=f"Error:{e}", state="error")
-
-                if st.session_state.field_select and st.session_state.mode == "thinking":
-                        # Field Selection
-                    with st.status("Selecting field...", expanded=False) as field_status:
-                        try:
-                            Field_team = await get_fieldTeam(task = summary, mapping = mapping, user_require = user_requirement)
-                            Field_stream = Field_team.run_stream(task=summary)
-                            async for field_msg in Field_stream:
-                                if not isinstance(field_msg, TextMessage):
-                                    continue
-                                if field_msg.source == "user":
-                                    continue
-                                st.session_state.messages.append({"role": field_msg.source, "content": field_msg.content})
-                                with st.chat_message("ai"):
-                                    st.write_stream(stream_data(field_msg.content))
-                            FieldTeam_state = await Field_team.save_state()
-                            with open(os.path.join(team_state_dir, "FieldTeam_state.json"), "w", encoding="utf-8") as f:
-                                json.dump(FieldTeam_state, f, ensure_ascii=False, indent=2, default=str)
-                            
-                            FieldTeam_msgs = FieldTeam_state["agent_states"]["RoundRobinGroupChatManager"]["message_thread"]
-                            field_list = FieldTeam_msgs[-1]["content"]
-                            confirmed_fieldList_dict = extract_json_string(field_list)
-                            confirmed_fieldList_str= json.dumps(confirmed_fieldList_dict, default=str, indent=2)
-                            field_status.update(label="Field selection completed.", state="complete")
-                        except Exception as e:
-                            field_status.update(label=f"Field selection failed:{e}", state="error")
-                    
-                    with st.status("Writing DSL...", expanded=False) as writing_status:
-                        try:        
-                            DSLteam = await get_DSLteam(task = requirement, customer_name = st.session_state.customer_name, mapping=mapping,field_list=confirmed_fieldList_str)
-                            DSLstream = DSLteam.run_stream(task = requirement) 
-                                           
-                            print(f"DSLstream: {DSLstream}")
-                            async for DSL_msg in DSLstream:
-                                print(f"DSL_msg: {DSL_msg}")
-                                if not isinstance(DSL_msg, TextMessage):
-                                    continue
-                                if DSL_msg.source == "user":                                   
-                                    continue
-                                st.session_state.messages.append({"role": DSL_msg.source, "content": DSL_msg.content})
-                                with st.chat_message("ai"):
-                                    st.write_stream(stream_data(DSL_msg.content))
-                            DSLteamstate = await DSLteam.save_state()
-                            with open(os.path.join(team_state_dir, "DSLTeam_state.json"), "w", encoding="utf-8") as f:
-                                json.dump(DSLteamstate, f, ensure_ascii=False, indent=2, default=str)
-                                
-                            print("################################################################################################")
-
-                            DSLteam_msgs = DSLteamstate["agent_states"]["RoundRobinGroupChatManager"]["message_thread"]
-                            DSLteam_lastmsgs = DSLteam_msgs[-1]["content"]
-                            #print(f"DSLteam_lastmsgs: {DSLteam_lastmsgs}")
 
-                            DSL_query_dict = extract_json_string(text = DSLteam_lastmsgs)
-                            #print(f"DSL_query_dict: {DSL_query_dict}")
-                            writing_status.update(label="DSL writing completed.", state="complete")
-                        except Exception as e:
-                            writing_status.update(label=f"DSL writing failed:{e}", state="error")
-
-                elif st.session_state.field_select and st.session_state.mode == "fast":
-                    with st.status("Selecting field & Writing DSL...", expanded=False) as DSL_status:
-                        try:
-                            DSL_query_dict = generate_elasticsearch_query_from_natural_language(query=requirement, description_path=os.path.join(mapping_dir, "filter_field_description.csv"),mapping_path=os.path.join(mapping_dir, "raw_mapping.json"))
+                # History -> Field -> DSL -> Execute -> Export run headless in pipeline.py, this loop only renders its events
+                inputs = PipelineInput(
+                    customer_name=st.session_state.customer_name,
+                    requirement=user_requirement,
+                    mode=st.session_state.mode,
+                    history_check=st.session_state.history_check,
+                    speculative=st.session_state.speculative,
+                    session_id=st.session_state.session_id,
+                )
+                labels = {
+                    "history": "Finding history...",
+                    "field": "Selecting field...",
+                    "dsl": "Writing DSL...",
+                    "fast_dsl": "Selecting field & Writing DSL...",
+                    "execute": "Querying...",
+                }
+                boxes = {}
+
+                def box(stage):
+                    stage = "execute" if stage == "export" else stage     # execute and export share the Querying status
+                    if stage not in boxes and stage in labels:
+                        boxes[stage] = st.status(labels[stage], expanded=False)
+                    return boxes.get(stage)
+
+                async for event in report_pipeline(inputs).run_stream(inputs):
+                    stage, kind = event.stage, event.kind
+
+                    if stage == "req" and kind == "completed":
+                        st.session_state.customer_name = event.data.customer_name
+                        st.session_state.brand = event.data.brand
+                        print(f"Brand: {event.data.brand}")
+                        print(f"customer_name: {event.data.customer_name}")
+                    elif stage == "cache" and kind == "info":
+                        with st.chat_message("ai"):
+                            st.write(event.data)
+                    elif stage == "cache" and kind == "completed" and event.data.matched:
+                        st.session_state.field_select = False      # cached DSL is already a saved answer
+
+                    elif kind == "started" and event.attempt == 1 and stage in ("history", "field", "fast_dsl", "execute"):
+                        box(stage)
+                    elif kind == "started" and stage == "dsl" and st.session_state.mode == "thinking" and "field" in boxes:
+                        box(stage)
+                    elif kind == "retry" and box(stage) is not None:
+                        box(stage).update(label=f"{labels['execute' if stage == 'export' else stage]} retrying ({event.data})")
+                    elif kind == "message":
+                        st.session_state.messages.append({"role": event.data["source"], "content": event.data["content"]})
+                        with box(stage) or st.container():
                             with st.chat_message("ai"):
-                                st.write(DSL_query_dict) 
-                            DSL_status.update(label="Field selection & DSL writing completed.", state="complete")
-                        except Exception as e:
-                            DSL_status.update(label=f"Field selection & DSL writing failed:{e}", state="error")
-                
-                else:
-                    DSL_query_dict = extract_json_string(text = HistoryTeam_lastmsgs)
-                
-                
-                # OpenSearch and Save Retrived JSON 
-                
-                with st.status("Querying...", expanded=False) as Exe_status:
-                    try:
-                        ExeTeam_task = json.dumps(DSL_query_dict, indent=2, ensure_ascii=False)
-                        Exeteam = await get_Exeteam(customer_name = st.session_state.customer_name)
-                        Exe_stream = Exeteam.run_stream(task=ExeTeam_task)
-                        async for Exe_msg in Exe_stream:
-                            if not isinstance(Exe_msg, TextMessage):
-                                continue
-                            if Exe_msg.source == "user":
-                                continue
-                            st.session_state.messages.append({"role": Exe_msg.source, "content": Exe_msg.content})
+                                st.write_stream(stream_data(event.data["content"]))
+                    elif kind == "info":
+                        with box(stage) or st.container():
                             with st.chat_message("ai"):
-                                st.write_stream(stream_data(Exe_msg.content))  
-                        
-                        Exeteam_state = await Exeteam.save_state()
-                        with open(os.path.join(team_state_dir, "Exeteam_state.json"), "w", encoding="utf-8") as f:
-                            json.dump(Exeteam_state, f, ensure_ascii=False, indent=2, default=str)
-                        Exeteam_msgs = Exeteam_state["agent_states"]["RoundRobinGroupChatManager"]["message_thread"]
-
-                        for Exeteam_msg in reversed(Exeteam_msgs):
-                            if Exeteam_msg.get("type") == "TextMessage":
-                                if Exeteam_msg.get("source") == "DSLModifier":
-                                    DSL_query_dict = extract_json_string(Exeteam_msg.get("content"))
-                                    break
-                                if Exeteam_msg.get("source") == "DSLExecutor":
-                                    json_path_dict = extract_json_string(Exeteam_msg.get("content"))
-                                    json_path_str = json.dumps(json_path_dict, ensure_ascii=False, indent=2).strip("\"'")
-
-                        with target_dsl_path.open("w", encoding="utf-8") as f:
-                            json.dump(DSL_query_dict, f, ensure_ascii=False, indent=2)
-
-                        # Create Excel
-                        excel_path, target_df = agg_json_to_excel(json_path=json_path_str)
-                        st.session_state["excel_path"] = excel_path
-
-
-                        excel_df = pd.read_excel(excel_path, engine="openpyxl")
-                        st.write(excel_df)
-
-                        # Create python script
-                        write_export_script(
-                            customer_name=st.session_state.customer_name,
-                            excel_path="result.xlsx",
-                            query=DSL_query_dict,
-                            out_path=target_py_script,
-                        )
-
+                                st.write(event.data)
+
+                    elif stage == "history" and kind == "completed":
+                        if event.data.matched:
+                            st.session_state.field_select = False
+                            box(stage).update(label="History founded.", state="complete")
+                        else:
+                            box(stage).update(label="History not founded.", state="complete")
+                    elif stage == "history" and kind == "failed":
+                        box(stage).update(label=f"Error:{event.data}", state="error")
+                    elif stage == "field" and kind == "completed":
+                        box(stage).update(label="Field selection completed.", state="complete")
+                    elif stage == "field" and kind == "failed":
+                        box(stage).update(label=f"Field selection failed:{event.data}", state="error")
+                    elif stage == "dsl" and kind == "completed" and "dsl" in boxes:
+                        boxes["dsl"].update(label="DSL writing completed.", state="complete")
+                    elif stage == "dsl" and kind == "failed" and "dsl" in boxes:
+                        boxes["dsl"].update(label=f"DSL writing failed:{event.data}", state="error")
+                    elif stage == "fast_dsl" and kind == "completed":
+                        box(stage).update(label="Field selection & DSL writing completed.", state="complete")
+                    elif stage == "fast_dsl" and kind == "failed":
+                        box(stage).update(label=f"Field selection & DSL writing failed:{event.data}", state="error")
+                    elif stage == "fast_dsl" and kind == "cancelled" and "fast_dsl" in boxes:
+                        boxes["fast_dsl"].update(label="History founded, DSL writing skipped.", state="complete")
+                    elif stage in ("execute", "export") and kind == "failed":
+                        box(stage).update(label=f"Query failed:{event.data}.", state="error", expanded=False)
+                    elif stage == "export" and kind == "completed":
+                        st.session_state["excel_path"] = event.data.report_path
+                        st.session_state["report_df"] = event.data.report_df
+                        st.session_state["report_bytes"] = event.data.report_bytes
+                        with box(stage):
+                            st.write(event.data.report_df)
                         st.session_state.finish = True
-                        
-                        Exe_status.update(label="Query successed.",state="complete", expanded=False)
-                    except Exception as e:
-                        Exe_status.update(label=f"Query failed:{e}.",state="error", expanded=False)          
+                        box(stage).update(label="Query successed.", state="complete", expanded=False)
 
         # DSL/EXCEL download
         if st.session_state.finish:
             # if prompt:
 
-            target_df = pd.read_excel(st.session_state["excel_path"], engine='openpyxl')   
             with target_dsl_path.open("r", encoding="utf-8") as f:
                 dsl = json.load(f)
             target_dsl = json.dumps(dsl, ensure_ascii=False, indent=2).encode("utf-8")
 
-            excel_buffer = io.BytesIO()
-            target_df.to_excel(excel_buffer, index=False, engine='openpyxl')
-            excel_buffer.seek(0)
+            report_suffix = Path(st.session_state["excel_path"]).suffix
             st.download_button(
                 label="Download Report",
-                data=excel_buffer,
-                file_name="report.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                data=st.session_state["report_bytes"],
+                file_name=f"report{report_suffix}",
+                mime=MIME_TYPES.get(report_suffix.lstrip("."), "application/octet-stream"),
                 icon=":material/download:"
             )
 
@@ -408,22 +320,13 @@ async def main():
                                 st.write(new_report)
 
                             ReportSaver_state = await ReportSaver.save_state()
-                            with open(os.path.join(team_state_dir, "ReportSaver_state.json"), "w", encoding="utf-8") as f:
-                                json.dump(ReportSaver_state, f, ensure_ascii=False, indent=2, default=str)
+                            session_store.write_json("ReportSaver_state.json", ReportSaver_state, state=True)
                     
                     #======================================================================================================================
-                            if st.session_state.brand.lower() == "huawei":
-                                with open(os.path.join(rag_dir, "DSL_example_HUAWEI_copy.json"), "r", encoding="utf-8") as f:
-                                    all_report = json.load(f)
-                                all_report.append(new_report)                           
-                                with open(os.path.join(rag_dir, "DSL_example_HUAWEI_copy.json"), "w", encoding="utf-8") as f:
-                                    json.dump(all_report, f, ensure_ascii=False, indent=2)                        
-                            elif st.session_state.brand.lower() == "aruba":
-                                with open(os.path.join(rag_dir, "DSL_example_ARUBA_copy.json"), "r", encoding="utf-8") as f:
-                                    all_report = json.load(f)                              
-                                all_report.append(new_report)
-                                with open(os.path.join(rag_dir, "DSL_example_ARUBA_copy.json"), "w", encoding="utf-8") as f:
-                                    json.dump(all_report, f, ensure_ascii=False, indent=2)
+                            # append to the brand's examples and index only this report (no rebuild)
+                            saved = add_dsl_example(st.session_state.brand, new_report)
+                            if saved["action"] == "error":
+                                raise RuntimeError(saved["response"])
                             save_status.update(label="✅ Save completed.", state="complete")
                         except Exception as e:
                             save_status.update(label=f"Save failed:{e}", state="error")
@@ -432,6 +335,11 @@ async def main():
         st.write(f"error A:{e}")
         print(f"error A:{e}")
         # os.remove(os.path.join(team_state_dir,"Req_state.json"))
+    finally:
+        # release pooled OpenSearch connections before this run's event loop closes
+        await aclose_es_client()
+        await aclose_model_clients()
+        exit_namespace(namespace_token)
 
 if __name__ == "__main__":
     asyncio.run(main())
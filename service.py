@@ -0,0 +1,377 @@
+"""
+HTTP front-end: report jobs on an asyncio worker pool, progress over SSE.
+
+    uvicorn service:app --port 8000
+
+    POST   /jobs                      {"customer_name": "HKJC", "requirement": {...}, "mode": "fast"}
+    GET    /jobs                      jobs of the tenant
+    GET    /jobs/{id}                 status, errors, artifacts, token usage
+    GET    /jobs/{id}/events          text/event-stream of PipelineEvents (replayed from the start)
+    GET    /jobs/{id}/artifacts/{name}  report / dsl / script
+    DELETE /jobs/{id}                 cancel
+
+The tenant is the X-Tenant-ID header. SERVICE_WORKERS jobs run at once in the
+process; a tenant runs at most TENANT_MAX_RUNNING of them and may queue
+TENANT_MAX_QUEUED more (429 beyond that). Workers pick the next job round-robin
+over tenants, so one tenant's backlog does not starve the others. Every job
+writes into its own artifact namespace (artifact_store.py), named by the job id.
+"""
+import asyncio
+import dataclasses
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Deque, Dict, List, Optional
+
+import pandas as pd
+from autogen_core import CancellationToken
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from artifact_store import ARTIFACT_TTL
+from customer_directory import customer_directory
+from es_client import aclose_es_client
+from model_registry import aclose_model_clients
+from pipeline import FINISHED, PipelineEvent, PipelineInput, report_pipeline
+
+#===================================================================
+# Service config
+#===================================================================
+SERVICE_WORKERS = int(os.environ.get("SERVICE_WORKERS", "8"))
+TENANT_MAX_RUNNING = int(os.environ.get("TENANT_MAX_RUNNING", "2"))
+TENANT_MAX_QUEUED = int(os.environ.get("TENANT_MAX_QUEUED", "20"))
+JOB_RETENTION = ARTIFACT_TTL            # seconds a finished job stays listed, as long as its artifacts
+SSE_HEARTBEAT = 15.0                    # seconds between keep-alive comments
+DEFAULT_TENANT = "default"
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class JobRequest(BaseModel):
+    customer_name: str = ""
+    requirement: Optional[Dict[str, Any]] = None    # RequirementsFinalizer JSON; None runs the Req agents on prompt
+    prompt: str = ""
+    mode: str = Field("fast", pattern="^(fast|thinking)$")
+    history_check: bool = True
+    speculative: bool = True
+
+
+def jsonable(value: Any) -> Any:
+    """Stage outputs as JSON: DataFrames become a row count, bytes and catalogs are left out."""
+    if isinstance(value, pd.DataFrame):
+        return {"rows": len(value), "columns": [str(c) for c in value.columns]}
+    if isinstance(value, (bytes, bytearray)):
+        return None
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {f.name: jsonable(getattr(value, f.name)) for f in dataclasses.fields(value)
+                if f.name not in ("fields", "mapping", "report_bytes")}
+    if isinstance(value, dict):
+        return {str(k): jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class Job:
+    def __init__(self, tenant: str, inputs: PipelineInput):
+        self.job_id = inputs.run_id
+        self.tenant = tenant
+        self.inputs = inputs
+        self.status = "queued"          # queued | running | completed | failed | cancelled
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self.result: Dict[str, Any] = {}
+        self.token = CancellationToken()
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def publish(self, event: PipelineEvent):
+        self.events.append({
+            "stage": event.stage,
+            "kind": event.kind,
+            "attempt": event.attempt,
+            "at": event.at,
+            "data": jsonable(event.data),
+        })
+        self._notify()
+
+    def finish(self, status: str, result: Optional[Dict[str, Any]] = None):
+        self.status = status
+        self.finished = time.time()
+        self.result = result or self.result
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def stream(self) -> AsyncGenerator[Optional[Dict[str, Any]], None]:
+        """Every event from the first one, then live ones; None when nothing happened for SSE_HEARTBEAT."""
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.events):
+                sent += 1
+                yield self.events[sent - 1]
+            if self.done:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield None
+
+    def artifacts(self) -> Dict[str, str]:
+        export = self.result.get("export") or {}
+        paths = {"report": export.get("report_path"), "dsl": export.get("dsl_path"), "script": export.get("script_path")}
+        return {name: path for name, path in paths.items() if path}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "tenant": self.tenant,
+            "status": self.status,
+            "customer_name": self.inputs.customer_name,
+            "mode": self.inputs.mode,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "errors": self.result.get("errors", {}),
+            "usage": self.result.get("usage", {}),
+            "timings": self.result.get("timings", {}),
+            "artifacts": sorted(self.artifacts()),
+        }
+
+
+class JobManager:
+    def __init__(self, workers: int = SERVICE_WORKERS, max_running: int = TENANT_MAX_RUNNING,
+                 max_queued: int = TENANT_MAX_QUEUED):
+        self.workers = workers
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.jobs: Dict[str, Job] = {}
+        self._pending: "OrderedDict[str, Deque[Job]]" = OrderedDict()     # tenant -> queued jobs, round-robin order
+        self._running: Dict[str, int] = {}
+        self._cond: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # ---------- lifecycle ---------------------------------------------------------
+    def start(self):
+        self._cond = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if not job.done:
+                job.token.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- jobs --------------------------------------------------------------
+    async def submit(self, tenant: str, inputs: PipelineInput) -> Job:
+        self._forget_expired()
+        async with self._cond:
+            queued = self._pending.get(tenant, ())
+            if len(queued) >= self.max_queued:
+                raise QuotaExceeded(f"tenant {tenant} already has {len(queued)} queued jobs")
+            inputs.session_id = inputs.run_id
+            job = Job(tenant, inputs)
+            self.jobs[job.job_id] = job
+            self._pending.setdefault(tenant, deque()).append(job)
+            self._cond.notify()
+        return job
+
+    def get(self, tenant: str, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        return job if job is not None and job.tenant == tenant else None
+
+    def list(self, tenant: str) -> List[Job]:
+        return [job for job in self.jobs.values() if job.tenant == tenant]
+
+    async def cancel(self, job: Job):
+        async with self._cond:
+            queued = self._pending.get(job.tenant)
+            if job.status == "queued" and queued is not None and job in queued:
+                queued.remove(job)
+                job.finish("cancelled")
+                return
+        job.token.cancel()
+
+    def _forget_expired(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id in [j.job_id for j in self.jobs.values() if j.done and j.finished < cutoff]:
+            self.jobs.pop(job_id, None)
+
+    # ---------- scheduling --------------------------------------------------------
+    def _next_job(self) -> Optional[Job]:
+        """First queued job of the next tenant (round-robin) that is under its running quota."""
+        for tenant in list(self._pending):
+            queued = self._pending[tenant]
+            if not queued:
+                del self._pending[tenant]
+                continue
+            if self._running.get(tenant, 0) >= self.max_running:
+                continue
+            job = queued.popleft()
+            self._pending.move_to_end(tenant)
+            return job
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                job = self._next_job()
+                while job is None:
+                    await self._cond.wait()
+                    job = self._next_job()
+                self._running[job.tenant] = self._running.get(job.tenant, 0) + 1
+            try:
+                await self._run(job)
+            finally:
+                async with self._cond:
+                    self._running[job.tenant] -= 1
+                    self._cond.notify_all()
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.started = time.time()
+        outputs: Dict[str, Any] = {}
+        try:
+            pipeline = report_pipeline(job.inputs)
+            async for event in pipeline.run_stream(job.inputs, job.token):
+                job.publish(event)
+                if event.kind == "completed" and event.stage != "pipeline":
+                    outputs[event.stage] = jsonable(event.data)
+                if event.stage == "pipeline":
+                    data = event.data if isinstance(event.data, dict) else {"errors": {"pipeline": event.data}}
+                    status = "completed" if event.kind == "completed" else ("cancelled" if job.token.is_cancelled() else "failed")
+                    job.finish(status, {**data, **outputs})
+        except Exception as e:
+            job.finish("failed", {"errors": {"service": str(e)}, **outputs})
+        if not job.done:
+            job.finish("failed", {"errors": {"service": "pipeline ended without a result"}, **outputs})
+
+
+job_manager = JobManager()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_manager.start()
+    try:
+        yield
+    finally:
+        await job_manager.stop()
+        await aclose_es_client()
+        await aclose_model_clients()
+
+
+app = FastAPI(title="Text-to-DSL report service", lifespan=lifespan)
+
+
+def _job_or_404(tenant: str, job_id: str) -> Job:
+    job = job_manager.get(tenant, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+    return job
+
+
+@app.get("/health")
+async def health():
+    jobs = list(job_manager.jobs.values())
+    return {
+        "status": "ok",
+        "queued": sum(j.status == "queued" for j in jobs),
+        "running": sum(j.status == "running" for j in jobs),
+    }
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest, x_tenant_id: str = Header(DEFAULT_TENANT)):
+    if request.requirement is None and not request.prompt:
+        raise HTTPException(status_code=422, detail="either requirement or prompt is required")
+    # a finalized requirement skips the customer finder, so its customer must be known up front
+    customer_name = (request.customer_name or (request.requirement or {}).get("customer") or "").strip()
+    if request.requirement is not None and not customer_name:
+        raise HTTPException(status_code=422, detail="customer_name (or requirement.customer) is required")
+    if customer_name:
+        entry = await asyncio.to_thread(customer_directory.resolve, customer_name)
+        if entry is None:
+            raise HTTPException(status_code=422, detail=f"unknown customer '{customer_name}'")
+        customer_name = entry.name
+    inputs = PipelineInput(
+        customer_name=customer_name,
+        requirement=request.requirement,
+        prompt=request.prompt,
+        mode=request.mode,
+        history_check=request.history_check,
+        speculative=request.speculative,
+        run_id=uuid.uuid4().hex,
+    )
+    try:
+        job = await job_manager.submit(x_tenant_id, inputs)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job.job_id, "status": job.status, "events": f"/jobs/{job.job_id}/events"}
+
+
+@app.get("/jobs")
+async def list_jobs(x_tenant_id: str = Header(DEFAULT_TENANT)):
+    return [job.summary() for job in job_manager.list(x_tenant_id)]
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, x_tenant_id: str = Header(DEFAULT_TENANT)):
+    job = _job_or_404(x_tenant_id, job_id)
+    return {**job.summary(), "dsl": (job.result.get("dsl") or {}).get("dsl")}
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, x_tenant_id: str = Header(DEFAULT_TENANT)):
+    job = _job_or_404(x_tenant_id, job_id)
+
+    async def sse():
+        async for event in job.stream():
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['kind']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+        yield f"event: end\ndata: {json.dumps(job.summary(), ensure_ascii=False, default=str)}\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/jobs/{job_id}/artifacts/{name}")
+async def job_artifact(job_id: str, name: str, x_tenant_id: str = Header(DEFAULT_TENANT)):
+    job = _job_or_404(x_tenant_id, job_id)
+    path = job.artifacts().get(name)
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"artifact {name} not available")
+    return FileResponse(path, filename=os.path.basename(path))
+
+
+@app.delete("/jobs/{job_id}", status_code=202)
+async def cancel_job(job_id: str, x_tenant_id: str = Header(DEFAULT_TENANT)):
+    job = _job_or_404(x_tenant_id, job_id)
+    if not job.done:
+        await job_manager.cancel(job)
+    return {"job_id": job.job_id, "status": job.status}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.environ.get("SERVICE_HOST", "0.0.0.0"), port=int(os.environ.get("SERVICE_PORT", "8000")))
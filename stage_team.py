@@ -0,0 +1,101 @@
+"""
+Stage-parallel team: agents of one stage run concurrently, stages run in order.
+
+    team = StageParallelTeam([[FieldSelector1, FieldSelector2],
+                              [FieldCriticalAgent1, FieldCriticalAgent2],
+                              [FieldFinalizer]])
+
+Every agent of a stage receives the whole thread so far (task + outputs of
+the earlier stages) and its MessageFilterAgent picks what it sees, exactly as
+in RoundRobinGroupChat. Agents of the same stage must not read each other.
+run_stream()/save_state() look like a RoundRobinGroupChat, so callers can
+keep reading state["agent_states"]["RoundRobinGroupChatManager"]["message_thread"].
+"""
+import asyncio
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence
+
+from autogen_agentchat.agents import BaseChatAgent, MessageFilterAgent
+from autogen_agentchat.base import Response, TaskResult
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, TextMessage
+from autogen_core import CancellationToken
+
+MANAGER_NAME = "RoundRobinGroupChatManager"
+
+
+def _filter_sources(agent: BaseChatAgent) -> List[str]:
+    if isinstance(agent, MessageFilterAgent):
+        return [f.source for f in agent._filter.per_source]
+    return []
+
+
+class StageParallelTeam:
+    def __init__(self, stages: Sequence[Sequence[BaseChatAgent]], name: str = "StageParallelTeam"):
+        self.name = name
+        self.stages = [list(stage) for stage in stages]
+        self._thread: List[BaseChatMessage] = []
+        for stage in self.stages:
+            names = {agent.name for agent in stage}
+            for agent in stage:
+                # an agent without filter reads everything, so it cannot share a stage
+                sources = _filter_sources(agent)
+                if len(stage) > 1 and (not isinstance(agent, MessageFilterAgent) or names & set(sources)):
+                    raise ValueError(f"{agent.name} depends on an agent of its own stage {sorted(names)}")
+
+    @property
+    def agents(self) -> List[BaseChatAgent]:
+        return [agent for stage in self.stages for agent in stage]
+
+    async def run_stream(
+        self,
+        task: Optional[str] = None,
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[BaseAgentEvent | BaseChatMessage | TaskResult, None]:
+        cancellation_token = cancellation_token or CancellationToken()
+        emitted: List[BaseAgentEvent | BaseChatMessage] = []
+        if task is not None:
+            task_msg = TextMessage(content=task, source="user")
+            self._thread.append(task_msg)
+            emitted.append(task_msg)
+            yield task_msg
+
+        for stage in self.stages:
+            thread = list(self._thread)
+            responses: List[Response] = await asyncio.gather(
+                *(agent.on_messages(thread, cancellation_token) for agent in stage)
+            )
+            for response in responses:      # stage order, not completion order: the thread stays deterministic
+                for inner in response.inner_messages or []:
+                    emitted.append(inner)
+                    yield inner
+                self._thread.append(response.chat_message)
+                emitted.append(response.chat_message)
+                yield response.chat_message
+
+        yield TaskResult(messages=emitted, stop_reason=f"All {len(self.stages)} stages completed.")
+
+    async def run(self, task: Optional[str] = None, cancellation_token: Optional[CancellationToken] = None) -> TaskResult:
+        result = None
+        async for item in self.run_stream(task=task, cancellation_token=cancellation_token):
+            if isinstance(item, TaskResult):
+                result = item
+        return result
+
+    async def reset(self):
+        cancellation_token = CancellationToken()
+        self._thread = []
+        for agent in self.agents:
+            await agent.on_reset(cancellation_token)
+
+    async def save_state(self) -> Dict[str, Any]:
+        agent_states: Dict[str, Any] = {MANAGER_NAME: {"message_thread": [m.dump() for m in self._thread]}}
+        for agent in self.agents:
+            agent_states[agent.name] = await agent.save_state()
+        return {"type": "TeamState", "agent_states": agent_states}
+
+    async def load_state(self, state: Mapping[str, Any]):
+        agent_states = state.get("agent_states", {})
+        for agent in self.agents:
+            if agent.name in agent_states:
+                await agent.load_state(agent_states[agent.name])
+        self._thread = [TextMessage.load(m) for m in agent_states.get(MANAGER_NAME, {}).get("message_thread", [])
+                        if m.get("type") == "TextMessage"]
@@ -0,0 +1,85 @@
+"""The streaming and columnar flatteners must return the rows of the reference agg_json_to_rows."""
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from agg_columns import agg_json_to_table
+from agg_stream import DataFrameSink, stream_agg_file
+from tool import agg_json_to_rows
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_JSON = os.path.join(REPO_DIR, "result", "result.json")
+
+NESTED = {
+    "took": 3,
+    "timed_out": False,
+    "_shards": {"failed": 0},
+    "aggregations": {
+        "total_bytes": {"value": 4200.0},
+        "by_site": {
+            "buckets": [
+                {
+                    "key": "site-a",
+                    "doc_count": 30,
+                    "avg_rssi": {"value": -61.5},
+                    "by_time": {
+                        "buckets": [
+                            {"key": 1700000000000, "key_as_string": "2023-11-14T22:13:20Z", "doc_count": 10,
+                             "clients": {"value": 4}},
+                            {"key": 1700000300000, "key_as_string": "2023-11-14T22:18:20Z", "doc_count": 0,
+                             "clients": {"value": None}},
+                        ]
+                    },
+                    "by_ssid": {
+                        "buckets": [
+                            {"key": "guest", "doc_count": 20, "bytes": {"value": 1000.0}},
+                            {"key": "staff", "doc_count": 10, "bytes": {"value": 2000.0}},
+                        ]
+                    },
+                },
+                {"key": "site-b", "doc_count": 5, "avg_rssi": {"value": -70.0}, "by_time": {"buckets": []}},
+                {"key": 42, "doc_count": 1, "avg_rssi": {"value": None}},
+            ]
+        },
+    },
+}
+
+
+def _normalized(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.reindex(sorted(df.columns), axis=1).reset_index(drop=True)
+    return df.astype(object).where(df.notna(), None)
+
+
+@pytest.fixture(params=["result", "nested"])
+def json_path(request, tmp_path):
+    if request.param == "result":
+        if not os.path.exists(RESULT_JSON):
+            pytest.skip("result/result.json is not there")
+        return RESULT_JSON
+    path = tmp_path / "nested.json"
+    path.write_text(json.dumps(NESTED), encoding="utf-8")
+    return str(path)
+
+
+def test_stream_matches_reference(json_path):
+    expected = _normalized(agg_json_to_rows(json_path))
+    actual = _normalized(stream_agg_file(json_path, DataFrameSink()))
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_columnar_matches_reference(json_path):
+    expected = _normalized(agg_json_to_rows(json_path))
+    actual = _normalized(agg_json_to_table(json_path))
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_nested_fixture_rows(tmp_path):
+    # one row per leaf bucket plus the top-level metric; site-b (empty sub-buckets) has no leaf
+    path = tmp_path / "nested.json"
+    path.write_text(json.dumps(NESTED), encoding="utf-8")
+    df = agg_json_to_rows(path)
+    assert len(df) == 6
+    assert list(df["by_ssid_key"].dropna()) == ["guest", "staff"]
+    assert "site-b" not in set(df["by_site_key"].dropna())
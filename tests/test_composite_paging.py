@@ -0,0 +1,98 @@
+import asyncio
+
+import composite_paging
+from composite_paging import composite_search, merge_page, nest_page, rewrite_to_composite
+
+
+def _dsl(outer_terms=None, inner_aggs=None):
+    outer_terms = outer_terms or {"field": "site.keyword"}
+    inner_aggs = inner_aggs or {"bytes": {"sum": {"field": "bytes"}}}
+    return {
+        "size": 0,
+        "query": {"range": {"@timestamp": {"gte": "now-1d"}}},
+        "aggs": {
+            "by_site": {
+                "terms": outer_terms,
+                "aggs": {"by_ssid": {"terms": {"field": "ssid.keyword"}, "aggs": inner_aggs}},
+            }
+        },
+    }
+
+
+def test_terms_chain_becomes_composite_sources():
+    plan = rewrite_to_composite(_dsl())
+    composite = plan.body["aggs"]["by_site"]
+    assert plan.sources == ["by_site", "by_ssid"]
+    assert composite["composite"]["sources"] == [
+        {"by_site": {"terms": {"field": "site.keyword"}}},
+        {"by_ssid": {"terms": {"field": "ssid.keyword"}}},
+    ]
+    assert composite["aggs"] == {"bytes": {"sum": {"field": "bytes"}}}
+    assert plan.body["query"] == _dsl()["query"]
+
+
+def test_top_n_terms_are_not_rewritten():
+    assert rewrite_to_composite(_dsl({"field": "site.keyword", "size": 5})) is None
+    assert rewrite_to_composite(_dsl({"field": "site.keyword", "order": {"_count": "desc"}})) is None
+    assert rewrite_to_composite(_dsl({"field": "site.keyword", "size": 10000})) is not None
+
+
+def test_key_order_maps_to_source_order():
+    plan = rewrite_to_composite(_dsl({"field": "site.keyword", "order": {"_key": "desc"}}))
+    assert plan.body["aggs"]["by_site"]["composite"]["sources"][0]["by_site"]["terms"]["order"] == "desc"
+
+
+def test_parent_pipeline_children_are_not_moved_under_composite():
+    inner = {
+        "bytes": {"sum": {"field": "bytes"}},
+        "busy": {"bucket_selector": {"buckets_path": {"b": "bytes"}, "script": "params.b > 0"}},
+    }
+    assert rewrite_to_composite(_dsl(inner_aggs=inner)) is None
+
+
+def test_inner_top_n_terms_stays_a_sub_agg():
+    dsl = _dsl()
+    dsl["aggs"]["by_site"]["aggs"]["by_ssid"]["terms"]["size"] = 3
+    plan = rewrite_to_composite(dsl)
+    assert plan.sources == ["by_site"]
+    assert plan.body["aggs"]["by_site"]["aggs"]["by_ssid"]["terms"]["size"] == 3
+
+
+def test_pages_nest_and_merge_back_into_terms_shape():
+    plan = rewrite_to_composite(_dsl())
+    page1 = nest_page(plan, [
+        {"key": {"by_site": "a", "by_ssid": "guest"}, "doc_count": 2, "bytes": {"value": 10.0}},
+        {"key": {"by_site": "a", "by_ssid": "staff"}, "doc_count": 1, "bytes": {"value": 5.0}},
+    ])
+    page2 = nest_page(plan, [
+        {"key": {"by_site": "a", "by_ssid": "voip"}, "doc_count": 4, "bytes": {"value": 1.0}},
+        {"key": {"by_site": "b", "by_ssid": "guest"}, "doc_count": 3, "bytes": {"value": 7.0}},
+    ])
+    merged = {}
+    merge_page(merged, page1, plan.sources)
+    merge_page(merged, page2, plan.sources)
+
+    sites = merged["by_site"]["buckets"]
+    assert [(s["key"], s["doc_count"]) for s in sites] == [("a", 7), ("b", 3)]
+    assert [b["key"] for b in sites[0]["by_ssid"]["buckets"]] == ["guest", "staff", "voip"]
+    assert sites[1]["by_ssid"]["buckets"][0]["bytes"] == {"value": 7.0}
+
+
+def test_composite_search_marks_incomplete_paging(monkeypatch):
+    pages = [
+        {"took": 1, "aggregations": {"by_site": {"after_key": {"by_site": "a", "by_ssid": "x"}, "buckets": [
+            {"key": {"by_site": "a", "by_ssid": "x"}, "doc_count": 1}]}}},
+        {"took": 1, "timed_out": True, "aggregations": {"by_site": {"buckets": [
+            {"key": {"by_site": "b", "by_ssid": "y"}, "doc_count": 1}]}}},
+    ]
+
+    async def fake_fetch(index, plan, after_key):
+        return pages[0] if after_key is None else pages[1]
+
+    monkeypatch.setattr(composite_paging, "_fetch_page", fake_fetch)
+    plan = rewrite_to_composite(_dsl())
+    result = asyncio.run(composite_search("test-*", plan))
+    assert plan.pages == 2
+    assert not plan.complete
+    assert result["timed_out"] is True
+    assert [b["key"] for b in result["aggregations"]["by_site"]["buckets"]] == ["a", "b"]
@@ -0,0 +1,59 @@
+from dsl_validator import DATE_FORMAT, DSLValidator
+
+RAW = {
+    "hkjc-2024.01": {"mappings": {"properties": {
+        "@timestamp": {"type": "date"},
+        "site": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+        "ssid": {"type": "keyword"},
+        "bytes": {"type": "long"},
+        "client": {"properties": {"mac": {"type": "text", "fields": {"keyword": {"type": "keyword"}}}}},
+    }}}
+}
+
+
+def _validator():
+    return DSLValidator(raw=RAW)
+
+
+def test_exact_queries_and_aggs_get_keyword_suffix():
+    report = _validator().validate({
+        "size": 0,
+        "query": {"bool": {"filter": [{"term": {"site": "BOC"}}, {"match": {"client.mac": "aa"}}]}},
+        "aggs": {"by_site": {"terms": {"field": "site"}, "aggs": {"macs": {"terms": {"field": "client.mac"}}}}},
+    })
+    assert report.ok
+    assert report.dsl["query"]["bool"]["filter"][0] == {"term": {"site.keyword": "BOC"}}
+    assert report.dsl["query"]["bool"]["filter"][1] == {"match": {"client.mac": "aa"}}
+    assert report.dsl["aggs"]["by_site"]["terms"]["field"] == "site.keyword"
+    assert report.dsl["aggs"]["by_site"]["aggs"]["macs"]["terms"]["field"] == "client.mac.keyword"
+
+
+def test_keyword_suffix_removed_where_there_is_no_sub_field():
+    report = _validator().validate({"aggs": {"by_ssid": {"terms": {"field": "ssid.keyword"}},
+                                             "total": {"sum": {"field": "bytes"}}}})
+    assert report.dsl["aggs"]["by_ssid"]["terms"]["field"] == "ssid"
+    assert report.dsl["aggs"]["total"]["sum"]["field"] == "bytes"
+    assert any("no keyword sub-field" in c for c in report.changes)
+
+
+def test_unknown_fields_are_reported():
+    report = _validator().validate({"query": {"term": {"venue": "x"}}, "aggs": {"a": {"terms": {"field": "ap_name"}}}})
+    assert not report.ok
+    assert report.unknown_fields == ["venue", "ap_name"]
+    assert "Unknown fields: venue, ap_name" in report.summary()
+
+
+def test_date_range_rewritten_to_the_configured_format():
+    report = _validator().validate({"query": {"range": {"@timestamp": {
+        "gte": "2024-01-01T00:00:00+08:00", "lt": "2024-01-02T00:00:00+08:00"}}}})
+    bounds = report.dsl["query"]["range"]["@timestamp"]
+    assert bounds == {"gte": "2024-01-01T00:00:00", "lt": "2024-01-02T00:00:00",
+                      "time_zone": "+08:00", "format": DATE_FORMAT}
+
+
+def test_relative_dates_and_input_are_left_alone():
+    dsl = {"query": {"range": {"@timestamp": {"gte": "now-7d/d", "lte": "now"}}}}
+    report = _validator().validate(dsl)
+    assert report.dsl == dsl
+    assert report.summary() == "No change needed."
+    assert report.dsl is not dsl
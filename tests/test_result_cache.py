@@ -0,0 +1,27 @@
+from result_cache import ABSOLUTE_TTL, RELATIVE_TTL, ttl_for
+
+PAST = {"gte": "2024-01-01T00:00:00", "lte": "2024-01-31T23:59:59"}
+
+
+def test_closed_past_timestamp_range_gets_absolute_ttl():
+    assert ttl_for({"query": {"range": {"@timestamp": PAST}}}) == ABSOLUTE_TTL
+
+
+def test_relative_timestamp_range_gets_relative_ttl():
+    assert ttl_for({"query": {"range": {"@timestamp": {"gte": "now-7d"}}}}) == RELATIVE_TTL
+
+
+def test_numeric_range_on_time_named_field_is_no_time_bound():
+    query = {"query": {"bool": {"filter": [
+        {"range": {"@timestamp": PAST}},
+        {"range": {"response_time": {"gte": 100, "lte": 5000}}},
+        {"range": {"uptime": {"gte": 3600}}},
+    ]}}}
+    assert ttl_for(query) == ABSOLUTE_TTL
+
+
+def test_mapping_date_fields_decide():
+    query = {"query": {"range": {"created": {"gte": 1704067200000, "lte": 1706745599000}}}}
+    assert ttl_for(query) == RELATIVE_TTL
+    assert ttl_for(query, date_fields={"created"}) == ABSOLUTE_TTL
+    assert ttl_for({"query": {"range": {"@timestamp": PAST}}}, date_fields={"created"}) == RELATIVE_TTL
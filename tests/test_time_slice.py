@@ -0,0 +1,175 @@
+"""Time slices against a small in-memory OpenSearch stand-in: the merged response must equal the single request."""
+import asyncio
+import copy
+import random
+
+import pytest
+
+from time_slice import merge_responses, plan_time_slices, run_sliced
+
+INTERVAL = 5 * 60_000
+START = 1_700_000_000_000 - 1_700_000_000_000 % INTERVAL
+END = START + 2 * 86_400_000
+TERMS = [chr(ord("A") + i) for i in range(12)]
+
+
+def _docs(seed=7, n=4000):
+    rnd = random.Random(seed)
+    docs = []
+    for _ in range(n):
+        term = rnd.choice(TERMS)
+        ts = rnd.randrange(START, END)
+        if term == "L" and ts % 3:          # a sparse term: gaps at slice edges
+            continue
+        docs.append({"@timestamp": ts, "site": term, "bytes": rnd.randrange(1, 100)})
+    return docs
+
+
+# ---------- fake backend (one shard: terms counts are exact) ----------
+def _in_range(ts, bounds):
+    return (("gte" not in bounds or ts >= bounds["gte"]) and ("gt" not in bounds or ts > bounds["gt"])
+            and ("lte" not in bounds or ts <= bounds["lte"]) and ("lt" not in bounds or ts < bounds["lt"]))
+
+
+def _run_aggs(aggs, docs):
+    out = {}
+    for name, agg in aggs.items():
+        sub = agg.get("aggs", {})
+        if "terms" in agg:
+            body = agg["terms"]
+            groups = {}
+            for d in docs:
+                groups.setdefault(d[body["field"]], []).append(d)
+            keys = sorted(groups, key=lambda k: (-len(groups[k]), k))
+            size = body.get("size", 10)
+            out[name] = {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": sum(len(groups[k]) for k in keys[size:]),
+                "buckets": [{"key": k, "doc_count": len(groups[k]), **_run_aggs(sub, groups[k])} for k in keys[:size]],
+            }
+        elif "date_histogram" in agg:
+            body = agg["date_histogram"]
+            step = int(body["fixed_interval"][:-1]) * 60_000
+            groups = {}
+            for d in docs:
+                groups.setdefault(d["@timestamp"] - d["@timestamp"] % step, []).append(d)
+            keys = set(groups)
+            bounds = body.get("extended_bounds", {})
+            for edge in bounds.values():
+                keys.add(edge - edge % step)
+            buckets = []
+            if keys:
+                for key in range(min(keys), max(keys) + 1, step):
+                    buckets.append({"key": key, "doc_count": len(groups.get(key, [])), **_run_aggs(sub, groups.get(key, []))})
+            _run_pipelines(sub, buckets)
+            out[name] = {"buckets": buckets}
+        elif "sum" in agg:
+            out[name] = {"value": float(sum(d[agg["sum"]["field"]] for d in docs))}
+    return out
+
+
+def _run_pipelines(aggs, buckets):
+    for name, agg in aggs.items():
+        if "serial_diff" in agg:
+            body = agg["serial_diff"]
+            lag = body.get("lag", 1)
+            for i, bucket in enumerate(buckets):
+                prev = buckets[i - lag] if i >= lag else None
+                if prev is not None and prev["doc_count"] and bucket["doc_count"]:
+                    bucket[name] = {"value": bucket[body["buckets_path"]]["value"] - prev[body["buckets_path"]]["value"]}
+
+
+def fake_search(docs, body):
+    bounds = body["query"]["bool"]["filter"][0]["range"]["@timestamp"]
+    hits = [d for d in docs if _in_range(d["@timestamp"], bounds)]
+    return {"took": 1, "timed_out": False, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "max_score": None, "hits": []},
+            "aggregations": _run_aggs(body.get("aggs", {}), hits)}
+
+
+def _dsl(terms_size):
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": [{"range": {"@timestamp": {"gte": START, "lt": END, "format": "epoch_millis"}}}]}},
+        "aggs": {"by_site": {
+            "terms": {"field": "site", **({"size": terms_size} if terms_size else {})},
+            "aggs": {"per_5m": {
+                "date_histogram": {"field": "@timestamp", "fixed_interval": "5m"},
+                "aggs": {"bytes": {"sum": {"field": "bytes"}},
+                         "bytes_diff": {"serial_diff": {"buckets_path": "bytes", "lag": 1}}},
+            }},
+        }},
+    }
+
+
+def _sliced(dsl, docs, slices=4):
+    plan = plan_time_slices(dsl, slices)
+    assert plan is not None
+
+    async def fetch(body):
+        return fake_search(docs, body)
+
+    return asyncio.run(run_sliced(plan, fetch))
+
+
+def test_top_n_terms_are_not_sliced():
+    assert plan_time_slices(_dsl(5), 4) is None
+    assert plan_time_slices(_dsl(None), 4) is None
+    dsl = _dsl(1000)
+    dsl["aggs"]["by_site"]["multi_terms"] = dsl["aggs"]["by_site"].pop("terms")
+    assert plan_time_slices(dsl, 4) is None
+
+
+def test_sliced_equals_single_request():
+    docs = _docs()
+    dsl = _dsl(1000)
+    single_response = fake_search(docs, dsl)
+    merged_response = _sliced(dsl, docs)
+    assert merged_response["hits"]["total"] == single_response["hits"]["total"]
+    single, merged = single_response["aggregations"], merged_response["aggregations"]
+
+    single_sites = {b["key"]: b for b in single["by_site"]["buckets"]}
+    merged_sites = {b["key"]: b for b in merged["by_site"]["buckets"]}
+    assert [b["key"] for b in merged["by_site"]["buckets"]] == [b["key"] for b in single["by_site"]["buckets"]]
+    for key, expected in single_sites.items():
+        actual = merged_sites[key]
+        assert actual["doc_count"] == expected["doc_count"]
+        assert actual["per_5m"]["buckets"] == expected["per_5m"]["buckets"], key
+
+
+def test_slices_keep_empty_buckets_at_their_edges():
+    plan = plan_time_slices(_dsl(1000), 4)
+    bodies = plan.bodies()
+    first = bodies[0]["aggs"]["by_site"]["aggs"]["per_5m"]["date_histogram"]["extended_bounds"]
+    middle = bodies[1]["aggs"]["by_site"]["aggs"]["per_5m"]["date_histogram"]["extended_bounds"]
+    last = bodies[-1]["aggs"]["by_site"]["aggs"]["per_5m"]["date_histogram"]["extended_bounds"]
+    assert set(first) == {"max"} and set(middle) == {"min", "max"} and set(last) == {"min"}
+    assert "extended_bounds" not in plan.query["aggs"]["by_site"]["aggs"]["per_5m"]["date_histogram"]
+
+
+def test_capped_slice_total_is_a_lower_bound():
+    docs = _docs()
+    plan = plan_time_slices(_dsl(1000), 4)
+    responses = [fake_search(docs, body) for body in plan.bodies()]
+    responses[1]["hits"]["total"]["relation"] = "gte"
+    assert merge_responses(plan, responses)["hits"]["total"]["relation"] == "gte"
+
+
+def test_incomplete_slice_falls_back_to_one_request():
+    docs = _docs()
+    dsl = _dsl(1000)
+    plan = plan_time_slices(dsl, 4)
+    calls = []
+
+    async def fetch(body):
+        calls.append(body)
+        small = copy.deepcopy(body)
+        small["aggs"]["by_site"]["terms"]["size"] = 3       # backend cut the terms short
+        return fake_search(docs, small if len(calls) <= len(plan.slices) else body)
+
+    result = asyncio.run(run_sliced(plan, fetch))
+    assert len(calls) == len(plan.slices) + 1
+    assert calls[-1] is plan.query
+    assert result["aggregations"]["by_site"]["sum_other_doc_count"] == 0
+    with pytest.raises(Exception):
+        merge_responses(plan, [fake_search(docs, {**b, "aggs": _dsl(3)["aggs"]}) for b in plan.bodies()])
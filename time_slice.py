@@ -0,0 +1,560 @@
+"""
+Time-sliced execution of long-range aggregation queries.
+
+The @timestamp range filter of a DSL is cut into N consecutive sub-ranges that
+are queried concurrently and merged back into one response:
+- slice boundaries are aligned to the date_histogram interval, so no bucket is split
+- each slice asks for empty histogram buckets up to its own edges (extended_bounds),
+  and the merged histogram is trimmed to its first and last non-empty bucket, like
+  the single request
+- every slice but the first starts `lag * interval` earlier (warm-up) so parent
+  pipelines (serial_diff, derivative, moving_fn) see their previous buckets;
+  warm-up buckets are dropped when merging
+- terms/filter/range buckets are merged by key, sum/min/max/value_count are
+  combined and max/min/avg/sum_bucket are recomputed on the merged buckets
+- a terms above the histogram must ask for every term (size >= ALL_TERMS_SIZE):
+  a top-N of each slice is not the top-N of the whole range. When a slice still
+  reports sum_other_doc_count, the slices are discarded and the query runs once.
+Anything that cannot be merged exactly (top-N terms, multi_terms, top_hits,
+cumulative_sum, avg/cardinality outside the histogram, calendar months,
+offsets ...) makes plan_time_slices() return None and the query runs as a
+single request.
+
+Only the standard library is used: the exporter script inlines this module.
+"""
+import asyncio
+import copy
+import json
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+#===================================================================
+# Time slice config
+#===================================================================
+TIME_FIELD = "@timestamp"
+DEFAULT_SLICES = 4
+MAX_CONCURRENCY = 4
+MIN_BUCKETS_PER_SLICE = 12      # fewer histogram buckets per slice are not worth a request
+ALL_TERMS_SIZE = 1000           # a terms size from here on asks for every term (as in composite_paging)
+
+UNIT_MS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+CALENDAR_INTERVALS = {"minute": "1m", "1m": "1m", "hour": "1h", "1h": "1h", "day": "1d", "1d": "1d"}
+LAG_PIPELINES = {"serial_diff": "lag", "derivative": None, "moving_fn": "window", "moving_avg": "window"}
+SIBLING_PIPELINES = {"max_bucket", "min_bucket", "avg_bucket", "sum_bucket"}
+MERGEABLE_METRICS = {"sum", "min", "max", "value_count"}
+KEYED_BUCKET_AGGS = {"terms", "range", "date_range", "filters"}
+SINGLE_BUCKET_AGGS = {"filter", "missing", "nested", "reverse_nested"}
+UTC_ZONES = {"utc", "z", "+00:00", "etc/utc", "gmt"}
+
+
+class SliceUnsafe(Exception):
+    """The DSL cannot be split into time slices without changing its result."""
+
+
+@dataclass
+class SlicePlan:
+    query: Dict[str, Any]
+    range_path: List[Any]               # path to the {TIME_FIELD: bounds} dict inside query
+    end_inclusive: bool
+    slices: List[Tuple[int, int]]       # (start_ms, end_ms) of each slice, without warm-up
+    warmup_ms: int
+    hist_names: List[str]
+
+    def bodies(self) -> List[Dict[str, Any]]:
+        """One DSL per slice, with the time filter rewritten to epoch millis."""
+        bodies = []
+        for i, (start, end) in enumerate(self.slices):
+            body = copy.deepcopy(self.query)
+            node = body
+            for key in self.range_path:
+                node = node[key]
+            last = i == len(self.slices) - 1
+            bounds = {"gte": start - (self.warmup_ms if i else 0), "format": "epoch_millis"}
+            bounds["lte" if last and self.end_inclusive else "lt"] = end
+            node[TIME_FIELD] = bounds
+            # empty buckets up to the slice edges, so a gap at an edge is not lost (trimmed again on merge)
+            _extend_bounds(body.get("aggs", body.get("aggregations", {})) or {},
+                           bounds["gte"] if i else None, None if last else end - 1)
+            bodies.append(body)
+        return bodies
+
+
+def _extend_bounds(aggs: Dict[str, Any], low: Optional[int], high: Optional[int]):
+    """Set extended_bounds on the sliced (outermost) date_histograms that keep empty buckets."""
+    for agg in aggs.values():
+        if not isinstance(agg, dict):
+            continue
+        if "date_histogram" in agg:
+            hist = agg["date_histogram"]
+            if hist.get("min_doc_count", 0) == 0 and (low is not None or high is not None):
+                hist["extended_bounds"] = {k: v for k, v in (("min", low), ("max", high)) if v is not None}
+        else:
+            _extend_bounds(agg.get("aggs", agg.get("aggregations", {})) or {}, low, high)
+
+
+# ---------- ① time parsing -------------------------------------------------------
+def _parse_tz(name: Optional[str]) -> timezone:
+    if not name or name.lower() in UTC_ZONES:
+        return timezone.utc
+    m = re.fullmatch(r"([+-])(\d{2}):?(\d{2})", name)
+    if m:
+        delta = timedelta(hours=int(m.group(2)), minutes=int(m.group(3)))
+        return timezone(delta if m.group(1) == "+" else -delta)
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except Exception:
+        raise SliceUnsafe(f"unknown time_zone {name}")
+
+
+def _round_ms(ms: int, unit: str, up: bool, tz) -> int:
+    dt = datetime.fromtimestamp(ms / 1000, tz)
+    if unit == "d":
+        floor = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        step = timedelta(days=1)
+    elif unit == "h":
+        floor = dt.replace(minute=0, second=0, microsecond=0)
+        step = timedelta(hours=1)
+    elif unit == "m":
+        floor = dt.replace(second=0, microsecond=0)
+        step = timedelta(minutes=1)
+    elif unit == "s":
+        floor = dt.replace(microsecond=0)
+        step = timedelta(seconds=1)
+    else:
+        raise SliceUnsafe(f"rounding to /{unit}")
+    rounded = floor + step - timedelta(milliseconds=1) if up else floor
+    return int(rounded.timestamp() * 1000)
+
+
+def parse_bound(value: Any, op: str, tz_name: Optional[str] = None, now_ms: Optional[int] = None) -> int:
+    """Epoch millis of a range bound: epoch numbers, ISO dates or now[+-N unit][/unit]."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value) if value > 1e11 else int(value * 1000)
+    if not isinstance(value, str):
+        raise SliceUnsafe(f"range bound {value!r}")
+    if value.isdigit():
+        return parse_bound(int(value), op, tz_name, now_ms)
+    tz = _parse_tz(tz_name)
+    m = re.fullmatch(r"now((?:[+-]\d+[smhdw])*)(?:/([smhd]))?", value.replace(" ", ""))
+    if m:
+        ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        for sign, n, unit in re.findall(r"([+-])(\d+)([smhdw])", m.group(1)):
+            ms += (1 if sign == "+" else -1) * int(n) * UNIT_MS[unit]
+        if m.group(2):
+            ms = _round_ms(ms, m.group(2), op in ("lte", "gt"), tz)
+        return ms
+    if "||" in value:
+        raise SliceUnsafe(f"date math {value}")
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise SliceUnsafe(f"range bound {value}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz)
+    return int(dt.timestamp() * 1000)
+
+
+def _interval_ms(hist: Dict[str, Any]) -> int:
+    if "fixed_interval" in hist:
+        text = hist["fixed_interval"]
+    elif "calendar_interval" in hist or "interval" in hist:
+        text = CALENDAR_INTERVALS.get(hist.get("calendar_interval", hist.get("interval")))
+        if text is None and "interval" in hist:
+            text = hist["interval"]
+    else:
+        text = None
+    m = re.fullmatch(r"(\d+)(ms|s|m|h|d)", str(text or ""))
+    if not m:
+        raise SliceUnsafe(f"histogram interval {text}")
+    return int(m.group(1)) * UNIT_MS[m.group(2)]
+
+
+# ---------- ② DSL analysis -------------------------------------------------------
+def _sub_aggs(agg: Dict[str, Any]) -> Dict[str, Any]:
+    return agg.get("aggs", agg.get("aggregations", {})) or {}
+
+
+def _agg_type(agg: Dict[str, Any]) -> str:
+    types = [k for k in agg if k not in ("aggs", "aggregations", "meta")]
+    if len(types) != 1:
+        raise SliceUnsafe(f"aggregation {list(agg)}")
+    return types[0]
+
+
+def _find_time_ranges(node: Any, path: List[Any], found: List[Tuple[List[Any], Dict, bool]], safe: bool = True):
+    if isinstance(node, dict):
+        for k, v in node.items():
+            if k == "range" and isinstance(v, dict) and TIME_FIELD in v:
+                found.append((path + [k], v[TIME_FIELD], safe))
+            else:
+                _find_time_ranges(v, path + [k], found, safe and k not in ("should", "must_not"))
+    elif isinstance(node, list):
+        for i, item in enumerate(node):
+            _find_time_ranges(item, path + [i], found, safe)
+
+
+class _AggScan:
+    """Collect histogram intervals and warm-up lag, raise SliceUnsafe on unmergeable aggs."""
+
+    def __init__(self):
+        self.intervals: List[int] = []
+        self.lag_ms = 0
+        self.hist_names: List[str] = []
+        self.metrics_above = False
+
+    def scan(self, aggs: Dict[str, Any], in_hist: bool, interval: int = 0):
+        for name, agg in aggs.items():
+            kind = _agg_type(agg)
+            body = agg[kind]
+            if kind == "date_histogram":
+                if body.get("field", TIME_FIELD) != TIME_FIELD and not in_hist:
+                    raise SliceUnsafe(f"date_histogram on {body.get('field')}")
+                if not in_hist:
+                    if set(body) & {"offset", "extended_bounds", "hard_bounds", "order"}:
+                        raise SliceUnsafe(f"date_histogram options of {name}")
+                    tz = body.get("time_zone")
+                    step = _interval_ms(body)
+                    if tz and tz.lower() not in UTC_ZONES and UNIT_MS["h"] % step:
+                        raise SliceUnsafe(f"time_zone {tz} with interval {step}ms")
+                    self.intervals.append(step)
+                    self.hist_names.append(name)
+                    self.scan(_sub_aggs(agg), True, step)
+                else:
+                    # pipelines of a nested histogram stay inside one outer bucket
+                    self.scan(_sub_aggs(agg), True)
+                continue
+            if in_hist:
+                if kind == "cumulative_sum" or kind == "bucket_sort":
+                    raise SliceUnsafe(kind)
+                if kind in LAG_PIPELINES and body.get("gap_policy", "skip") != "skip":
+                    raise SliceUnsafe(f"{kind} gap_policy {body['gap_policy']}")
+                if kind in LAG_PIPELINES and interval:
+                    param = LAG_PIPELINES[kind]
+                    lag = int(body.get(param, 1)) if param else 1
+                    self.lag_ms = max(self.lag_ms, lag * interval)
+                self.scan(_sub_aggs(agg), True)
+            elif kind in KEYED_BUCKET_AGGS or kind in SINGLE_BUCKET_AGGS:
+                order = body.get("order") if kind == "terms" else None
+                for item in (order if isinstance(order, list) else [order] if order else []):
+                    if set(item) - {"_key", "_count", "_term"}:
+                        raise SliceUnsafe(f"terms order {item}")
+                if kind == "terms" and set(body) & {"script", "min_doc_count"}:
+                    raise SliceUnsafe(f"terms options of {name}")
+                if kind == "terms" and not (isinstance(body.get("size"), int) and body["size"] >= ALL_TERMS_SIZE):
+                    raise SliceUnsafe(f"top-N terms {name}")
+                self.scan(_sub_aggs(agg), False)
+            elif kind in MERGEABLE_METRICS:
+                self.metrics_above = True
+            elif kind in SIBLING_PIPELINES:
+                if str(body.get("buckets_path", ">>")).count(">") > 1:
+                    raise SliceUnsafe(f"{kind} buckets_path")
+            else:
+                raise SliceUnsafe(f"{kind} outside the date_histogram")
+
+
+def plan_time_slices(
+    query: Union[str, Dict[str, Any]],
+    slices: int = DEFAULT_SLICES,
+    now_ms: Optional[int] = None,
+) -> Optional[SlicePlan]:
+    """Return a SlicePlan, or None when the DSL must run as a single request."""
+    try:
+        if isinstance(query, str):
+            query = json.loads(query)
+        if not isinstance(query, dict) or slices < 2 or query.get("size", 10) != 0:
+            return None
+
+        found: List[Tuple[List[Any], Dict, bool]] = []
+        _find_time_ranges(query.get("query", {}), ["query"], found)
+        if len(found) != 1 or not found[0][2]:
+            return None
+        path, bounds, _ = found[0]
+        if not isinstance(bounds, dict):
+            return None
+
+        scan = _AggScan()
+        scan.scan(query.get("aggs", query.get("aggregations", {})) or {}, False)
+        if scan.lag_ms and scan.metrics_above:
+            return None         # warm-up documents would leak into those metrics
+
+        tz_name = bounds.get("time_zone")
+        lower_op = "gte" if "gte" in bounds else "gt" if "gt" in bounds else "from" if "from" in bounds else None
+        upper_op = "lte" if "lte" in bounds else "lt" if "lt" in bounds else "to" if "to" in bounds else None
+        if lower_op is None or "format" in bounds and bounds["format"] not in (
+                "epoch_millis", "strict_date_optional_time", "yyyy-MM-dd'T'HH:mm:ss", "yyyy-MM-dd HH:mm:ss"):
+            return None
+        start = parse_bound(bounds[lower_op], lower_op, tz_name, now_ms) + (1 if lower_op == "gt" else 0)
+        end = parse_bound(bounds[upper_op], upper_op, tz_name, now_ms) if upper_op else (
+            now_ms if now_ms is not None else int(time.time() * 1000))
+        end_inclusive = upper_op in ("lte", "to", None)
+
+        align = max(scan.intervals) if scan.intervals else UNIT_MS["m"]
+        if any(align % step for step in scan.intervals):
+            return None
+        slices = min(slices, (end - start) // (align * MIN_BUCKETS_PER_SLICE))
+        if slices < 2:
+            return None
+        slice_len = math.ceil((end - start) / slices / align) * align
+        first_edge = start - start % align
+        edges = [start] + [first_edge + k * slice_len for k in range(1, slices)] + [end]
+        ranges = [(a, b) for a, b in zip(edges, edges[1:]) if a < b]
+        if len(ranges) < 2:
+            return None
+
+        return SlicePlan(
+            query=query,
+            range_path=path,
+            end_inclusive=end_inclusive,
+            slices=ranges,
+            warmup_ms=scan.lag_ms,
+            hist_names=scan.hist_names,
+        )
+    except (SliceUnsafe, json.JSONDecodeError, TypeError, ValueError):
+        return None
+
+
+# ---------- ③ merge --------------------------------------------------------------
+def _drop_warmup(aggs_spec: Dict[str, Any], result: Dict[str, Any], start: int) -> int:
+    """Remove histogram buckets before `start`; return the removed doc count."""
+    dropped_total = 0
+    for name, agg in aggs_spec.items():
+        kind = _agg_type(agg)
+        node = result.get(name)
+        if not isinstance(node, dict):
+            continue
+        if kind == "date_histogram":
+            kept = [b for b in node.get("buckets", []) if b["key"] >= start]
+            dropped_total += sum(b.get("doc_count", 0) for b in node.get("buckets", [])) - \
+                sum(b.get("doc_count", 0) for b in kept)
+            node["buckets"] = kept
+        elif kind in SINGLE_BUCKET_AGGS:
+            dropped = _drop_warmup(_sub_aggs(agg), node, start)
+            node["doc_count"] = node.get("doc_count", 0) - dropped
+            dropped_total += dropped
+        elif kind in KEYED_BUCKET_AGGS:
+            buckets = node.get("buckets", [])
+            items = buckets.values() if isinstance(buckets, dict) else buckets
+            for bucket in items:
+                dropped = _drop_warmup(_sub_aggs(agg), bucket, start)
+                bucket["doc_count"] = bucket.get("doc_count", 0) - dropped
+                dropped_total += dropped
+            if kind == "terms" and isinstance(buckets, list):
+                node["buckets"] = [b for b in buckets if b["doc_count"] > 0]
+    return dropped_total
+
+
+def _bucket_key(bucket: Dict[str, Any]) -> Any:
+    key = bucket.get("key")
+    return json.dumps(key, sort_keys=True) if isinstance(key, (dict, list)) else key
+
+
+def _sort_terms(buckets: List[Dict[str, Any]], order: Any) -> List[Dict[str, Any]]:
+    items = order if isinstance(order, list) else [order] if order else [{"_count": "desc"}, {"_key": "asc"}]
+    for item in reversed(items):
+        (field, direction), = item.items()
+        field = "doc_count" if field == "_count" else "key"
+        buckets = sorted(buckets, key=lambda b: b[field], reverse=direction == "desc")
+    return buckets
+
+
+def _merge_metric(kind: str, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    values = [n.get("value") for n in nodes if n.get("value") is not None]
+    if kind in ("sum", "value_count"):
+        value = sum(values)
+    elif kind == "min":
+        value = min(values) if values else None
+    else:
+        value = max(values) if values else None
+    return {"value": value}
+
+
+def _sibling_pipeline(kind: str, body: Dict[str, Any], merged: Dict[str, Any]) -> Dict[str, Any]:
+    path = body["buckets_path"]
+    target, _, metric = path.partition(">")
+    if not metric:
+        target, _, metric = path.partition(".")
+    node = merged.get(target, {})
+    buckets = node.get("buckets", [])
+    pairs = []
+    for bucket in (buckets.values() if isinstance(buckets, dict) else buckets):
+        if metric == "_count":
+            value = bucket.get("doc_count")
+        else:
+            name, _, prop = metric.partition(".")
+            sub = bucket.get(name, {})
+            value = sub.get(prop or "value") if isinstance(sub, dict) else None
+        if value is not None:
+            pairs.append((bucket.get("key_as_string", str(bucket.get("key"))), value))
+    values = [v for _, v in pairs]
+    if kind in ("max_bucket", "min_bucket"):
+        if not values:
+            return {"value": None, "keys": []}
+        best = max(values) if kind == "max_bucket" else min(values)
+        return {"value": best, "keys": [k for k, v in pairs if v == best]}
+    if kind == "sum_bucket":
+        return {"value": sum(values)}
+    return {"value": sum(values) / len(values) if values else None}
+
+
+def _trim_empty(buckets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop the empty buckets before the first and after the last non-empty one."""
+    filled = [i for i, b in enumerate(buckets) if b.get("doc_count", 0)]
+    return buckets[filled[0]:filled[-1] + 1] if filled else []
+
+
+def _check_complete(aggs_spec: Dict[str, Any], node: Dict[str, Any]):
+    """Every terms above the histogram returned all of its terms, else the slices cannot be merged."""
+    for name, agg in aggs_spec.items():
+        kind = _agg_type(agg)
+        part = node.get(name)
+        if not isinstance(part, dict) or kind == "date_histogram":
+            continue
+        if kind == "terms" and part.get("sum_other_doc_count", 0):
+            raise SliceUnsafe(f"{name} has more terms than its size")
+        if kind in SINGLE_BUCKET_AGGS:
+            _check_complete(_sub_aggs(agg), part)
+        elif kind in KEYED_BUCKET_AGGS:
+            buckets = part.get("buckets", [])
+            for bucket in (buckets.values() if isinstance(buckets, dict) else buckets):
+                _check_complete(_sub_aggs(agg), bucket)
+
+
+def _merge_aggs(aggs_spec: Dict[str, Any], nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {}
+    pipelines = []
+    for name, agg in aggs_spec.items():
+        kind = _agg_type(agg)
+        parts = [n[name] for n in nodes if isinstance(n.get(name), dict)]
+        if kind in SIBLING_PIPELINES:
+            pipelines.append((name, kind, agg[kind]))
+            continue
+        if not parts:
+            continue
+        if kind == "date_histogram":
+            merged[name] = {**parts[0], "buckets": _trim_empty([b for p in parts for b in p.get("buckets", [])])}
+        elif kind in MERGEABLE_METRICS:
+            merged[name] = _merge_metric(kind, parts)
+        elif kind in SINGLE_BUCKET_AGGS:
+            merged[name] = {
+                "doc_count": sum(p.get("doc_count", 0) for p in parts),
+                **_merge_aggs(_sub_aggs(agg), parts),
+            }
+        elif kind in KEYED_BUCKET_AGGS:
+            merged[name] = _merge_keyed(kind, agg, parts)
+    for name, kind, body in pipelines:
+        merged[name] = _sibling_pipeline(kind, body, merged)
+    return merged
+
+
+def _merge_keyed(kind: str, agg: Dict[str, Any], parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    keyed = isinstance(parts[0].get("buckets"), dict)
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for part in parts:
+        buckets = part.get("buckets", {} if keyed else [])
+        for key, bucket in (buckets.items() if keyed else ((_bucket_key(b), b) for b in buckets)):
+            groups.setdefault(key, []).append(bucket)
+
+    merged_buckets = {}
+    for key, group in groups.items():
+        bucket = {k: v for k, v in group[0].items() if k in ("key", "key_as_string", "from", "to",
+                                                              "from_as_string", "to_as_string")}
+        bucket["doc_count"] = sum(b.get("doc_count", 0) for b in group)
+        bucket.update(_merge_aggs(_sub_aggs(agg), group))
+        merged_buckets[key] = bucket
+
+    if keyed:
+        return {"buckets": merged_buckets}
+    buckets = list(merged_buckets.values())
+    result = {k: v for k, v in parts[0].items() if k != "buckets"}
+    if kind == "terms":
+        size = agg["terms"].get("size", 10)
+        buckets = _sort_terms(buckets, agg["terms"].get("order"))
+        other = sum(p.get("sum_other_doc_count", 0) for p in parts)
+        result["sum_other_doc_count"] = other + sum(b["doc_count"] for b in buckets[size:])
+        result["doc_count_error_upper_bound"] = sum(p.get("doc_count_error_upper_bound", 0) for p in parts)
+        buckets = buckets[:size]
+    result["buckets"] = buckets
+    return result
+
+
+def _hits_total(response: Dict[str, Any]) -> int:
+    total = response.get("hits", {}).get("total", 0)
+    return total.get("value", 0) if isinstance(total, dict) else total or 0
+
+
+def _hits_relation(response: Dict[str, Any]) -> str:
+    total = response.get("hits", {}).get("total", 0)
+    return total.get("relation", "eq") if isinstance(total, dict) else "eq"
+
+
+def merge_responses(plan: SlicePlan, responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the per-slice responses into one response of the original DSL.
+    Raise SliceUnsafe when a slice came back incomplete (a terms with sum_other_doc_count).
+    """
+    aggs_spec = plan.query.get("aggs", plan.query.get("aggregations", {})) or {}
+    for response in responses:
+        _check_complete(aggs_spec, response.get("aggregations", {}))
+    # warm-up documents are in the hits of their slice too; sibling aggs see the same documents,
+    # so the one that dropped the most stands for them
+    warmup_docs = 0
+    for (start, _), response in zip(plan.slices[1:], responses[1:]):
+        if plan.warmup_ms:
+            result = response.get("aggregations", {})
+            warmup_docs += max((_drop_warmup({name: agg}, result, start) for name, agg in aggs_spec.items()), default=0)
+    aggregations = [response.get("aggregations", {}) for response in responses]
+
+    total = max(0, sum(_hits_total(r) for r in responses) - warmup_docs)
+    relation = "gte" if any(_hits_relation(r) == "gte" for r in responses) else "eq"
+    shards = {k: sum(r.get("_shards", {}).get(k, 0) for r in responses) for k in ("total", "successful", "skipped", "failed")}
+    return {
+        "took": max(r.get("took", 0) for r in responses),
+        "timed_out": any(r.get("timed_out") for r in responses),
+        "_shards": shards,
+        "hits": {"total": {"value": total, "relation": relation}, "max_score": None, "hits": []},
+        "time_slices": len(plan.slices),
+        "aggregations": _merge_aggs(aggs_spec, aggregations),
+    }
+
+
+# ---------- ④ executors ----------------------------------------------------------
+async def run_sliced(
+    plan: SlicePlan,
+    fetch: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    max_concurrency: int = MAX_CONCURRENCY,
+) -> Dict[str, Any]:
+    """
+    Run the slices with at most max_concurrency requests in flight (fetch: body -> parsed response).
+    Falls back to one request of the original DSL when the slices cannot be merged.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _one(body):
+        async with semaphore:
+            return await fetch(body)
+
+    responses = await asyncio.gather(*(_one(body) for body in plan.bodies()))
+    try:
+        return merge_responses(plan, list(responses))
+    except SliceUnsafe:
+        return await fetch(plan.query)
+
+
+def run_sliced_sync(
+    plan: SlicePlan,
+    fetch: Callable[[Dict[str, Any]], Dict[str, Any]],
+    max_workers: int = MAX_CONCURRENCY,
+) -> Dict[str, Any]:
+    """Thread-pool variant of run_sliced for synchronous clients."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        responses = list(pool.map(fetch, plan.bodies()))
+    try:
+        return merge_responses(plan, responses)
+    except SliceUnsafe:
+        return fetch(plan.query)
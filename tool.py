@@ -1,55 +1,31 @@
 from config import mapping_dir, result_dir
+from artifact_store import atomic_write_json, mapping_path, result_path
+from es_client import SEARCH_TIMEOUT, es_request, es_stream, index_pattern
+from result_cache import result_cache, ttl_for
+from keyword_cache import keyword_cache
+from mapping_cache import mapping_cache, MappingCacheError
+from agg_stream import DataFrameSink, stream_agg_file
+from agg_columns import agg_json_to_table
+from report_writer import write_report
+from composite_paging import rewrite_to_composite, composite_search
+from time_slice import plan_time_slices, run_sliced
+from field_catalog import get_field_catalog
 from autogen_core.tools import FunctionTool
 from pathlib import Path
 from typing import Dict, List
 import pandas as pd
 import os
 import json
-import requests
-from requests.auth import HTTPBasicAuth
-from typing import List, Dict, Optional
+from typing import Annotated, List, Dict, Optional
 import ast
+import re
 from datetime import datetime
 import pytz
 
 async def get_keyword(field_name: str, customer_name: str = "*") -> list:
     try:
-        # 构造 URL 和认证信息
-        if customer_name != "*":
-            index_pattern = customer_name.lower() + "-*"
-        if "keyword" not in field_name:
-            field_name = field_name + ".keyword"
-        url = f"https://jumphost.hkt-ems.com:443/{index_pattern}/_search"
-        auth = ('internship', 'P@ssw0rd')
-
-        # 构造查询 DSL
-        body = {
-            "size": 0,
-            "aggs": {
-                "all_values": {
-                    "terms": {
-                        "field": field_name,
-                        "size": 10000
-                    }
-                }
-            }
-        }
-
-        # 发起 GET 请求（注意：GET 请求中传 body 要加 json.dumps）
-        response = requests.get(
-            url,
-            auth=auth,
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(body),
-            timeout=30,
-            verify=False
-        )
-
-        response.raise_for_status()  # 若状态码非 2xx，抛出异常
-
-        data = response.json()
-        buckets = data.get("aggregations", {}).get("all_values", {}).get("buckets", [])
-        return [bucket["key"] for bucket in buckets]
+        # 缓存命中时直接返回，过期时后台刷新（见 keyword_cache.py）
+        return await keyword_cache.get(customer_name, field_name)
     except Exception as e:
         return [f"Failed to query OpenDistro: {e}"]
 Get_keyword_tool = FunctionTool(get_keyword, description="A tool that gets keyword value of a field. ")
@@ -91,38 +67,31 @@ def flatten_es_mapping(mapping: dict) -> dict:
 # =========================
 # Tool: Get Flattened Mapping
 # =========================
+# mapping file path -> (index pattern, mapping version) written there
+_written_mapping_versions: Dict[str, tuple] = {}
+
 async def get_flattened_mapping(customer_name: str) -> str:
     """
     Retrieve and flatten mapping for a given customer name.
-    Saves output to 'flattened_mapping.json' in current dir.
+    Saves output to 'flattened_mapping.json' of the session namespace (mapping_dir outside of one).
     Returns flattened mapping as JSON string.
+    The mapping comes from mapping_cache and is only downloaded when the customer's index set changed.
     """
     try:
-        filename = "flattened_mapping.json"
-        output_path = os.path.join(mapping_dir, filename)
-        raw_mapping = os.path.join(mapping_dir, "raw_mapping.json")
-        index = f"{customer_name.lower()}-*"
-        es_url = "https://jumphost.hkt-ems.com:443"
-        auth = ("internship", "P@ssw0rd")
-        headers = {"Content-Type": "application/json"}
- 
-        search_url = f"{es_url}/{index}/_mapping"
-        response = requests.get(search_url, auth=auth, headers=headers, data="", verify=False)
- 
-        if response.status_code == 200:
-            full_result = response.json()
-            if not full_result:
-                return "Mapping returned empty."
-            first_index = list(full_result.keys())[0]
-            mapping_result = {first_index: full_result[first_index]}
-            flattened = flatten_es_mapping(mapping_result)
-            with open(raw_mapping, 'w', encoding='utf-8') as f:
-                json.dump(mapping_result, f, indent=2, ensure_ascii=False)
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(flattened, f, indent=2, ensure_ascii=False)
-            return json.dumps(flattened, indent=2, ensure_ascii=False)
-        else:
-            return f"Request failed with status {response.status_code}: {response.text}"
+        output_path = mapping_path("flattened_mapping.json")
+        raw_mapping = mapping_path("raw_mapping.json")
+
+        entry = await mapping_cache.get(customer_name)
+        flattened = entry["flattened"]
+        version = (index_pattern(customer_name), entry["version"])
+        # the files only change when another customer / mapping version is selected
+        if _written_mapping_versions.get(output_path) != version or not os.path.exists(output_path):
+            atomic_write_json(raw_mapping, entry["raw"], default=None)
+            atomic_write_json(output_path, flattened, default=None)
+            _written_mapping_versions[output_path] = version
+        return json.dumps(flattened, indent=2, ensure_ascii=False)
+    except MappingCacheError as e:
+        return str(e)
     except Exception as e:
         return f"Failed to query OpenSearch: {e}"
  
@@ -135,23 +104,8 @@ Get_mapping_tool = FunctionTool(
 # CSV + Schema Utilities
 # =========================
 def load_csv_metadata(csv_path: str) -> pd.DataFrame:
-    """Load CSV using multiple encodings and clean 'Field' column."""
-    encodings = ['utf-8', 'windows-1252', 'latin-1']
-    for enc in encodings:
-        try:
-            df = pd.read_csv(csv_path, encoding=enc)
-            break
-        except UnicodeDecodeError:
-            continue
-    else:
-        import chardet
-        with open(csv_path, 'rb') as f:
-            result = chardet.detect(f.read())
-        df = pd.read_csv(csv_path, encoding=result['encoding'])
-    df = df.dropna(subset=['Field'])
-    df = df[df['Field'].astype(str).str.strip() != '']
-    df = df.fillna('')
-    return df
+    """Rows of the CSV with a 'Field' value (parsed once per file version, see field_catalog)."""
+    return get_field_catalog(csv_path).fields.copy()
  
 def load_flattened_mapping_file(schema_path: str) -> Dict[str, any]:
     """Load JSON file containing flattened mapping."""
@@ -162,17 +116,13 @@ def load_flattened_mapping_file(schema_path: str) -> Dict[str, any]:
         return {}
  
 def filter_csv_by_mapping(field_metadata: pd.DataFrame, schema_fields: set[str]) -> pd.DataFrame:
-    """Return only CSV rows where 'Field' matches mapping fields."""
+    """Return only CSV rows where 'Field' matches mapping fields (case-insensitive)."""
     if field_metadata is None or field_metadata.empty:
         return pd.DataFrame()
     if not schema_fields:
         return field_metadata
-    schema_lower_map = {f.lower(): f for f in schema_fields}
-    valid_rows = [
-        idx for idx, csv_field in field_metadata['Field'].items()
-        if csv_field in schema_fields or csv_field.lower() in schema_lower_map
-    ]
-    return field_metadata.loc[valid_rows].copy()
+    schema_lower = {f.lower() for f in schema_fields}
+    return field_metadata[field_metadata['Field'].astype(str).str.lower().isin(schema_lower)].copy()
  
 # =========================
 # Tool 2: Get Filtered CSV
@@ -181,51 +131,105 @@ async def get_filtered_csv() -> str:
     """
     Load CSV './all_fields.csv', load mapping from 'flattened_mapping.json',
     filter CSV fields based on mapping, return filtered records as JSON string.
+    The JSON is cached by the field catalog until the CSV or the mapping changes.
     """
     csv_path = os.path.join(mapping_dir,"all_field.csv")
-    schema_path = os.path.join(mapping_dir,"flattened_mapping.json")
-    field_metadata = load_csv_metadata(csv_path)
+    schema_path = mapping_path("flattened_mapping.json")
     schema_fields = set(load_flattened_mapping_file(schema_path).keys())
-    filtered_df = filter_csv_by_mapping(field_metadata, schema_fields)
-    return filtered_df.to_json(orient='records', force_ascii=False, indent=2)
+    return get_field_catalog(csv_path, schema_fields).records_json()
  
 Get_csv_tool = FunctionTool(
     get_filtered_csv,
     description="Loads a CSV from 'all_fields.csv', filters it by fields in 'flattened_mapping.json', and returns JSON string."
 )
 
+# a response is only cached when its header says every shard answered in time
+_HEAD_BYTES = 1024
+
+def _is_complete(head: bytes) -> bool:
+    return (re.search(rb'"timed_out"\s*:\s*false', head) is not None
+            and re.search(rb'"failed"\s*:\s*0\b', head) is not None)
+
 async def Opendistro_search(
     index_name: str,
     query_str: str,
-    filename: str = "result.json"
+    filename: str = "result.json",
+    use_cache: bool = True,
+    paginate: Annotated[bool, "True to fetch every term of the top-level terms grouping page by page "
+                              "(composite aggregation, complete and ordered by key). Ignored for top-N terms "
+                              "(a small size or an order other than _key)."] = False,
+    time_slices: Annotated[int, "Split a long @timestamp range into this many concurrent requests (2-8), "
+                                "0 for one request. DSLs that cannot be merged exactly run as one request."] = 0
 ) -> str:
     try:
-        output_path = os.path.join(result_dir, filename)
+        output_path = result_path(filename)     # the session / job namespace when one is active
         
-        index_name = f"{index_name.lower()}-*"        
-        es_url = "https://jumphost.hkt-ems.com:443"
-        auth = HTTPBasicAuth("internship", "P@ssw0rd")
-        headers = {"Content-Type": "application/json"}
+        index = index_pattern(index_name)
+        # paginate: terms groupings are fetched completely via composite pages (see composite_paging.py)
+        plan = rewrite_to_composite(query_str) if paginate else None
+        cache_key = result_cache.make_key(index + ("#composite" if plan else ""), query_str)
+        if use_cache and result_cache.copy_to(cache_key, output_path):
+            return (f"Query result saved to {output_path}")
+
+        # time_slices: long @timestamp ranges run as concurrent sub-range requests (see time_slice.py)
+        slice_plan = plan_time_slices(query_str, time_slices) if time_slices > 1 and plan is None else None
+        if slice_plan is not None:
+            result = await run_sliced(slice_plan, lambda body: _search_json(index, body))
+            part_path = output_path + ".part"
+            with open(part_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(part_path, output_path)
+            if use_cache and not result["timed_out"] and not result["_shards"]["failed"]:
+                result_cache.put_file(cache_key, output_path, await _cache_ttl(index_name, query_str))
+            return (f"Query result saved to {output_path} ({len(slice_plan.slices)} time slices)")
+
+        if plan is not None:
+            result = await composite_search(index, plan)
+            part_path = output_path + ".part"
+            with open(part_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(part_path, output_path)
+            if use_cache and plan.complete:
+                result_cache.put_file(cache_key, output_path, await _cache_ttl(index_name, query_str))
+            return (f"Query result saved to {output_path} ({plan.pages} composite pages)")
 
-        search_url = f"{es_url}/{index_name}/_search"
-        response = requests.get(
-            search_url,
-            auth=auth,
-            headers=headers,
-            data=query_str,
-            verify=False
-        )
+        # body is streamed to disk as received: no parse, no pretty-printed copy
+        part_path = output_path + ".part"
+        head = b""
+        async with es_stream("GET", f"/{index}/_search", body=query_str, timeout=SEARCH_TIMEOUT) as response:
+            if response.status_code != 200:
+                text = (await response.aread()).decode("utf-8", errors="replace")
+                return (f"Request failed with status {response.status_code}: {text}")
+            with open(part_path, "wb") as f:
+                async for chunk in response.aiter_bytes():
+                    if len(head) < _HEAD_BYTES:
+                        head += chunk[:_HEAD_BYTES - len(head)]
+                    f.write(chunk)
+        os.replace(part_path, output_path)
 
-        if response.status_code == 200:
-            results = response.json()
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
-            output = (f"Query result saved to {output_path}")
-            return output
-        else:
-            return (f"Request failed with status {response.status_code}: {response.text}")
+        if use_cache and _is_complete(head):
+            result_cache.put_file(cache_key, output_path, await _cache_ttl(index_name, query_str))
+        output = (f"Query result saved to {output_path}")
+        return output
     except Exception as e:
-        return (f"Failed to query OpenSearch via requests: {e}")
+        return (f"Failed to query OpenSearch: {e}")
+async def _search_json(index: str, body: dict) -> dict:
+    response = await es_request("GET", f"/{index}/_search", body=body, timeout=SEARCH_TIMEOUT)
+    if response.status_code != 200:
+        raise RuntimeError(f"Request failed with status {response.status_code}: {response.text}")
+    return response.json()
+
+
+async def _cache_ttl(index_name: str, query_str: str) -> int:
+    """TTL of a result, with the date fields of the customer mapping when it can be had."""
+    try:
+        flattened = (await mapping_cache.get(index_name))["flattened"]
+        date_fields = {field for field, field_type in flattened.items() if field_type in ("date", "date_nanos")}
+    except Exception:
+        date_fields = None
+    return ttl_for(query_str, date_fields)
+
+
 Opendistro_search_tool = FunctionTool(Opendistro_search, description="A tool that retrieves and stores JSON data from OpenSearch.")
 
 
@@ -237,11 +241,24 @@ Get_time_tool = FunctionTool(get_current_time_utc8, description="A tool that ret
 from typing import Tuple
 # ---------- ③ write Excel ---------------------------------------------------
 def agg_json_to_excel(json_path: str | Path,
-                    excel_path: str | Path | None = None) -> Tuple[str, pd.DataFrame]:
+                    excel_path: str | Path | None = None,
+                    flattener: str = "stream",
+                    fmt: Optional[str] = None) -> Tuple[str, pd.DataFrame]:
+    """
+    flattener: "stream" (agg_stream, incremental parse), "columnar" (agg_columns)
+    or "rows" (agg_json_to_rows, the reference implementation).
+    fmt: "xlsx" / "csv" / "parquet", chosen by row count when None (see report_writer.py);
+    the suffix of excel_path follows the format.
+    """
     excel_path = excel_path or Path(json_path).with_suffix(".xlsx")
-    df = agg_json_to_rows(json_path)
-    df.to_excel(excel_path, index=False)
-    return str(excel_path), df
+    if flattener == "columnar":
+        df = agg_json_to_table(json_path)
+    elif flattener == "rows":
+        df = agg_json_to_rows(json_path)
+    else:
+        df = stream_agg_file(json_path, DataFrameSink())
+    report_path, _ = write_report(df, excel_path, fmt)
+    return report_path, df
 # ---------- ① recursion to flatten ------------------------------------------
 def _walk_agg(node: Dict, path: Dict, rows: List[Dict]):
     for agg_name, agg_val in node.items():
@@ -272,6 +289,7 @@ def _walk_agg(node: Dict, path: Dict, rows: List[Dict]):
             new_path[f"{agg_name}_value"] = agg_val["value"]
             rows.append(new_path)
 # ---------- ② entrance of documents ---------------------------------------------------
+# reference flattener: agg_stream and agg_columns must produce the same DataFrame
 def agg_json_to_rows(json_path: str | Path) -> pd.DataFrame:
     """
     读取包含 aggregations 的 JSON 文件 → DataFrame